@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -23,13 +25,34 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = "django-insecure-4ze3_b@8zmr9yhz_4y#sh3$12bu7-(1+99hy3(_q-)jy5rvdqy"
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# On for `runserver`; gunicorn.conf.py defaults DJANGO_DEBUG to 0
+DEBUG = os.environ.get("DJANGO_DEBUG", "1") == "1"
 
-ALLOWED_HOSTS = []
+# comma separated, e.g. DJANGO_ALLOWED_HOSTS=api.example.com,localhost
+ALLOWED_HOSTS = [
+    host for host in os.environ.get("DJANGO_ALLOWED_HOSTS", "").split(",")
+    if host
+]
 
 
 # Application definition
 
+# `full` workers serve everything, `api` workers only the token
+# authenticated API, without the admin and the browser apps / middleware it
+# needs (faster boot, smaller workers)
+APP_PROFILE = os.environ.get("APP_PROFILE", "full")
+if APP_PROFILE not in ("full", "api"):
+    raise ImproperlyConfigured(
+        f"APP_PROFILE must be full or api, not {APP_PROFILE}"
+    )
+
+WEB_APPS = [
+    "django.contrib.admin",
+    "django.contrib.sessions",
+    "django.contrib.messages",
+    "django.contrib.staticfiles",
+]
+
 INSTALLED_APPS = [
     "django.contrib.admin",
     "django.contrib.auth",
@@ -43,16 +66,30 @@ INSTALLED_APPS = [
     "rest_framework.authtoken"
 ]
 
+# requests under these paths skip the browser-only middleware
+# (`core.middleware`)
+API_PATH_PREFIXES = ("/api/",)
+
 MIDDLEWARE = [
+    # first, so its total covers every other middleware
+    "core.instrumentation.instrumentation_middleware",
     "django.middleware.security.SecurityMiddleware",
-    "django.contrib.sessions.middleware.SessionMiddleware",
+    "core.routers.replica_routing_middleware",
+    "core.middleware.WebSessionMiddleware",
     "django.middleware.common.CommonMiddleware",
-    "django.middleware.csrf.CsrfViewMiddleware",
-    "django.contrib.auth.middleware.AuthenticationMiddleware",
-    "django.contrib.messages.middleware.MessageMiddleware",
-    "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "core.middleware.WebCsrfViewMiddleware",
+    "core.middleware.WebAuthenticationMiddleware",
+    "core.middleware.WebMessageMiddleware",
+    "core.middleware.WebXFrameOptionsMiddleware",
 ]
 
+if APP_PROFILE == "api":
+    INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in WEB_APPS]
+    MIDDLEWARE = [
+        middleware for middleware in MIDDLEWARE
+        if not middleware.startswith("core.middleware.Web")
+    ]
+
 ROOT_URLCONF = "app.urls"
 
 TEMPLATES = [
@@ -73,20 +110,191 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "app.wsgi.application"
 
+# Serve create/token/me with the native async views in `user/async_views.py`.
+# Only useful under an ASGI server (`app.asgi.application`).
+USER_API_ASYNC = os.environ.get("USER_API_ASYNC", "") == "1"
+
 
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.mysql",
+        # MySQL backend with a per-process connection pool, see
+        # core/backends/mysql_pool/base.py; set DB_POOL=0 to disable
+        "ENGINE": (
+            "core.backends.mysql_pool"
+            if os.environ.get("DB_POOL", "1") == "1"
+            else "django.db.backends.mysql"
+        ),
         "NAME": os.environ.get("MYSQL_DATABASE"),
         "USER": os.environ.get("MYSQL_USER"),
         "PASSWORD": os.environ.get("MYSQL_ROOT_PASSWORD"),
         "HOST": os.environ.get(
             "MYSQL_HOST"
         ),  # Or an IP Address that your DB is hosted on
+        # connections go back to the pool at the end of every request
+        "CONN_MAX_AGE": 0,
+        "POOL": {
+            "MIN_SIZE": int(os.environ.get("DB_POOL_MIN_SIZE", 2)),
+            "MAX_SIZE": int(os.environ.get("DB_POOL_MAX_SIZE", 10)),
+            "TIMEOUT": float(os.environ.get("DB_POOL_TIMEOUT", 5)),
+            "MAX_LIFETIME": float(
+                os.environ.get("DB_POOL_MAX_LIFETIME", 3600)
+            ),
+            "CHECK_IDLE": float(os.environ.get("DB_POOL_CHECK_IDLE", 1)),
+        },
+    }
+}
+
+# read replicas, comma separated hosts sharing the primary's credentials
+# e.g. MYSQL_REPLICA_HOSTS=db-replica1,db-replica2, see core/routers.py
+for index, host in enumerate(
+    filter(None, os.environ.get("MYSQL_REPLICA_HOSTS", "").split(","))
+):
+    DATABASES[f"replica{index + 1}"] = {
+        **DATABASES["default"],
+        "HOST": host.strip(),
+        "TEST": {"MIRROR": "default"},
     }
+
+# hash-sharded users, see core/sharding.py: USER_SHARDS=3 adds the
+# databases shard0 .. shard2, `<MYSQL_DATABASE>_shard<i>` on the primary's
+# server, or SQLite files in USER_SHARDS_SQLITE_DIR (local development and
+# tests, e.g. USER_SHARDS_SQLITE_DIR=/tmp/user-shards)
+USER_SHARDS = int(os.environ.get("USER_SHARDS", 0))
+for index in range(USER_SHARDS):
+    if os.environ.get("USER_SHARDS_SQLITE_DIR"):
+        DATABASES[f"shard{index}"] = {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.path.join(
+                os.environ["USER_SHARDS_SQLITE_DIR"], f"shard{index}.sqlite3"
+            ),
+        }
+    else:
+        DATABASES[f"shard{index}"] = {
+            **DATABASES["default"],
+            "NAME": f"{DATABASES['default']['NAME']}_shard{index}",
+        }
+
+SHARDING = {
+    "SHARDS": [f"shard{index}" for index in range(USER_SHARDS)],
+    "BUCKETS": 1024,
+    "MAP_REFRESH_INTERVAL": int(
+        os.environ.get("USER_SHARDS_MAP_REFRESH_INTERVAL", 30)
+    ),
+}
+
+DATABASE_ROUTERS = ["core.sharding.ShardRouter", "core.routers.ReplicaRouter"]
+
+REPLICA_ROUTING = {
+    "REPLICAS": [alias for alias in DATABASES if alias.startswith("replica")],
+    "PATH_PREFIXES": ["/api/user/"],
+    "STICKY_SECONDS": float(os.environ.get("REPLICA_STICKY_SECONDS", 5)),
+    "MAX_LAG": float(os.environ.get("REPLICA_MAX_LAG", 2)),
+    "LAG_CHECK_INTERVAL": 5,
+    "CACHE": "replica_sticky",
+}
+
+
+# `user_responses` caches rendered `/me` responses, see user/cache.py;
+# share it between workers with memcached / redis (e.g.
+# USER_RESPONSE_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache,
+# USER_RESPONSE_CACHE_LOCATION=redis://cache:6379). A FileBasedCache
+# directory works too, but it lists the whole directory on every set once
+# full, so it keeps only USER_RESPONSE_CACHE_MAX_ENTRIES (default 1000).
+# `permissions` holds each user's permission sets, see core/permissions.py;
+# it must be shared by every worker (the FileBasedCache default is shared
+# per host, use memcached / redis with several hosts): invalidation only
+# reaches the cache, a process-local one would keep revoked permissions
+# until TIMEOUT
+_user_response_backend = os.environ.get(
+    "USER_RESPONSE_CACHE_BACKEND",
+    "django.core.cache.backends.locmem.LocMemCache",
+)
+# memcached / redis evict on their own, their OPTIONS go to the client
+_user_response_options = {}
+if _user_response_backend.endswith(("LocMemCache", "FileBasedCache")):
+    _user_response_options["MAX_ENTRIES"] = int(os.environ.get(
+        "USER_RESPONSE_CACHE_MAX_ENTRIES",
+        1000 if _user_response_backend.endswith("FileBasedCache") else 100000,
+    ))
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "user_responses": {
+        "BACKEND": _user_response_backend,
+        "LOCATION": os.environ.get(
+            "USER_RESPONSE_CACHE_LOCATION", "user-responses"
+        ),
+        "TIMEOUT": int(os.environ.get("USER_RESPONSE_CACHE_TIMEOUT", 300)),
+        "OPTIONS": _user_response_options,
+    },
+    "permissions": {
+        "BACKEND": os.environ.get(
+            "PERMISSIONS_CACHE_BACKEND",
+            "django.core.cache.backends.filebased.FileBasedCache",
+        ),
+        "LOCATION": os.environ.get(
+            "PERMISSIONS_CACHE_LOCATION", "/tmp/app-permissions"
+        ),
+        "TIMEOUT": int(os.environ.get("PERMISSIONS_CACHE_TIMEOUT", 300)),
+    },
+    # the last change of each user, checked by every token cache hit (see
+    # user/authentication.py); shared like `permissions`
+    "token_auth": {
+        "BACKEND": os.environ.get(
+            "TOKEN_AUTH_CACHE_BACKEND",
+            "django.core.cache.backends.filebased.FileBasedCache",
+        ),
+        "LOCATION": os.environ.get(
+            "TOKEN_AUTH_CACHE_LOCATION", "/tmp/app-token-auth"
+        ),
+    },
+    # clients reading from the primary after a write, see core/routers.py;
+    # shared like `permissions`, memcached / redis at high write rates
+    "replica_sticky": {
+        "BACKEND": os.environ.get(
+            "REPLICA_STICKY_CACHE_BACKEND",
+            "django.core.cache.backends.filebased.FileBasedCache",
+        ),
+        "LOCATION": os.environ.get(
+            "REPLICA_STICKY_CACHE_LOCATION", "/tmp/app-replica-sticky"
+        ),
+    },
+}
+
+
+# per-route request metrics, see core/instrumentation.py; every worker
+# process writes into METRICS_DIR and /metrics serves their sum to staff,
+# to METRICS_ALLOWED_IPS (the scraper; a proxy in front must not forward
+# /metrics, REMOTE_ADDR would be its own) and to
+# `Authorization: Bearer $METRICS_TOKEN`. METRICS_SERVER_TIMING=1 sends the
+# `Server-Timing` header outside DEBUG too
+METRICS = {
+    "DIR": os.environ.get("METRICS_DIR", "/tmp/app-metrics"),
+    "FLUSH_INTERVAL": float(os.environ.get("METRICS_FLUSH_INTERVAL", 1)),
+    "ALLOWED_IPS": [
+        ip for ip in os.environ.get(
+            "METRICS_ALLOWED_IPS", "127.0.0.1,::1"
+        ).split(",") if ip
+    ],
+    "TOKEN": os.environ.get("METRICS_TOKEN", ""),
+    "SERVER_TIMING": bool(int(os.environ.get("METRICS_SERVER_TIMING", 0))),
+}
+
+
+# write-behind `User.last_seen` (core/activity.py), opt in with
+# USER_ACTIVITY_TRACKING=1. Every worker spools into ACTIVITY_DIR; one of
+# them writes the merged batch every FLUSH_INTERVAL seconds (0 = only with
+# `manage.py flush_activity`)
+ACTIVITY_TRACKING = {
+    "ENABLED": os.environ.get("USER_ACTIVITY_TRACKING", "") == "1",
+    "DIR": os.environ.get("ACTIVITY_DIR", "/tmp/app-activity"),
+    "FLUSH_INTERVAL": float(os.environ.get("ACTIVITY_FLUSH_INTERVAL", 60)),
+    "BATCH_SIZE": int(os.environ.get("ACTIVITY_BATCH_SIZE", 1000)),
 }
 
 
@@ -126,6 +334,10 @@ USE_TZ = True
 
 STATIC_URL = "static/"
 
+# where `manage.py collectstatic` puts the admin's CSS / JS for gunicorn
+# (`core.views.static`); runserver serves them from the apps with DEBUG
+STATIC_ROOT = os.environ.get("DJANGO_STATIC_ROOT", "/tmp/app-static")
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
@@ -139,3 +351,102 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # we are passing our custom user model here.
 # https://docs.djangoproject.com/en/4.2/topics/auth/customizing/
 AUTH_USER_MODEL = "core.user"
+
+# `ModelBackend` with permission sets cached per user (core/permissions.py)
+AUTHENTICATION_BACKENDS = ["core.permissions.CachedModelBackend"]
+
+
+# In-process token -> user cache used by
+# `user.authentication.CachedTokenAuthentication`; every hit is checked
+# against the user's last change in CACHES["token_auth"]. CLOCK_SKEW
+# (seconds): the largest clock difference between the hosts sharing it
+TOKEN_AUTH_CACHE = {
+    "MAX_SIZE": int(os.environ.get("TOKEN_AUTH_CACHE_SIZE", 10000)),
+    "TTL": int(os.environ.get("TOKEN_AUTH_CACHE_TTL", 60)),
+    "CLOCK_SKEW": float(os.environ.get("TOKEN_AUTH_CLOCK_SKEW", 0)),
+}
+
+
+# Signed access / refresh tokens (`user/tokens.py`), opt in with
+# USER_SIGNED_TOKENS=1. TTLs in seconds; REVOCATION_REFRESH_INTERVAL bounds
+# how long another worker process may accept a revoked token
+SIGNED_TOKENS = {
+    "ENABLED": os.environ.get("USER_SIGNED_TOKENS", "") == "1",
+    "SIGNING_KEY": os.environ.get("SIGNED_TOKENS_KEY", ""),
+    "ACCESS_TTL": int(os.environ.get("SIGNED_TOKENS_ACCESS_TTL", 900)),
+    "REFRESH_TTL": int(os.environ.get("SIGNED_TOKENS_REFRESH_TTL", 1209600)),
+    "REVOCATION_REFRESH_INTERVAL": float(
+        os.environ.get("SIGNED_TOKENS_REVOCATION_REFRESH", 30)
+    ),
+}
+
+
+# In-memory filter of taken emails behind `/api/user/email-taken/`
+# (`user/emails.py`); rebuilt from the user table every REFRESH_INTERVAL
+# seconds
+EMAIL_FILTER = {
+    "REFRESH_INTERVAL": float(
+        os.environ.get("EMAIL_FILTER_REFRESH_INTERVAL", 300)
+    ),
+    "CHUNK_SIZE": int(os.environ.get("EMAIL_FILTER_CHUNK_SIZE", 10000)),
+}
+
+
+# Password hashing runs on a process pool of WORKERS processes per web
+# process (see `core/hashing.py`); 0 hashes inline on the request thread,
+# and batches on a pool of BATCH_WORKERS processes (0: one per CPU).
+# MAX_PENDING is per web process too.
+PASSWORD_HASHING = {
+    "WORKERS": int(os.environ.get("PASSWORD_HASHING_WORKERS", 0)),
+    "BATCH_WORKERS": int(
+        os.environ.get("PASSWORD_HASHING_BATCH_WORKERS", 0)
+    ),
+    "MAX_PENDING": int(os.environ.get("PASSWORD_HASHING_MAX_PENDING", 16)),
+    "QUEUE_TIMEOUT": float(os.environ.get("PASSWORD_HASHING_TIMEOUT", 5)),
+}
+
+
+# orjson renderer / parser (core/renderers.py, core/parsers.py); set
+# API_FAST_JSON=0 for DRF's own JSON classes
+API_FAST_JSON = os.environ.get("API_FAST_JSON", "1") == "1"
+
+REST_FRAMEWORK = {
+    "EXCEPTION_HANDLER": "user.exceptions.exception_handler",
+    "DEFAULT_RENDERER_CLASSES": [
+        "core.renderers.ORJSONRenderer"
+        if API_FAST_JSON
+        else "rest_framework.renderers.JSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "core.parsers.ORJSONParser"
+        if API_FAST_JSON
+        else "rest_framework.parsers.JSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
+    # unauthenticated endpoints (`/api/user/email-taken/`), per client IP;
+    # counted in the `default` cache, i.e. per worker with `LocMemCache`
+    "DEFAULT_THROTTLE_RATES": {
+        "anon": os.environ.get("API_ANON_THROTTLE_RATE", "60/minute"),
+    },
+}
+
+# GET /api/user/me/ through the precompiled `user_read_serializer`; set
+# USER_API_FAST_READ=0 to serialize with `UserSerializer`
+USER_API_FAST_READ = os.environ.get("USER_API_FAST_READ", "1") == "1"
+
+
+# `/api/user/bulk-create/` limits. Every row with a password costs a hash,
+# so unless MAX_ROWS is set a request holds at most the rows the batch pool
+# hashes in HASH_SECONDS, half of GUNICORN_TIMEOUT by default (see
+# `hashing.batch_capacity`). Larger imports go through `manage.py
+# import_users`
+USER_BULK_CREATE = {
+    "MAX_ROWS": int(os.environ.get("USER_BULK_CREATE_MAX_ROWS", 0)),
+    "HASH_SECONDS": float(os.environ.get(
+        "USER_BULK_CREATE_HASH_SECONDS",
+        int(os.environ.get("GUNICORN_TIMEOUT", 30)) / 2,
+    )),
+    "BATCH_SIZE": int(os.environ.get("USER_BULK_CREATE_BATCH_SIZE", 1000)),
+}
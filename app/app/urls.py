@@ -13,11 +13,33 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
-from django.urls import path, include
+import re
+
+from django.apps import apps
+from django.conf import settings
+from django.urls import path, include, re_path
+
+from core import views as core_views
 
 
 urlpatterns = [
-    path("admin/", admin.site.urls),
-    path("api/user/", include("user.urls")),
+    path("metrics", core_views.metrics, name="metrics"),
+    path("ready", core_views.ready, name="ready"),
+    path(
+        "api/user/",
+        include("user.async_urls" if settings.USER_API_ASYNC else "user.urls"),
+    ),
 ]
+
+# not installed on `APP_PROFILE=api` workers
+if apps.is_installed("django.contrib.admin"):
+    from django.contrib import admin
+
+    urlpatterns += [
+        path("admin/", admin.site.urls),
+        re_path(
+            rf"^{re.escape(settings.STATIC_URL.lstrip('/'))}(?P<path>.*)$",
+            core_views.static,
+            name="static",
+        ),
+    ]
@@ -0,0 +1,212 @@
+"""
+Write-behind tracking of `User.last_seen`
+
+Writing a timestamp on every authenticated request would add an UPDATE to
+every read. Instead (`ACTIVITY_TRACKING["ENABLED"]`):
+
+1. `record(user_id)` only notes the time in this process's memory (a dict,
+   so repeated requests of one user coalesce)
+2. every `FLUSH_INTERVAL` seconds a background thread moves the buffer into
+   a spool file in the shared `DIR`, then takes an exclusive `flock` on the
+   directory; the one process that gets it merges every worker's spool
+   files and writes them with batched UPDATEs
+3. the batches set one truncated timestamp on up to `BATCH_SIZE` ids
+   (`UPDATE ... WHERE id IN (...) AND last_seen < ...`), so each user is
+   written at most once per interval whatever the number of workers
+
+A worker spools its buffer when it exits, and under gunicorn writes every
+spool left (`worker_exit` in `gunicorn.conf.py`); elsewhere run
+`manage.py flush_activity` at shutdown to write what is left.
+
+TODO - refer
+https://docs.python.org/3/library/fcntl.html#fcntl.flock
+https://docs.djangoproject.com/en/4.1/ref/models/querysets/#update
+"""
+
+import atexit
+import datetime
+import fcntl
+import glob
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections, models, router
+
+from core import sharding
+
+logger = logging.getLogger(__name__)
+
+LOCK_FILE = ".flush.lock"
+
+
+class ActivityTracker:
+    """Buffer of user id -> last seen time, spooled to `directory` and
+    flushed to the database"""
+
+    def __init__(self, directory: str, interval: float,
+                 batch_size: int = 1000):
+        self.directory = directory
+        self.interval = interval
+        self.batch_size = batch_size
+        self._seen = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def touch(self, user_id, now=None):
+        # under the lock `spool` swaps the buffer with: a time written to
+        # the old buffer after the swap would be lost
+        with self._lock:
+            self._seen[user_id] = int(now or time.time())
+        if self._thread is None and self.interval > 0:
+            self.start()
+
+    def start(self):
+        """flush every `interval` seconds from a daemon thread"""
+
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="activity-flush", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("last seen flush failed")
+            finally:
+                # the connections of this thread only
+                connections.close_all()
+
+    def spool(self):
+        """move the buffer into a new spool file; returns its path"""
+
+        with self._lock:
+            seen, self._seen = self._seen, {}
+        if not seen:
+            return None
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(
+            self.directory, f"{os.getpid()}-{time.time_ns()}.json"
+        )
+        # written under a temporary name so a flush never reads half a file
+        with open(f"{path}.tmp", "w") as spool_file:
+            json.dump(seen, spool_file)
+        os.replace(f"{path}.tmp", path)
+        return path
+
+    def flush(self, using=None, block=False):
+        """spool the buffer, then write every spooled entry unless another
+        process is already flushing (with `block`, once it is done);
+        returns the number of rows updated"""
+
+        self.spool()
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, LOCK_FILE), "a") as lock:
+            try:
+                fcntl.flock(
+                    lock, fcntl.LOCK_EX if block else
+                    fcntl.LOCK_EX | fcntl.LOCK_NB
+                )
+            except BlockingIOError:
+                return 0
+            try:
+                paths = sorted(
+                    glob.glob(os.path.join(self.directory, "*.json"))
+                )
+                seen = {}
+                for path in paths:
+                    with open(path) as spool_file:
+                        for user_id, when in json.load(spool_file).items():
+                            user_id = int(user_id)
+                            seen[user_id] = max(seen.get(user_id, 0), when)
+
+                updated = self.write(seen, using)
+                # only once written: a failed flush is retried with them
+                for path in paths:
+                    os.remove(path)
+                return updated
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def write(self, seen, using=None):
+        """batched UPDATEs of `last_seen` for `seen` (user id -> unix time),
+        never moving a timestamp backwards"""
+
+        user_model = get_user_model()
+        default_alias = router.db_for_write(user_model)
+        resolution = max(int(self.interval), 1)
+
+        # with sharded users, one set of UPDATEs per shard
+        by_time = {}
+        for user_id, when in seen.items():
+            alias = using or sharding.shard_for(
+                sharding.bucket_for_id(user_id)
+            ) or default_alias
+            by_time.setdefault(
+                (alias, when - when % resolution), []
+            ).append(user_id)
+
+        updated = 0
+        for (alias, when), user_ids in sorted(by_time.items()):
+            last_seen = datetime.datetime.fromtimestamp(
+                when, tz=datetime.timezone.utc
+            )
+            for start in range(0, len(user_ids), self.batch_size):
+                updated += user_model._base_manager.using(alias).filter(
+                    models.Q(last_seen__isnull=True)
+                    | models.Q(last_seen__lt=last_seen),
+                    pk__in=user_ids[start:start + self.batch_size],
+                ).update(last_seen=last_seen)
+        return updated
+
+
+def get_settings():
+    return getattr(settings, "ACTIVITY_TRACKING", {})
+
+
+_trackers = {}
+_trackers_lock = threading.Lock()
+
+
+def get_tracker() -> ActivityTracker:
+    """Return this process's tracker configured from
+    `settings.ACTIVITY_TRACKING`"""
+
+    pid = os.getpid()
+    tracker = _trackers.get(pid)
+    if tracker is None:
+        with _trackers_lock:
+            tracker = _trackers.get(pid)
+            if tracker is None:
+                config = get_settings()
+                tracker = ActivityTracker(
+                    config.get("DIR", os.path.join(
+                        tempfile.gettempdir(), "app-activity"
+                    )),
+                    config.get("FLUSH_INTERVAL", 60),
+                    config.get("BATCH_SIZE", 1000),
+                )
+                atexit.register(tracker.spool)
+                # a forked child starts with a buffer (and thread) of its
+                # own
+                _trackers.clear()
+                _trackers[pid] = tracker
+    return tracker
+
+
+def record(user_id):
+    """note that `user_id` was just seen; no-op unless enabled"""
+
+    if get_settings().get("ENABLED", False):
+        get_tracker().touch(user_id)
@@ -10,6 +10,15 @@ from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 #  Required for translation
 from django.utils.translation import gettext_lazy as _
 
+from core.pagination import (
+    AFTER_VAR,
+    BEFORE_VAR,
+    KeysetChangeList,
+    KeysetPaginator,
+    keyset_position,
+)
+from core.search import search_users
+
 # TODO
 # refer
 # https://docs.djangoproject.com/en/4.2/ref/contrib/admin/actions/#adding-actions-to-the-modeladmin
@@ -26,6 +35,14 @@ class UserAdmin(BaseUserAdmin):
     ordering = ["id"]
     list_display = ["email", "name"]
 
+    # estimated counts and `?after=<id>` keyset pages instead of
+    # `COUNT(*)` + `OFFSET` (see `core/pagination.py`)
+    paginator = KeysetPaginator
+    show_full_result_count = False
+
+    # searched with indexed query shapes, see `get_search_results`
+    search_fields = ["email", "name"]
+
     # TODO - reference
     fieldsets = (
         (None, {"fields": ("email", "password")}),
@@ -40,9 +57,9 @@ class UserAdmin(BaseUserAdmin):
                 )
             },
         ),
-        (_("Important dates"), {"fields": ("last_login",)}),
+        (_("Important dates"), {"fields": ("last_login", "last_seen")}),
     )
-    readonly_fields = ["last_login"]
+    readonly_fields = ["last_login", "last_seen"]
     add_fieldsets = (
         (
             None,
@@ -61,5 +78,25 @@ class UserAdmin(BaseUserAdmin):
         ),
     )
 
+    def get_search_results(self, request, queryset, search_term):
+        """email prefix / FULLTEXT name search instead of `LIKE '%x%'` on
+        every search field (see `core/search.py`)"""
+
+        return search_users(queryset, search_term), False
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_paginator(self, request, queryset, per_page, orphans=0,
+                      allow_empty_first_page=True):
+        return self.paginator(
+            queryset,
+            per_page,
+            orphans,
+            allow_empty_first_page,
+            after=keyset_position(request, AFTER_VAR),
+            before=keyset_position(request, BEFORE_VAR),
+        )
+
 
 admin.site.register(get_user_model(), UserAdmin)
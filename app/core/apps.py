@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "core"
+
+    def ready(self):
+        """time SQL statements of every connection and register the
+        permission cache signal handlers"""
+
+        from django.db.backends.signals import connection_created
+
+        from . import permissions  # noqa
+        from .instrumentation import install_sql_wrapper
+
+        connection_created.connect(install_sql_wrapper)
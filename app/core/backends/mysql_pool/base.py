@@ -0,0 +1,124 @@
+"""
+MySQL database backend with a connection pool
+
+Django's MySQL backend opens a new connection for every request (with
+`CONN_MAX_AGE = 0`) or keeps one open per thread (with `CONN_MAX_AGE > 0`).
+This backend keeps a per-process pool instead (`pool.ConnectionPool`): when
+Django closes a connection at the end of a request it goes back to the pool,
+and the next request, on any thread, checks it out again. That works the
+same under WSGI worker threads and under ASGI, where sync ORM calls run on
+executor threads.
+
+    DATABASES = {
+        "default": {
+            "ENGINE": "core.backends.mysql_pool",
+            ...
+            "CONN_MAX_AGE": 0,
+            "POOL": {
+                "MIN_SIZE": 2,
+                "MAX_SIZE": 10,
+                "TIMEOUT": 5,          # seconds to wait for a connection
+                "MAX_LIFETIME": 3600,  # seconds before it is recycled
+                "CHECK_IDLE": 1,       # ping connections idle this long
+            },
+        }
+    }
+
+`pool_metrics()` reports every pool of the current process; `/metrics`
+serves it as `app_db_pool_*` (see `core.instrumentation`).
+
+TODO - refer
+https://docs.djangoproject.com/en/4.2/ref/databases/#connection-management
+https://docs.djangoproject.com/en/4.2/ref/databases/#subclassing-the-built-in-database-backends
+"""
+
+import os
+import threading
+
+from django.db.backends.mysql import base as mysql
+from django.db.backends.mysql.base import Database
+
+from core.instrumentation import register_collector
+
+from .pool import ConnectionPool, PoolTimeout
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, settings_dict, connect):
+    """Return the pool of `alias` in this process, creating it on first use.
+
+    A forked child gets pools of its own; the parent's sockets are left to
+    the parent.
+    """
+
+    key = (os.getpid(), alias)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                config = settings_dict.get("POOL", {})
+                pool = ConnectionPool(
+                    connect,
+                    min_size=config.get("MIN_SIZE", 0),
+                    max_size=config.get("MAX_SIZE", 10),
+                    timeout=config.get("TIMEOUT", 5),
+                    max_lifetime=config.get("MAX_LIFETIME", 3600),
+                    check_idle=config.get("CHECK_IDLE", 1),
+                )
+                _pools[key] = pool
+    return pool
+
+
+def pool_metrics() -> dict:
+    """metrics of this process's pools, by alias"""
+
+    pid = os.getpid()
+    return {
+        alias: pool.metrics()
+        for (pool_pid, alias), pool in list(_pools.items())
+        if pool_pid == pid
+    }
+
+
+register_collector("db_pool", pool_metrics, label="alias")
+
+
+class DatabaseWrapper(mysql.DatabaseWrapper):
+    """MySQL backend that checks connections out of a pool"""
+
+    connection_reused = False
+
+    @property
+    def pool(self):
+        return get_pool(self.alias, self.settings_dict,
+                        self.open_connection)
+
+    def open_connection(self):
+        return super().get_new_connection(self.get_connection_params())
+
+    def get_new_connection(self, conn_params):
+        try:
+            connection, self.connection_reused = self.pool.getconn()
+        except PoolTimeout as exc:
+            # mapped to django.db.utils.OperationalError by the caller
+            raise Database.OperationalError(str(exc)) from exc
+        return connection
+
+    def init_connection_state(self):
+        # session settings survive in the pool, run them once per connection
+        if not self.connection_reused:
+            super().init_connection_state()
+
+    def _close(self):
+        if self.connection is None:
+            return
+        # a connection in an unknown transaction state is not reused
+        discard = (
+            self.in_atomic_block
+            or not self.autocommit
+            or self.errors_occurred
+        )
+        self.pool.putconn(self.connection, discard=discard)
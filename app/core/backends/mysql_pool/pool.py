@@ -0,0 +1,237 @@
+"""
+Thread-safe pool of DB-API connections
+
+Used by the `mysql_pool` backend but independent of Django and MySQL: the
+pool only needs a `connect()` callable returning a new connection.
+
+- at most `max_size` connections are open; a checkout beyond that waits up
+  to `timeout` seconds for one to be returned, then raises `PoolTimeout`
+- the first checkout opens `min_size` connections
+- a connection idle for `check_idle` seconds or more is pinged before it is
+  handed out, a dead one is replaced
+- connections older than `max_lifetime` seconds are closed instead of being
+  reused, so they are recycled well before the server's `wait_timeout`
+- `metrics()` reports pool size, checkouts and checkout wait times
+
+TODO - refer
+https://peps.python.org/pep-0249/
+https://dev.mysql.com/doc/refman/8.0/en/server-system-variables.html#sysvar_wait_timeout
+"""
+
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection is returned to the pool within the
+    timeout"""
+
+
+class _Entry:
+    __slots__ = ("connection", "created", "last_used")
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created = self.last_used = time.monotonic()
+
+
+def _ping(connection):
+    connection.ping()
+
+
+class ConnectionPool:
+    """Bounded, health-checked pool of connections created by `connect`"""
+
+    def __init__(self, connect, min_size=0, max_size=10, timeout=5.0,
+                 max_lifetime=3600.0, check_idle=1.0, ping=_ping):
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError("pool sizes must be 0 <= min_size <= max_size "
+                             "and max_size >= 1")
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.check_idle = check_idle
+        self.ping = ping
+
+        self._cond = threading.Condition()
+        # most recently returned connection last, it is the one reused first
+        self._idle = deque()
+        self._in_use = {}
+        self._size = 0
+        self._filled = False
+
+        self._checkouts = 0
+        self._created = 0
+        self._discarded = 0
+        self._timeouts = 0
+        self._waiting = 0
+        self._wait_seconds = 0.0
+        # recent checkout wait times, used for percentiles
+        self._waits = deque(maxlen=1024)
+
+    def getconn(self):
+        """Check a connection out of the pool.
+
+        Returns `(connection, reused)`; `reused` is false for a connection
+        opened by this call.
+        """
+
+        if not self._filled:
+            self.fill()
+
+        start = time.monotonic()
+        deadline = start + self.timeout
+        while True:
+            entry = self._reserve(deadline)
+            if entry is None:
+                entry = self._open()
+                reused = False
+            elif self._is_usable(entry):
+                reused = True
+            else:
+                self._discard(entry)
+                continue
+
+            waited = time.monotonic() - start
+            with self._cond:
+                self._in_use[id(entry.connection)] = entry
+                self._checkouts += 1
+                self._wait_seconds += waited
+                self._waits.append(waited)
+            return entry.connection, reused
+
+    def putconn(self, connection, discard=False):
+        """Return a checked out connection; `discard` closes it instead,
+        e.g. when it was left in a transaction"""
+
+        with self._cond:
+            entry = self._in_use.pop(id(connection))
+        if discard or self._is_expired(entry):
+            self._discard(entry)
+            return
+
+        entry.last_used = time.monotonic()
+        with self._cond:
+            self._idle.append(entry)
+            self._cond.notify()
+
+    def fill(self):
+        """open connections until `min_size` are open"""
+
+        self._filled = True
+        while True:
+            with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            entry = self._open()
+            with self._cond:
+                self._idle.appendleft(entry)
+                self._cond.notify()
+
+    def close(self):
+        """close every idle connection, checked out ones are closed when
+        they are returned"""
+
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self._filled = False
+        for entry in idle:
+            self._discard(entry)
+
+    def _reserve(self, deadline):
+        """take an idle entry, or `None` after reserving a slot for a new
+        connection"""
+
+        with self._cond:
+            self._waiting += 1
+            try:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(
+                            f"no connection available within "
+                            f"{self.timeout:g}s (max_size={self.max_size})"
+                        )
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+
+            if self._idle:
+                return self._idle.pop()
+            self._size += 1
+            return None
+
+    def _open(self):
+        """open a connection for an already reserved slot"""
+
+        try:
+            entry = _Entry(self.connect())
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._created += 1
+        return entry
+
+    def _is_expired(self, entry):
+        return time.monotonic() - entry.created >= self.max_lifetime
+
+    def _is_usable(self, entry):
+        if self._is_expired(entry):
+            return False
+        if time.monotonic() - entry.last_used < self.check_idle:
+            return True
+        try:
+            self.ping(entry.connection)
+        except Exception:
+            return False
+        return True
+
+    def _discard(self, entry):
+        try:
+            entry.connection.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._discarded += 1
+            self._cond.notify()
+
+    def metrics(self) -> dict:
+        """Snapshot of pool size and checkout wait times"""
+
+        with self._cond:
+            waits = sorted(self._waits)
+            checkouts = self._checkouts
+
+            def percentile(p):
+                if not waits:
+                    return 0.0
+                return waits[min(len(waits) - 1, int(len(waits) * p))]
+
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": len(self._in_use),
+                "waiting": self._waiting,
+                "checkouts": checkouts,
+                "created": self._created,
+                "discarded": self._discarded,
+                "timeouts": self._timeouts,
+                "wait_seconds_total": self._wait_seconds,
+                "wait_seconds_avg": (
+                    self._wait_seconds / checkouts if checkouts else 0.0
+                ),
+                "wait_seconds_p50": percentile(0.50),
+                "wait_seconds_p95": percentile(0.95),
+                "wait_seconds_p99": percentile(0.99),
+            }
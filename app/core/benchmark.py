@@ -0,0 +1,223 @@
+"""
+User API benchmark
+
+Drives the user API endpoints in-process through Django's test client, so
+it measures the whole Django / DRF stack against the configured database
+without a web server in front:
+
+- `create`    POST  /api/user/create/
+- `token`     POST  /api/user/token/
+- `me_get`    GET   /api/user/me/
+- `me_patch`  PATCH /api/user/me/
+
+`run_benchmark` returns, per scenario, latency percentiles, requests per
+second and database queries per request. `compare` checks such results
+against a stored baseline. The `benchmark_api` command wraps both.
+
+TODO - refer
+https://docs.djangoproject.com/en/4.2/topics/testing/tools/#the-test-client
+"""
+
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core import sharding
+
+SCENARIOS = ("create", "token", "me_get", "me_patch")
+PASSWORD = "benchmark@123"
+
+# latency / throughput metrics and the direction that is worse
+LOWER_IS_BETTER = ("p50_ms", "p95_ms", "p99_ms", "queries_per_request")
+HIGHER_IS_BETTER = ("rps",)
+
+
+def percentile(values, p):
+    """nearest-rank percentile of sorted `values`"""
+
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def default_host():
+    """a Host header the server accepts"""
+
+    for host in settings.ALLOWED_HOSTS:
+        if host != "*" and not host.startswith("."):
+            return host
+    # allowed by Django whenever DEBUG is on and ALLOWED_HOSTS is empty
+    return "localhost"
+
+
+def summarize(latencies, queries, errors, elapsed):
+    """metrics of one scenario; `latencies` in seconds"""
+
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        "requests": count,
+        "errors": errors,
+        "rps": count / elapsed if elapsed else 0.0,
+        "mean_ms": statistics.fmean(latencies) * 1000 if count else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "queries_per_request": sum(queries) / count if count else 0.0,
+    }
+
+
+class Benchmark:
+    """One benchmark run with its own users, removed by `cleanup`"""
+
+    def __init__(self, concurrency=4, host=None):
+        self.concurrency = concurrency
+        self.host = host or default_host()
+        self.prefix = f"bench-{uuid.uuid4().hex[:8]}"
+        self._counter = 0
+        self._counter_lock = threading.Lock()
+        self._local = threading.local()
+        self.clients = []
+
+    def next_number(self):
+        with self._counter_lock:
+            self._counter += 1
+            return self._counter
+
+    def next_email(self):
+        return f"{self.prefix}-{self.next_number()}@example.com"
+
+    def setup(self):
+        """create one user and token per worker for the token / me
+        scenarios"""
+
+        user_model = get_user_model()
+        for _ in range(self.concurrency):
+            user = user_model.objects.create_user(
+                email=self.next_email(), password=PASSWORD, name="bench"
+            )
+            token, _ = sharding.get_or_create_token(user)
+            self.clients.append((user.email, token.key))
+        self._free = list(self.clients)
+
+    def cleanup(self):
+        for alias in sharding.user_databases():
+            get_user_model().objects.db_manager(alias).filter(
+                email__startswith=f"{self.prefix}-"
+            ).delete()
+
+    def worker_state(self):
+        """this thread's test client and benchmark user"""
+
+        local = self._local
+        if not hasattr(local, "client"):
+            with self._counter_lock:
+                local.email, local.token = self._free.pop()
+            local.client = Client(HTTP_HOST=self.host)
+        return local
+
+    def request(self, scenario):
+        """send one request, returns `(ok, latency, queries)`"""
+
+        local = self.worker_state()
+        client = local.client
+        auth = {"HTTP_AUTHORIZATION": f"Token {local.token}"}
+
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as ctx:
+            start = time.perf_counter()
+            if scenario == "create":
+                res = client.post(reverse("create"), {
+                    "email": self.next_email(), "password": PASSWORD,
+                    "name": "bench",
+                })
+            elif scenario == "token":
+                res = client.post(reverse("token"), {
+                    "email": local.email, "password": PASSWORD,
+                })
+            elif scenario == "me_get":
+                res = client.get(reverse("me"), **auth)
+            else:
+                # a new name every time, an unchanged one is not written
+                res = client.patch(reverse("me"),
+                                   {"name": f"bench {self.next_number()}"},
+                                   content_type="application/json", **auth)
+            latency = time.perf_counter() - start
+        return res.status_code < 400, latency, len(ctx.captured_queries)
+
+    def run(self, scenario, requests):
+        """send `requests` requests of `scenario` over `concurrency`
+        threads"""
+
+        start = time.perf_counter()
+        if self.concurrency == 1:
+            samples = [self.request(scenario) for _ in range(requests)]
+        else:
+            with ThreadPoolExecutor(self.concurrency) as executor:
+                samples = list(
+                    executor.map(self.request, [scenario] * requests)
+                )
+        elapsed = time.perf_counter() - start
+        # worker threads are gone, make the next scenario hand users out
+        # again
+        self._free = list(self.clients)
+        self._local = threading.local()
+
+        return summarize(
+            [latency for ok, latency, _ in samples if ok],
+            [queries for ok, _, queries in samples if ok],
+            sum(1 for ok, _, _ in samples if not ok),
+            elapsed,
+        )
+
+
+def run_benchmark(scenarios=SCENARIOS, requests=200, concurrency=4,
+                  host=None):
+    """run `scenarios` and return their metrics by name"""
+
+    benchmark = Benchmark(concurrency=concurrency, host=host)
+    benchmark.setup()
+    try:
+        return {
+            scenario: benchmark.run(scenario, requests)
+            for scenario in scenarios
+        }
+    finally:
+        benchmark.cleanup()
+
+
+def compare(baseline, current, threshold=0.10):
+    """Regressions of `current` results against `baseline`.
+
+    Latency and throughput may move by `threshold` (a fraction) before they
+    count as a regression; queries per request are deterministic, any
+    increase is one.
+    """
+
+    regressions = []
+    for scenario, metrics in current.items():
+        base = baseline.get(scenario)
+        if base is None:
+            continue
+        for name in LOWER_IS_BETTER:
+            allowed = 0 if name == "queries_per_request" else threshold
+            if metrics[name] > base[name] * (1 + allowed) + 1e-9:
+                regressions.append(
+                    f"{scenario} {name}: {base[name]:.2f} -> "
+                    f"{metrics[name]:.2f}"
+                )
+        for name in HIGHER_IS_BETTER:
+            if metrics[name] < base[name] * (1 - threshold):
+                regressions.append(
+                    f"{scenario} {name}: {base[name]:.2f} -> "
+                    f"{metrics[name]:.2f}"
+                )
+    return regressions
@@ -0,0 +1,190 @@
+"""
+Bloom filter for compact "definitely not in the set" checks
+
+A fixed-size bit array plus `k` hash positions per item. `item in bloom` is
+never a false negative; it is a false positive with probability about
+`error_rate` while no more than `capacity` items were added, so a positive
+must be confirmed against the real data (usually the database) while a
+negative needs no further lookup.
+
+The `k` positions come from one blake2b digest split into two 64-bit halves
+(Kirsch-Mitzenmacher double hashing) instead of `k` separate hashes.
+
+`RefreshingBloomFilter` keeps such a filter of a database-backed set and
+rebuilds it periodically.
+
+TODO - refer
+https://en.wikipedia.org/wiki/Bloom_filter#Optimal_number_of_hash_functions
+https://www.eecs.harvard.edu/~michaelm/postscripts/rsa2008.pdf
+"""
+
+import hashlib
+import math
+import threading
+import time
+
+from django.db import connections
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter of str / bytes items"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(int(capacity), 1)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(
+            int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8
+        )
+        self.hash_count = max(round(self.size / capacity * math.log(2)), 1)
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    @classmethod
+    def from_items(cls, items, error_rate: float = 0.001, min_capacity=1024,
+                   count=None):
+        """a filter holding `items`, sized with room to grow to twice as
+        many
+
+        With the expected `count` of items, `items` is consumed as it is
+        iterated instead of being loaded into a list first.
+        """
+
+        if count is None:
+            items = list(items)
+            count = len(items)
+        bloom = cls(max(count * 2, min_capacity), error_rate)
+        for item in items:
+            bloom.add(item)
+        return bloom
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, item):
+        bits = self._bits
+        return all(
+            bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+    def add(self, item):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def _positions(self, item):
+        if isinstance(item, str):
+            item = item.encode()
+        digest = hashlib.blake2b(item, digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [
+            (first + i * second) % self.size for i in range(self.hash_count)
+        ]
+
+
+class RefreshingBloomFilter:
+    """Bloom filter of the items returned by `load()`, rebuilt when it is
+    older than `refresh_interval` seconds
+
+    Items `add`ed in between are visible immediately. Between rebuilds the
+    filter does not see items added elsewhere (another process), so callers
+    must accept that staleness for a negative answer.
+
+    The first build runs on the calling thread; later rebuilds run on a
+    background thread while the previous filter keeps answering. With
+    `count()` (the expected number of items) the filter is sized up front
+    and `load()` is streamed into it.
+    """
+
+    def __init__(self, load, refresh_interval: float,
+                 error_rate: float = 0.001, count=None):
+        self.load = load
+        self.count = count
+        self.refresh_interval = refresh_interval
+        self.error_rate = error_rate
+        self._bloom = None
+        self._built_at = 0.0
+        # `_lock` guards the filter swap and `add`, `_build_lock` is held
+        # for a whole build
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._rebuild = None
+        # items `add`ed while a build runs, or None
+        self._pending = None
+
+    def is_stale(self):
+        return (
+            self._bloom is None
+            or time.monotonic() - self._built_at > self.refresh_interval
+        )
+
+    def refresh(self, force=False):
+        """rebuild the filter from `load()` when it is stale"""
+
+        with self._build_lock:
+            if not force and not self.is_stale():
+                with self._lock:
+                    self._pending = None
+                return
+            with self._lock:
+                if self._pending is None:
+                    self._pending = []
+            try:
+                count = self.count() if self.count is not None else None
+                bloom = BloomFilter.from_items(
+                    self.load(), self.error_rate, count=count
+                )
+            except BaseException:
+                with self._lock:
+                    self._pending = None
+                raise
+            with self._lock:
+                # `load()` may have missed the items added meanwhile
+                for item in self._pending:
+                    bloom.add(item)
+                self._pending = None
+                self._bloom = bloom
+                self._built_at = time.monotonic()
+
+    def refresh_in_background(self):
+        """rebuild the filter on a daemon thread, unless one already is"""
+
+        with self._lock:
+            if self._rebuild is not None and self._rebuild.is_alive():
+                return
+            # from now on, not once the thread gets to run
+            self._pending = []
+            self._rebuild = threading.Thread(
+                target=self._run_rebuild, name="bloom-rebuild", daemon=True
+            )
+            self._rebuild.start()
+
+    def _run_rebuild(self):
+        try:
+            self.refresh()
+        finally:
+            # the thread's own database connections, opened by `load()`
+            connections.close_all()
+
+    def might_contain(self, item):
+        """False when `item` is certainly absent, as of the last rebuild;
+        does not rebuild (and is True before the first one)"""
+
+        bloom = self._bloom
+        return bloom is None or item in bloom
+
+    def __contains__(self, item):
+        if self._bloom is None:
+            self.refresh()
+        elif self.is_stale():
+            self.refresh_in_background()
+        return self.might_contain(item)
+
+    def add(self, item):
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(item)
+            if self._pending is not None:
+                self._pending.append(item)
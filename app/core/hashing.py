@@ -0,0 +1,394 @@
+"""
+Password hashing service
+
+PBKDF2 is deliberately slow. Running it on the request thread blocks a worker
+for the whole hash, so a burst of logins can starve cheap reads such as
+`/api/user/me/`. This module runs hashing on a shared process pool instead:
+
+- at most `MAX_PENDING` hashes may be queued or running at once
+- callers beyond that wait up to `QUEUE_TIMEOUT` seconds for a slot, then
+  get `HashingBusy` (surfaced as HTTP 503 by the user API)
+- `metrics()` reports queue depth and hash latency
+
+With `WORKERS = 0` (the default) hashes run inline on the calling thread,
+still subject to the same bound and metrics. That is the right choice for
+sync workers, which block on the hash either way, but not for batches
+(`/api/user/bulk-create/`, `import_users`): `make_passwords` then hashes on
+a separate batch pool of `BATCH_WORKERS` processes (default: one per CPU),
+started on the first batch. The pool and the
+`MAX_PENDING` bound are per web process, so the pool is sized for the host
+divided by the web workers (`gunicorn.conf.py` does so for ASGI workers),
+not for the host: `cpu_count` pool processes in each of N workers is N
+times too many. `metrics()` of every process is served by `/metrics`.
+
+TODO - refer
+https://docs.djangoproject.com/en/4.2/topics/auth/passwords/
+https://docs.python.org/3/library/concurrent.futures.html#processpoolexecutor
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+from core.instrumentation import register_collector, timed_function
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing queue is full for longer than the timeout"""
+
+
+def _timed(func, *args):
+    """run `func` in the worker and return its result with the hash time"""
+
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def _make_password(raw_password):
+    return hashers.make_password(raw_password)
+
+
+def _unusable_future():
+    """an already resolved future holding an unusable password hash"""
+
+    future = Future()
+    future.set_result(hashers.make_password(None))
+    return future
+
+
+def _check_password(raw_password, encoded):
+    """returns (is_correct, must_update)"""
+
+    updated = []
+    is_correct = hashers.check_password(
+        raw_password, encoded, setter=updated.append
+    )
+    return is_correct, bool(updated)
+
+
+class HashingService:
+    """Bounded password hashing queue backed by a process pool"""
+
+    def __init__(self, workers: int, max_pending: int, queue_timeout: float):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+
+        self._pending = 0
+        self._submitted = 0
+        self._rejected = 0
+        self._completed = 0
+        self._hash_seconds = 0.0
+        self._wait_seconds = 0.0
+        # recent hash durations, used for percentiles
+        self._latencies = deque(maxlen=1024)
+
+    def _get_executor(self):
+        """return the process pool, recreating it in a forked child or after
+        a worker crashed"""
+
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _reset_executor(self):
+        with self._lock:
+            self._executor = None
+
+    def _reject(self):
+        with self._lock:
+            self._rejected += 1
+        raise HashingBusy("password hashing queue is full")
+
+    def submit(self, func, *args) -> Future:
+        """Queue `func(*args)` for hashing; the future resolves to its
+        result"""
+
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self._reject()
+        return self._start(func, args)
+
+    async def asubmit(self, func, *args):
+        """Awaitable `submit`; neither waiting for a slot nor the hash itself
+        blocks the event loop"""
+
+        loop = asyncio.get_running_loop()
+        if self.workers <= 0:
+            # inline hashing: run it on a thread, not on the event loop
+            future = await loop.run_in_executor(None, self.submit, func, *args)
+            return future.result()
+
+        if not self._slots.acquire(blocking=False):
+            acquired = await loop.run_in_executor(
+                None, self._slots.acquire, True, self.queue_timeout
+            )
+            if not acquired:
+                self._reject()
+        return await asyncio.wrap_future(self._start(func, args))
+
+    def _start(self, func, args) -> Future:
+        """run `func(*args)` on the pool; the caller holds a slot"""
+
+        with self._lock:
+            self._pending += 1
+            self._submitted += 1
+
+        queued_at = time.perf_counter()
+        outer = Future()
+
+        def done(inner):
+            self._slots.release()
+            try:
+                result, hash_seconds = inner.result()
+            except BaseException as exc:
+                if isinstance(exc, BrokenProcessPool):
+                    self._reset_executor()
+                with self._lock:
+                    self._pending -= 1
+                outer.set_exception(exc)
+                return
+
+            total = time.perf_counter() - queued_at
+            with self._lock:
+                self._pending -= 1
+                self._completed += 1
+                self._hash_seconds += hash_seconds
+                self._wait_seconds += max(total - hash_seconds, 0.0)
+                self._latencies.append(hash_seconds)
+            outer.set_result(result)
+
+        if self.workers > 0:
+            try:
+                inner = self._get_executor().submit(_timed, func, *args)
+            except BrokenProcessPool:
+                self._reset_executor()
+                inner = self._get_executor().submit(_timed, func, *args)
+        else:
+            inner = Future()
+            try:
+                inner.set_result(_timed(func, *args))
+            except Exception as exc:
+                inner.set_exception(exc)
+
+        inner.add_done_callback(done)
+        return outer
+
+    def make_password(self, raw_password):
+        """Hash `raw_password` with the configured hasher"""
+
+        return self.submit(_make_password, raw_password).result()
+
+    async def amake_password(self, raw_password):
+        """Async version of `make_password`"""
+
+        return await self.asubmit(_make_password, raw_password)
+
+    def make_passwords(self, raw_passwords):
+        """Hash many passwords in parallel, returning hashes in input order.
+
+        At most one task per worker is queued from a single call, so a large
+        batch cannot take every slot away from interactive logins.
+        """
+
+        window = max(self.workers, 1)
+        hashes = []
+        in_flight = deque()
+        for raw_password in raw_passwords:
+            if raw_password is None:
+                in_flight.append(_unusable_future())
+            else:
+                if len(in_flight) >= window:
+                    hashes.append(in_flight.popleft().result())
+                in_flight.append(self.submit(_make_password, raw_password))
+        hashes.extend(future.result() for future in in_flight)
+        return hashes
+
+    def check_password(self, raw_password, encoded):
+        """Returns a `(is_correct, must_update)` tuple"""
+
+        if raw_password is None or not hashers.is_password_usable(encoded):
+            return False, False
+        return self.submit(_check_password, raw_password, encoded).result()
+
+    async def acheck_password(self, raw_password, encoded):
+        """Async version of `check_password`"""
+
+        if raw_password is None or not hashers.is_password_usable(encoded):
+            return False, False
+        return await self.asubmit(_check_password, raw_password, encoded)
+
+    def metrics(self) -> dict:
+        """Snapshot of queue depth and hash latency"""
+
+        with self._lock:
+            latencies = sorted(self._latencies)
+            completed = self._completed
+
+            def percentile(p):
+                if not latencies:
+                    return 0.0
+                return latencies[min(len(latencies) - 1,
+                                     int(len(latencies) * p))]
+
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "queue_depth": max(self._pending - max(self.workers, 1), 0),
+                "submitted": self._submitted,
+                "rejected": self._rejected,
+                "completed": completed,
+                "hash_seconds_total": self._hash_seconds,
+                "wait_seconds_total": self._wait_seconds,
+                "hash_seconds_avg": (
+                    self._hash_seconds / completed if completed else 0.0
+                ),
+                "hash_seconds_p50": percentile(0.50),
+                "hash_seconds_p95": percentile(0.95),
+                "hash_seconds_p99": percentile(0.99),
+            }
+
+
+_service = None
+_batch_service = None
+_service_lock = threading.Lock()
+
+
+def get_hashing_service() -> HashingService:
+    """Return the process-wide hashing service configured from
+    `settings.PASSWORD_HASHING`"""
+
+    global _service
+
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                config = getattr(settings, "PASSWORD_HASHING", {})
+                workers = config.get("WORKERS", 0)
+                _service = HashingService(
+                    workers=workers,
+                    max_pending=config.get("MAX_PENDING", max(workers, 1) * 4),
+                    queue_timeout=config.get("QUEUE_TIMEOUT", 5),
+                )
+    return _service
+
+
+def get_batch_hashing_service() -> HashingService:
+    """Return the service `make_passwords` hashes batches on: the pool set
+    up by `configure_batch`, else the hashing service when it has a pool,
+    else a batch pool of `PASSWORD_HASHING["BATCH_WORKERS"]` processes"""
+
+    if _batch_service is not None:
+        return _batch_service
+    service = get_hashing_service()
+    if service.workers > 0:
+        return service
+    if _batch_service is None:
+        config = getattr(settings, "PASSWORD_HASHING", {})
+        configure_batch(config.get("BATCH_WORKERS") or os.cpu_count() or 1)
+    return _batch_service
+
+
+def configure_batch(workers: int):
+    """(re)create the batch pool with `workers` processes, e.g. for a
+    command that owns the whole host"""
+
+    global _batch_service
+
+    with _service_lock:
+        _batch_service = HashingService(
+            workers=workers,
+            # one window per concurrent batch
+            max_pending=workers * 2,
+            queue_timeout=getattr(settings, "PASSWORD_HASHING", {}).get(
+                "QUEUE_TIMEOUT", 5
+            ),
+        )
+    return _batch_service
+
+
+_hash_seconds = None
+
+
+def hash_seconds() -> float:
+    """time of one password hash: the p95 measured by the batch service, or
+    one hash timed on the calling thread the first time"""
+
+    global _hash_seconds
+
+    measured = get_batch_hashing_service().metrics()["hash_seconds_p95"]
+    if measured:
+        return measured
+    if _hash_seconds is None:
+        _hash_seconds = _timed(_make_password, "password")[1]
+    return _hash_seconds
+
+
+def batch_capacity(seconds: float) -> int:
+    """how many passwords `make_passwords` hashes in `seconds`"""
+
+    workers = get_batch_hashing_service().workers
+    return max(int(seconds / hash_seconds()), 1) * workers
+
+
+register_collector(
+    "password_hashing", lambda: get_hashing_service().metrics()
+)
+register_collector(
+    "password_hashing_batch",
+    lambda: _batch_service.metrics() if _batch_service else {},
+)
+
+
+@timed_function("hash")
+def make_password(raw_password):
+    """Hash `raw_password` on the hashing service"""
+
+    return get_hashing_service().make_password(raw_password)
+
+
+@timed_function("hash")
+def make_passwords(raw_passwords):
+    """Hash many passwords in parallel on the batch service"""
+
+    return get_batch_hashing_service().make_passwords(raw_passwords)
+
+
+@timed_function("hash")
+def check_password(raw_password, encoded):
+    """Verify `raw_password` on the hashing service.
+
+    Returns a `(is_correct, must_update)` tuple; `must_update` is set when the
+    stored hash uses outdated hasher parameters.
+    """
+
+    return get_hashing_service().check_password(raw_password, encoded)
+
+
+@timed_function("hash")
+async def amake_password(raw_password):
+    """Async version of `make_password`"""
+
+    return await get_hashing_service().amake_password(raw_password)
+
+
+@timed_function("hash")
+async def acheck_password(raw_password, encoded):
+    """Async version of `check_password`"""
+
+    return await get_hashing_service().acheck_password(raw_password, encoded)
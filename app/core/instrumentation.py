@@ -0,0 +1,507 @@
+"""
+Per-request instrumentation
+
+`instrumentation_middleware` times every request and splits it into phases:
+
+- `sql`: statements run through any database connection, and their count
+  (a connection execute wrapper, installed as connections are created)
+- `hash`: password hashing (`core.hashing`)
+- `serializer`: DRF validation and representation (`TimedSerializerMixin`)
+- `total`: the whole request
+
+Phase times exclude nested phases, e.g. the hash and SQL time of a token
+request are not counted again as serializer time. With `DEBUG` or
+`METRICS["SERVER_TIMING"]` the breakdown is sent in a `Server-Timing`
+header (it tells clients how long hashing and queries take, so it is off
+in production by default):
+
+    Server-Timing: sql;dur=1.9;desc="3 queries", hash;dur=212.4,
+                   serializer;dur=0.6, total;dur=218.3
+
+Each process also keeps per-route (URL name) latency histograms and phase
+totals. A daemon thread writes them to `METRICS["DIR"]`, one file per
+process, every `FLUSH_INTERVAL` seconds (0: on every request), and
+`/metrics` serves the sum over all files in the Prometheus text format, so
+every worker process is included. When a worker exits, gunicorn's master
+folds its routes into `metrics-exited.json` (`retire_process`), so counters
+never go backwards and files do not pile up; the directory is emptied when
+the server (re)starts.
+
+`/metrics` is served to staff users, to `METRICS["ALLOWED_IPS"]` (loopback
+by default) and to `Authorization: Bearer <METRICS["TOKEN"]>`.
+
+Other per-process state (the password hashing queue, connection pools)
+joins the same files through `register_collector` and is served per
+process, with a `process` label.
+
+TODO - refer
+https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Server-Timing
+https://docs.djangoproject.com/en/4.2/topics/db/instrumentation/
+https://prometheus.io/docs/instrumenting/exposition_formats/
+"""
+
+import asyncio
+import contextvars
+import functools
+import glob
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+
+logger = logging.getLogger(__name__)
+
+PHASES = ("sql", "hash", "serializer")
+
+# request latency histogram buckets, seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    """Phase times of one request; mutable so that phases timed on a
+    `sync_to_async` thread are seen by the middleware"""
+
+    __slots__ = ("phases", "queries", "_children")
+
+    def __init__(self):
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.queries = 0
+        # time spent in nested phases, one entry per open phase
+        self._children = []
+
+    def server_timing(self, total):
+        entries = [
+            f'sql;dur={self.phases["sql"] * 1000:.1f};'
+            f'desc="{self.queries} queries"'
+        ]
+        entries += [
+            f"{phase};dur={self.phases[phase] * 1000:.1f}"
+            for phase in PHASES[1:]
+        ]
+        entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+
+@contextmanager
+def timed(phase):
+    """count the enclosed block as `phase` of the current request"""
+
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+
+    timings._children.append(0.0)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        nested = timings._children.pop()
+        timings.phases[phase] += elapsed - nested
+        if timings._children:
+            timings._children[-1] += elapsed
+
+
+def timed_function(phase):
+    """decorator form of `timed`, for sync and async functions"""
+
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with timed(phase):
+                    return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with timed(phase):
+                    return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def sql_execute_wrapper(execute, sql, params, many, context):
+    timings = _timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    timings.queries += 1
+    with timed("sql"):
+        return execute(sql, params, many, context)
+
+
+def install_sql_wrapper(sender, connection, **kwargs):
+    """`connection_created` receiver adding `sql_execute_wrapper` once per
+    connection"""
+
+    if sql_execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(sql_execute_wrapper)
+
+
+class TimedSerializerMixin:
+    """DRF serializer mixin counting validation and representation as the
+    `serializer` phase"""
+
+    def is_valid(self, *args, **kwargs):
+        with timed("serializer"):
+            return super().is_valid(*args, **kwargs)
+
+    def to_representation(self, instance):
+        with timed("serializer"):
+            return super().to_representation(instance)
+
+
+# name -> (collect, label), see `register_collector`
+_collectors = {}
+
+
+def register_collector(name, collect, label=None):
+    """serve the values returned by `collect()` in `/metrics`
+
+    `collect()` returns `{key: number}`, or with `label` one such dict per
+    label value. Each key is served as `app_<name>_<key>`.
+    """
+
+    _collectors[name] = (collect, label)
+
+
+def collect():
+    """the current values of every registered collector"""
+
+    collected = {}
+    for name, (func, label) in list(_collectors.items()):
+        try:
+            values = func()
+        except Exception:
+            # metrics must never break the request that flushes them
+            continue
+        collected[name] = {"label": label, "values": values}
+    return collected
+
+
+class MetricsStore:
+    """Per-route histograms of this process, shared through files in
+    `directory`"""
+
+    def __init__(self, directory, flush_interval=1.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.path = os.path.join(directory, f"metrics-{os.getpid()}.json")
+        self.routes = {}
+        self._lock = threading.Lock()
+        self._flushed_at = 0.0
+        self._thread = None
+
+    def start(self):
+        """flush every `flush_interval` seconds from a daemon thread"""
+
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="metrics-flush", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush(force=True)
+            except Exception:
+                logger.exception("metrics flush failed")
+
+    def observe(self, route, timings, total):
+        with self._lock:
+            stats = self.routes.get(route)
+            if stats is None:
+                stats = self.routes[route] = {
+                    "buckets": [0] * len(BUCKETS),
+                    "count": 0,
+                    "sum": 0.0,
+                    "queries": 0,
+                    "phases": dict.fromkeys(PHASES, 0.0),
+                }
+            for index, bound in enumerate(BUCKETS):
+                if total <= bound:
+                    stats["buckets"][index] += 1
+                    break
+            stats["count"] += 1
+            stats["sum"] += total
+            stats["queries"] += timings.queries
+            for phase, seconds in timings.phases.items():
+                stats["phases"][phase] += seconds
+        if self.flush_interval <= 0:
+            self.flush(force=True)
+        elif self._thread is None:
+            self.start()
+
+    def flush(self, force=False):
+        """write this process's metrics, at most every `flush_interval`
+        seconds unless forced"""
+
+        now = time.monotonic()
+        if not force and now - self._flushed_at < self.flush_interval:
+            return
+        with self._lock:
+            self._flushed_at = now
+            data = json.dumps({"routes": self.routes,
+                               "collectors": collect()})
+        os.makedirs(self.directory, exist_ok=True)
+        # write then rename, readers never see a partial file
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_path, self.path)
+
+    def read_processes(self):
+        """`(pid, metrics)` of every process file"""
+
+        self.flush(force=True)
+        for path in glob.glob(os.path.join(self.directory, "metrics-*.json")):
+            try:
+                with open(path) as process_file:
+                    metrics = json.load(process_file)
+            except (OSError, ValueError):
+                continue
+            pid = os.path.basename(path)[len("metrics-"):-len(".json")]
+            yield pid, metrics
+
+    def collected(self):
+        """the collector values of every process, by pid"""
+
+        return {
+            pid: metrics.get("collectors", {})
+            for pid, metrics in self.read_processes()
+        }
+
+    def aggregate(self):
+        """the metrics of every process, summed per route"""
+
+        routes = {}
+        for _, metrics in self.read_processes():
+            merge_routes(routes, metrics.get("routes", {}))
+        return routes
+
+
+def merge_routes(routes, other):
+    """add the route metrics `other` into `routes`"""
+
+    for route, stats in other.items():
+        total = routes.setdefault(route, {
+            "buckets": [0] * len(BUCKETS),
+            "count": 0,
+            "sum": 0.0,
+            "queries": 0,
+            "phases": dict.fromkeys(PHASES, 0.0),
+        })
+        total["buckets"] = [
+            a + b for a, b in zip(total["buckets"], stats["buckets"])
+        ]
+        for key in ("count", "sum", "queries"):
+            total[key] += stats[key]
+        for phase, seconds in stats["phases"].items():
+            total["phases"][phase] += seconds
+
+
+def write_json(path, data):
+    # write then rename, readers never see a partial file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as tmp_file:
+        json.dump(data, tmp_file)
+    os.replace(tmp_path, path)
+
+
+def retire_process(directory, pid):
+    """fold the route metrics of the exited process `pid` into
+    `metrics-exited.json` and remove its file; its collector values (queue
+    depth, pool size) died with it
+
+    Only one process (gunicorn's master) may call this.
+    """
+
+    path = os.path.join(directory, f"metrics-{pid}.json")
+    try:
+        with open(path) as process_file:
+            metrics = json.load(process_file)
+    except (OSError, ValueError):
+        metrics = {}
+    exited_path = os.path.join(directory, "metrics-exited.json")
+    try:
+        with open(exited_path) as exited_file:
+            exited = json.load(exited_file)
+    except (OSError, ValueError):
+        exited = {"routes": {}}
+    merge_routes(exited["routes"], metrics.get("routes", {}))
+    write_json(exited_path, exited)
+    for leftover in (path, f"{path}.tmp"):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+
+
+def render_prometheus(routes):
+    """Prometheus text exposition of aggregated route metrics"""
+
+    lines = [
+        "# HELP app_request_duration_seconds Request latency by route.",
+        "# TYPE app_request_duration_seconds histogram",
+    ]
+    for route, stats in sorted(routes.items()):
+        cumulative = 0
+        for bound, count in zip(BUCKETS, stats["buckets"]):
+            cumulative += count
+            lines.append(
+                f'app_request_duration_seconds_bucket{{route="{route}",'
+                f'le="{bound:g}"}} {cumulative}'
+            )
+        lines += [
+            f'app_request_duration_seconds_bucket{{route="{route}",'
+            f'le="+Inf"}} {stats["count"]}',
+            f'app_request_duration_seconds_sum{{route="{route}"}} '
+            f'{stats["sum"]:.6f}',
+            f'app_request_duration_seconds_count{{route="{route}"}} '
+            f'{stats["count"]}',
+        ]
+
+    lines += [
+        "# HELP app_request_phase_seconds_total Time spent per request "
+        "phase by route.",
+        "# TYPE app_request_phase_seconds_total counter",
+    ]
+    for route, stats in sorted(routes.items()):
+        for phase, seconds in stats["phases"].items():
+            lines.append(
+                f'app_request_phase_seconds_total{{route="{route}",'
+                f'phase="{phase}"}} {seconds:.6f}'
+            )
+
+    lines += [
+        "# HELP app_request_sql_queries_total SQL statements by route.",
+        "# TYPE app_request_sql_queries_total counter",
+    ]
+    for route, stats in sorted(routes.items()):
+        lines.append(
+            f'app_request_sql_queries_total{{route="{route}"}} '
+            f'{stats["queries"]}'
+        )
+    return "\n".join(lines) + "\n"
+
+
+def render_collected(collected):
+    """Prometheus text exposition of the collector values of every
+    process"""
+
+    series = {}
+    for pid, collectors in sorted(collected.items()):
+        for name, entry in sorted(collectors.items()):
+            label = entry["label"]
+            rows = (
+                entry["values"].items() if label
+                else [(None, entry["values"])]
+            )
+            for label_value, values in rows:
+                labels = f'process="{pid}"'
+                if label:
+                    labels += f',{label}="{label_value}"'
+                for key, value in values.items():
+                    if not isinstance(value, (int, float)):
+                        continue
+                    metric = f"app_{name}_{key}"
+                    series.setdefault(metric, []).append(
+                        f"{metric}{{{labels}}} {value:d}"
+                        if isinstance(value, int)
+                        else f"{metric}{{{labels}}} {value!r}"
+                    )
+
+    lines = []
+    for metric, samples in sorted(series.items()):
+        lines.append(f"# TYPE {metric} untyped")
+        lines += samples
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_metrics_store() -> MetricsStore:
+    """Return this process's metrics store configured from
+    `settings.METRICS`"""
+
+    pid = os.getpid()
+    store = _stores.get(pid)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(pid)
+            if store is None:
+                config = getattr(settings, "METRICS", {})
+                store = MetricsStore(
+                    config.get("DIR", os.path.join(
+                        tempfile.gettempdir(), "app-metrics"
+                    )),
+                    config.get("FLUSH_INTERVAL", 1.0),
+                )
+                # a forked child starts with metrics of its own
+                _stores.clear()
+                _stores[pid] = store
+    return store
+
+
+def route_name(request):
+    match = getattr(request, "resolver_match", None)
+    return (match.url_name if match else None) or "unmatched"
+
+
+def send_server_timing():
+    """whether responses carry the `Server-Timing` breakdown"""
+
+    return settings.DEBUG or getattr(settings, "METRICS", {}).get(
+        "SERVER_TIMING", False
+    )
+
+
+def finish(request, response, timings, start):
+    total = time.perf_counter() - start
+    if send_server_timing():
+        response["Server-Timing"] = timings.server_timing(total)
+    get_metrics_store().observe(route_name(request), timings, total)
+
+
+@sync_and_async_middleware
+def instrumentation_middleware(get_response):
+    """Time each request's phases into the per-route metrics (and
+    `Server-Timing`)"""
+
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            timings = RequestTimings()
+            token = _timings.set(timings)
+            start = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                _timings.reset(token)
+            # no file write here, the flush thread writes the metrics
+            finish(request, response, timings, start)
+            return response
+    else:
+        def middleware(request):
+            timings = RequestTimings()
+            token = _timings.set(timings)
+            start = time.perf_counter()
+            try:
+                response = get_response(request)
+            finally:
+                _timings.reset(token)
+            finish(request, response, timings, start)
+            return response
+
+    return middleware
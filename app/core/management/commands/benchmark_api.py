@@ -0,0 +1,90 @@
+"""
+Django command to benchmark the user API endpoints
+
+    python manage.py benchmark_api --requests 500 --concurrency 8 \
+        --output bench.json
+    python manage.py benchmark_api --compare bench.json --threshold 0.1
+
+Runs `core.benchmark` against the configured database and prints, per
+endpoint, p50/p95/p99 latency, requests per second and queries per request.
+With `--compare` the run is checked against a baseline saved by `--output`
+and the command exits non-zero when anything regressed.
+"""
+
+import json
+import platform
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.benchmark import SCENARIOS, compare, run_benchmark
+
+
+class Command(BaseCommand):
+    """Django command to benchmark the user API"""
+
+    help = "Benchmark create / token / me and compare against a baseline"
+
+    def add_arguments(self, parser):
+        parser.add_argument("scenarios", nargs="*", choices=SCENARIOS,
+                            default=list(SCENARIOS))
+        parser.add_argument("--requests", type=int, default=200,
+                            help="requests per scenario")
+        parser.add_argument("--concurrency", type=int, default=4)
+        parser.add_argument("--host",
+                            help="Host header (default: from ALLOWED_HOSTS)")
+        parser.add_argument("--output", help="save the results as JSON")
+        parser.add_argument("--compare", metavar="BASELINE",
+                            help="JSON results of a previous run")
+        parser.add_argument("--threshold", type=float, default=0.10,
+                            help="allowed latency / throughput change")
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+
+        if settings.DEBUG:
+            self.stderr.write("DEBUG is on, numbers include its overhead")
+
+        results = run_benchmark(
+            options["scenarios"], options["requests"],
+            options["concurrency"], options["host"],
+        )
+        for scenario, metrics in results.items():
+            self.stdout.write(
+                f"{scenario:9} rps={metrics['rps']:<8.1f} "
+                f"p50={metrics['p50_ms']:.2f}ms "
+                f"p95={metrics['p95_ms']:.2f}ms "
+                f"p99={metrics['p99_ms']:.2f}ms "
+                f"queries={metrics['queries_per_request']:.1f} "
+                f"errors={metrics['errors']}"
+            )
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump({
+                    "meta": {
+                        "created": datetime.now(timezone.utc).isoformat(),
+                        "requests": options["requests"],
+                        "concurrency": options["concurrency"],
+                        "database": connection.vendor,
+                        "django": django.get_version(),
+                        "python": platform.python_version(),
+                    },
+                    "results": results,
+                }, output, indent=2)
+            self.stdout.write(f"results saved to {options['output']}")
+
+        if options["compare"]:
+            with open(options["compare"]) as baseline:
+                regressions = compare(
+                    json.load(baseline)["results"], results,
+                    options["threshold"],
+                )
+            if regressions:
+                for regression in regressions:
+                    self.stderr.write(f"regression: {regression}")
+                raise CommandError(f"{len(regressions)} regression(s)")
+            self.stdout.write(self.style.SUCCESS("no regressions"))
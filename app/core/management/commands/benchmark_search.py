@@ -0,0 +1,95 @@
+"""
+Django command to benchmark the user search query shapes
+
+    python manage.py benchmark_search --seed 1000000
+    python manage.py benchmark_search --repeat 50 --explain
+
+`--seed N` first tops the user table up to N rows with synthetic users
+(`bench<i>@example.com`, unusable passwords) so the same run can be repeated
+at 1M and 10M rows. Each search term is then run `--repeat` times through
+`core.search.search_users` and timed.
+"""
+
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+
+from core.search import query_shape, search_users
+
+FIRST_NAMES = ["alice", "bob", "carol", "dave", "erin", "frank", "grace",
+               "heidi", "ivan", "judy", "mallory", "oscar", "peggy", "trent"]
+LAST_NAMES = ["smith", "jones", "taylor", "brown", "wilson", "evans",
+              "thomas", "roberts", "walker", "wright", "hall", "green"]
+
+DEFAULT_TERMS = [
+    "bench42@example.com",  # full email
+    "bench4242",            # email prefix or name
+    "bo",                   # too short for FULLTEXT
+    "alice smith",          # name words
+]
+
+
+class Command(BaseCommand):
+    """Django command to benchmark user search"""
+
+    help = "Time each user search query shape, optionally seeding users"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=0,
+                            help="top the user table up to this many rows")
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument("--explain", action="store_true",
+                            help="print the query plan of each term")
+        parser.add_argument("terms", nargs="*", default=DEFAULT_TERMS)
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+
+        user_model = get_user_model()
+        if options["seed"]:
+            self.seed(user_model, options["seed"])
+
+        self.stdout.write(f"{user_model.objects.count()} users")
+        for term in options["terms"]:
+            queryset = search_users(
+                user_model.objects.order_by("id"), term
+            )[:options["limit"]]
+
+            timings = []
+            for _ in range(options["repeat"]):
+                start = time.perf_counter()
+                rows = len(list(queryset.all()))
+                timings.append((time.perf_counter() - start) * 1000)
+
+            timings.sort()
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            self.stdout.write(
+                f"{term!r:28} {query_shape(term):22} rows={rows:<4} "
+                f"median={statistics.median(timings):.2f}ms "
+                f"p95={p95:.2f}ms"
+            )
+            if options["explain"]:
+                self.stdout.write(queryset.explain())
+
+    def seed(self, user_model, total, batch_size=10000):
+        existing = user_model.objects.count()
+        password = make_password(None)
+        for start in range(existing, total, batch_size):
+            user_model.objects.bulk_create(
+                [
+                    user_model(
+                        email=f"bench{i}@example.com",
+                        name=f"{random.choice(FIRST_NAMES)} "
+                             f"{random.choice(LAST_NAMES)}",
+                        password=password,
+                    )
+                    for i in range(start, min(start + batch_size, total))
+                ],
+                ignore_conflicts=True,
+            )
+            self.stdout.write(f"seeded {min(start + batch_size, total)} rows")
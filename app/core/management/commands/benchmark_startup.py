@@ -0,0 +1,76 @@
+"""
+Django command to benchmark worker startup per `APP_PROFILE`
+
+    python manage.py benchmark_startup
+    python manage.py benchmark_startup --repeat 20 --profile api
+
+Each run starts a fresh interpreter with the profile in its environment and
+times what a worker does before serving: `django.setup()` (settings, app
+registry, models), loading the middleware chain (`get_wsgi_application`)
+and the URLconf (importing every view). `total` is the wall time of the
+whole process, interpreter start included.
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+PROFILES = ["full", "api"]
+
+STARTUP = """
+import json, sys, time
+start = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+from django.urls import get_resolver
+get_wsgi_application()
+get_resolver().url_patterns
+print(json.dumps({
+    "setup": (time.perf_counter() - start) * 1000,
+    "modules": len(sys.modules),
+}))
+"""
+
+
+class Command(BaseCommand):
+    """Django command to benchmark worker startup"""
+
+    help = "Time a fresh worker's Django setup for each APP_PROFILE"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=10)
+        parser.add_argument("--profile", action="append", choices=PROFILES,
+                            help="profile to time (default: all)")
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+
+        for profile in options["profile"] or PROFILES:
+            runs = [self.run(profile) for _ in range(options["repeat"])]
+            setup = statistics.median(run["setup"] for run in runs)
+            total = statistics.median(run["total"] for run in runs)
+            self.stdout.write(
+                f"{profile:5} setup={setup:.1f}ms total={total:.1f}ms "
+                f"modules={runs[0]['modules']}"
+            )
+
+    def run(self, profile):
+        env = dict(
+            os.environ,
+            APP_PROFILE=profile,
+            DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE,
+        )
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP],
+            cwd=settings.BASE_DIR, env=env, check=True,
+            capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output)
+        result["total"] = (time.perf_counter() - start) * 1000
+        return result
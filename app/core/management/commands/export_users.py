@@ -0,0 +1,65 @@
+"""
+Django command to export all users as NDJSON or CSV
+
+    python manage.py export_users --output users.ndjson.gz --gzip
+    python manage.py export_users --format csv > users.csv
+
+Rows are streamed from a server-side cursor (see `core/export.py`), so the
+command's memory use does not grow with the table.
+"""
+
+import sys
+
+from django.core.management.base import BaseCommand
+
+from core.export import FORMATS, export_users
+
+
+class Command(BaseCommand):
+    """Django command to export users"""
+
+    help = "Stream every user to a file or stdout as NDJSON or CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=FORMATS, default="ndjson")
+        parser.add_argument(
+            "--output",
+            default="-",
+            help="file to write to (default: stdout)",
+        )
+        parser.add_argument(
+            "--gzip",
+            action="store_true",
+            help="gzip-compress the output as it is written",
+        )
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+
+        chunks = export_users(
+            file_format=options["format"],
+            compress=options["gzip"],
+            chunk_size=options["chunk_size"],
+            using=options["database"],
+        )
+
+        if options["output"] == "-":
+            self.write_chunks(chunks, sys.stdout.buffer)
+            return
+
+        with open(options["output"], "wb") as output:
+            written = self.write_chunks(chunks, output)
+        self.stdout.write(self.style.SUCCESS(
+            f"wrote {written} bytes to {options['output']}"
+        ))
+
+    @staticmethod
+    def write_chunks(chunks, output):
+        written = 0
+        for chunk in chunks:
+            output.write(chunk)
+            written += len(chunk)
+        output.flush()
+        return written
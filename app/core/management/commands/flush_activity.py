@@ -0,0 +1,31 @@
+"""
+Django command to write buffered user activity (`User.last_seen`)
+
+    python manage.py flush_activity
+
+Writes every spool file left in `ACTIVITY_TRACKING["DIR"]` by the worker
+processes (see `core/activity.py`). Run it at shutdown, once the workers
+have stopped, so no activity is lost; it is also safe to run while they
+are serving, e.g. from cron with a `FLUSH_INTERVAL` of 0.
+"""
+
+from django.core.management.base import BaseCommand
+
+from core.activity import get_tracker
+
+
+class Command(BaseCommand):
+    """Django command to flush user activity"""
+
+    help = "Write buffered user last-seen times to the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=None)
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+
+        updated = get_tracker().flush(
+            using=options["database"], block=True
+        )
+        self.stdout.write(f"updated last seen of {updated} users")
@@ -0,0 +1,215 @@
+"""
+Django command to import users from a JSONL or CSV file
+
+The file is streamed, never loaded whole. Each row is validated like a row
+of `/api/user/bulk-create/` (`ImportUserSerializer`; the password may be
+left out) and users are created through `UserManager.bulk_create_users`
+(normalized emails, hashed passwords, existing emails skipped) in large
+batches. Rows that are not valid JSON or fail validation are counted as
+invalid and skipped.
+
+Passwords are hashed on a pool of `--workers` processes (default: one per
+CPU, the command is expected to own the host).
+
+After each committed batch the byte offset reached is written to a checkpoint
+file, so re-running the same command after a crash resumes where it stopped.
+Rows of a batch that was in flight during the crash are imported again;
+their emails already exist by then, so they are skipped.
+
+    python manage.py import_users users.jsonl --batch-size 5000
+    python manage.py import_users users.csv --checkpoint /tmp/users.ckpt
+    python manage.py import_users users.jsonl --workers 16
+
+JSONL: one JSON object per line, e.g.
+    {"email": "user@example.com", "password": "secret", "name": "User"}
+CSV: a header row naming the same fields. Other fields are ignored.
+"""
+
+import csv
+import json
+import os
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from core import hashing
+from user.serializers import ImportUserSerializer
+
+
+class Command(BaseCommand):
+    """Django command to bulk import users"""
+
+    help = "Stream users from a JSONL or CSV file into the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="JSONL or CSV file to import")
+        parser.add_argument(
+            "--format",
+            choices=["jsonl", "csv"],
+            help="file format (default: from the file extension)",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--checkpoint",
+            help="checkpoint file (default: <path>.checkpoint)",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="password hashing processes (default: one per CPU)",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="ignore an existing checkpoint and import from the start",
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+
+        path = options["path"]
+        if not os.path.exists(path):
+            raise CommandError(f"{path} does not exist")
+
+        file_format = options["format"] or self.guess_format(path)
+        checkpoint_path = options["checkpoint"] or f"{path}.checkpoint"
+        state = {"offset": 0, "rows": 0, "created": 0,
+                 "existing": 0, "invalid": 0}
+        if not options["restart"]:
+            state.update(self.read_checkpoint(checkpoint_path))
+        if state["offset"]:
+            self.stdout.write(
+                f"resuming from checkpoint at row {state['rows']}..."
+            )
+
+        if options["workers"] < 1:
+            raise CommandError("--workers must be at least 1")
+        # `bulk_create_users` hashes each batch on this pool
+        hashing.configure_batch(options["workers"])
+
+        # fields are built once and reused for every row
+        serializer = ImportUserSerializer()
+        reader = {"jsonl": self.read_jsonl, "csv": self.read_csv}[file_format]
+        batch_size = options["batch_size"]
+
+        started = time.monotonic()
+        imported = 0
+        batch = []
+        with open(path, "rb") as stream:
+            for row, offset in reader(stream, state["offset"]):
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    self.import_batch(batch, serializer, state)
+                    imported += len(batch)
+                    batch = []
+                    state["offset"] = offset
+                    self.write_checkpoint(checkpoint_path, state)
+                    self.report(imported, started, state)
+
+            if batch:
+                self.import_batch(batch, serializer, state)
+                imported += len(batch)
+
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+        self.report(imported, started, state)
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {state['rows']} rows: {state['created']} created, "
+            f"{state['existing']} already existed, "
+            f"{state['invalid']} invalid"
+        ))
+
+    @staticmethod
+    def guess_format(path):
+        if path.endswith(".csv"):
+            return "csv"
+        if path.endswith((".jsonl", ".ndjson", ".json")):
+            return "jsonl"
+        raise CommandError("cannot tell the file format, pass --format")
+
+    @staticmethod
+    def read_checkpoint(checkpoint_path):
+        if not os.path.exists(checkpoint_path):
+            return {}
+        with open(checkpoint_path) as checkpoint:
+            return json.load(checkpoint)
+
+    @staticmethod
+    def write_checkpoint(checkpoint_path, state):
+        """write the checkpoint atomically so a crash never leaves it
+        half written"""
+
+        tmp_path = f"{checkpoint_path}.tmp"
+        with open(tmp_path, "w") as checkpoint:
+            json.dump(state, checkpoint)
+            checkpoint.flush()
+            os.fsync(checkpoint.fileno())
+        os.replace(tmp_path, checkpoint_path)
+
+    @staticmethod
+    def read_jsonl(stream, offset):
+        """yields (row, byte offset after the row) starting at `offset`"""
+
+        stream.seek(offset)
+        for line in stream:
+            offset += len(line)
+            if line.strip():
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    # counted as invalid, the import goes on
+                    row = None
+                yield row, offset
+
+    @staticmethod
+    def read_csv(stream, offset):
+        """yields (row, byte offset after the row) starting at `offset`
+
+        The header is always read from the top of the file.
+        """
+
+        header = next(csv.reader([stream.readline().decode("utf-8")]))
+        stream.seek(max(offset, stream.tell()))
+        position = {"offset": stream.tell()}
+
+        def lines():
+            for line in stream:
+                position["offset"] += len(line)
+                yield line.decode("utf-8")
+
+        for values in csv.reader(lines()):
+            if values:
+                yield dict(zip(header, values)), position["offset"]
+
+    def import_batch(self, rows, serializer, state):
+        """create one batch of users and update the counters in `state`"""
+
+        users = []
+        for row in rows:
+            try:
+                user = serializer.run_validation(row)
+            except ValidationError:
+                state["invalid"] += 1
+                continue
+            # an empty CSV cell means "no password", not an empty password
+            user["password"] = user.get("password") or None
+            users.append(user)
+
+        created = get_user_model().objects.bulk_create_users(
+            users, batch_size=len(users) or 1
+        )
+        created_count = sum(1 for user in created if user is not None)
+        state["rows"] += len(rows)
+        state["created"] += created_count
+        state["existing"] += len(users) - created_count
+
+    def report(self, imported, started, state):
+        elapsed = max(time.monotonic() - started, 1e-9)
+        self.stdout.write(
+            f"{state['rows']} rows processed, "
+            f"{imported / elapsed:.0f} rows/s"
+        )
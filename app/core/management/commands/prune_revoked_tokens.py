@@ -0,0 +1,24 @@
+"""
+Django command to delete revocations of expired signed tokens
+
+    python manage.py prune_revoked_tokens
+
+An expired token is rejected anyway, so its `RevokedToken` row only makes
+the table (and every process's revocation Bloom filter) bigger. Run it
+periodically, e.g. from cron.
+"""
+
+from django.core.management.base import BaseCommand
+
+from user.tokens import prune
+
+
+class Command(BaseCommand):
+    """Django command to prune revoked tokens"""
+
+    help = "Delete revoked signed tokens that have expired"
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+
+        self.stdout.write(f"deleted {prune()} expired revocations")
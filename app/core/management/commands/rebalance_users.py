@@ -0,0 +1,82 @@
+"""
+Django command to move users between shards
+
+    python manage.py rebalance_users --bucket 17 --bucket 18 --to shard3
+    python manage.py rebalance_users --source default
+    python manage.py rebalance_users --dry-run
+
+With `--bucket`, the buckets are first assigned to the `--to` shard. The
+command then waits `MAP_REFRESH_INTERVAL` seconds, so that every process
+creates and looks up those users on the new shard, and moves every user
+of `--source` (default: all shards) that is not on its owning shard, with
+its tokens and group / permission memberships (see
+`core.sharding.move_users`).
+
+Users of a moved bucket are unavailable from the assignment until they are
+copied. `--source default` moves the users created before sharding was
+turned on; their ids and API tokens change (clients log in again).
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import sharding
+
+
+class Command(BaseCommand):
+    """Django command to rebalance sharded users"""
+
+    help = "Move users to the shard owning their bucket"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bucket", type=int, action="append",
+                            default=[], help="bucket to assign to --to")
+        parser.add_argument("--to", help="shard the buckets move to")
+        parser.add_argument("--source", action="append",
+                            help="database to move users from "
+                                 "(default: every shard)")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--dry-run", action="store_true",
+                            help="only count the users to move")
+        parser.add_argument("--no-wait", action="store_true",
+                            help="do not wait for processes to reload the "
+                                 "shard map")
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+
+        config = sharding.get_config()
+        if not sharding.enabled():
+            raise CommandError("users are not sharded (SHARDING['SHARDS'])")
+        if options["bucket"] and options["to"] not in config["SHARDS"]:
+            raise CommandError(f"--to must be one of {config['SHARDS']}")
+        for bucket in options["bucket"]:
+            if not 0 <= bucket < config["BUCKETS"]:
+                raise CommandError(f"no bucket {bucket}")
+
+        moves = dict.fromkeys(options["bucket"], options["to"])
+        if moves and not options["dry_run"]:
+            for bucket in moves:
+                sharding.assign_bucket(bucket, options["to"])
+            self.stdout.write(
+                f"assigned {len(moves)} bucket(s) to {options['to']}"
+            )
+            if not options["no_wait"]:
+                self.stdout.write(
+                    f"waiting {config['MAP_REFRESH_INTERVAL']}s for every "
+                    "process to reload the shard map"
+                )
+                time.sleep(config["MAP_REFRESH_INTERVAL"])
+
+        for source in options["source"] or config["SHARDS"]:
+            moved = 0
+            for target, user_ids in sharding.misplaced_users(
+                source, options["batch_size"], moves
+            ):
+                if options["dry_run"]:
+                    moved += len(user_ids)
+                else:
+                    moved += sharding.move_users(user_ids, source, target)
+            verb = "would move" if options["dry_run"] else "moved"
+            self.stdout.write(f"{source}: {verb} {moved} users")
@@ -1,30 +1,110 @@
 """
 Django command to wait for database to be available
 
+    python manage.py wait_for_db --timeout 60 --warm-up
+
+Every alias in `DATABASES` (or the ones given with `--database`) is checked
+in its own thread. A failed check is retried after a jittered exponential
+backoff (`--initial-delay` doubling up to `--max-delay`), so a database that
+is almost ready is picked up within milliseconds while one that is still
+starting is not hammered. When `--timeout` seconds pass before every alias
+is up the command fails with a non-zero exit code.
+
+`--warm-up` then opens each connection and runs the hot user / token
+queries once (`core.warmup`).
+
 TODO
 Refer - how to add custom django-admin command?
 https://docs.djangoproject.com/en/4.2/howto/custom-management-commands/
+https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
 """
 
+import random
 import time
+from concurrent.futures import ThreadPoolExecutor
 from MySQLdb import Error
+from django.conf import settings
+from django.db import connections
 from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+
+from core.warmup import warm_up
 
 
 class Command(BaseCommand):
     """Django command to wait for database"""
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument("--database", action="append", dest="databases",
+                            help="alias to wait for, repeatable "
+                                 "(default: every alias)")
+        parser.add_argument("--timeout", type=float, default=60,
+                            help="seconds to wait in total, 0 for no limit")
+        parser.add_argument("--initial-delay", type=float, default=0.05)
+        parser.add_argument("--max-delay", type=float, default=2)
+        parser.add_argument("--warm-up", action="store_true",
+                            help="open connections and run hot queries")
+
+    def handle(self, *args, **options):
         """Entrypoint for command"""
 
+        aliases = options["databases"] or list(settings.DATABASES)
+        timeout = options["timeout"]
+        deadline = time.monotonic() + timeout if timeout else None
+
         self.stdout.write("waiting for database....")
-        db_up = False
-        while db_up is False:
-            try:
-                self.check(databases=["default"])
-                db_up = True
-            except (Error, OperationalError):
-                self.stdout.write("Database unavailable, waiting for 1 second...")
-                time.sleep(1)
+        with ThreadPoolExecutor(max_workers=len(aliases)) as executor:
+            results = executor.map(
+                lambda alias: self.wait_for(
+                    alias, deadline,
+                    options["initial_delay"], options["max_delay"],
+                ),
+                aliases,
+            )
+            down = [alias for alias, up in zip(aliases, results) if not up]
+        if down:
+            raise CommandError(
+                f"Database unavailable after {timeout:g}s: {', '.join(down)}"
+            )
         self.stdout.write(self.style.SUCCESS("Database available!"))
+
+        if options["warm_up"]:
+            for alias in aliases:
+                count = warm_up(alias)
+                self.stdout.write(f"{alias}: ran {count} warm-up queries")
+
+    def wait_for(self, alias, deadline, initial_delay, max_delay):
+        """poll `alias` until it is up, `False` if `deadline` passes first"""
+
+        attempt = 0
+        try:
+            while True:
+                try:
+                    self.check(databases=[alias])
+                    return True
+                except (Error, OperationalError):
+                    pass
+
+                delay = self.backoff(attempt, initial_delay, max_delay)
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    delay = min(delay, remaining)
+                self.stdout.write(
+                    f"Database {alias} unavailable, "
+                    f"waiting for {delay:.3f} seconds..."
+                )
+                time.sleep(delay)
+                attempt += 1
+        finally:
+            # connections are per thread, don't leak this thread's
+            connections.close_all()
+
+    @staticmethod
+    def backoff(attempt, initial_delay, max_delay):
+        """exponential backoff with jitter: a random delay between half and
+        all of `initial_delay * 2 ** attempt`, capped at `max_delay`"""
+
+        delay = min(max_delay, initial_delay * 2 ** attempt)
+        return random.uniform(delay / 2, delay)
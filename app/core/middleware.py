@@ -0,0 +1,61 @@
+"""
+Browser-only middleware bypassed for API requests
+
+Sessions, CSRF, session authentication, messages and `X-Frame-Options`
+only matter to the admin and other browser pages. The user API is token
+authenticated, so for requests under `settings.API_PATH_PREFIXES` these
+subclasses hand the request straight to the next layer, skipping their
+work (a session cookie lookup, CSRF token handling, ...).
+
+They subclass the Django classes, so the admin's checks for "session /
+auth / messages middleware installed" still pass. Workers started with
+`APP_PROFILE=api` leave them out altogether (see `app/settings.py`).
+
+TODO - refer
+https://docs.djangoproject.com/en/4.1/topics/http/middleware/#asynchronous-support
+"""
+
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.messages.middleware import MessageMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.middleware.clickjacking import XFrameOptionsMiddleware
+from django.middleware.csrf import CsrfViewMiddleware
+
+
+def is_api_request(request):
+    return request.path_info.startswith(settings.API_PATH_PREFIXES)
+
+
+class WebOnlyMixin:
+    """Skip the middleware for API requests, sync or async"""
+
+    def __call__(self, request):
+        if is_api_request(request):
+            # a coroutine when the handler runs async, awaited by the caller
+            return self.get_response(request)
+        return super().__call__(request)
+
+
+class WebSessionMiddleware(WebOnlyMixin, SessionMiddleware):
+    pass
+
+
+class WebCsrfViewMiddleware(WebOnlyMixin, CsrfViewMiddleware):
+    def process_view(self, request, callback, callback_args, callback_kwargs):
+        if is_api_request(request):
+            return None
+        return super().process_view(request, callback, callback_args,
+                                    callback_kwargs)
+
+
+class WebAuthenticationMiddleware(WebOnlyMixin, AuthenticationMiddleware):
+    pass
+
+
+class WebMessageMiddleware(WebOnlyMixin, MessageMiddleware):
+    pass
+
+
+class WebXFrameOptionsMiddleware(WebOnlyMixin, XFrameOptionsMiddleware):
+    pass
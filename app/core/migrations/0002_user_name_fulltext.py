@@ -0,0 +1,37 @@
+"""
+FULLTEXT index on `core_user.name` for `core.search.search_users`
+
+Email search needs no new index: prefix searches (`LIKE 'bob@exa%'`) and
+exact matches are answered by the existing unique index on `email`.
+
+FULLTEXT is MySQL specific, so the index is only created on MySQL; other
+databases use the `LIKE` fallback of the `fulltext` lookup.
+"""
+
+from django.db import migrations
+
+INDEX_NAME = "core_user_name_fulltext"
+
+
+def add_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "mysql":
+        return
+    schema_editor.execute(
+        f"ALTER TABLE core_user ADD FULLTEXT INDEX {INDEX_NAME} (name)"
+    )
+
+
+def remove_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "mysql":
+        return
+    schema_editor.execute(f"ALTER TABLE core_user DROP INDEX {INDEX_NAME}")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(add_fulltext_index, remove_fulltext_index),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.1.5 on 2026-10-18 10:53
+
+"""
+Unique functional index on `LOWER(email)` for case-insensitive email
+identity (`UserManager.get_by_natural_key`)
+
+On MySQL this needs 8.0.13+ (functional key parts). It fails if the table
+already holds emails that differ only in letter case; merge those first.
+"""
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0004_revokedtoken"),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="user",
+            constraint=models.UniqueConstraint(
+                django.db.models.functions.text.Lower("email"),
+                name="core_user_email_lower_unique",
+            ),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.5 on 2026-10-18 11:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0005_user_email_lower_unique"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="last_seen",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
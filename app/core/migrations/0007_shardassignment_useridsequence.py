@@ -0,0 +1,36 @@
+# Generated by Django 4.1.5 on 2026-10-18 11:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0006_user_last_seen"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ShardAssignment",
+            fields=[
+                (
+                    "bucket",
+                    models.PositiveIntegerField(
+                        primary_key=True, serialize=False
+                    ),
+                ),
+                ("shard", models.CharField(max_length=64)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="UserIdSequence",
+            fields=[
+                (
+                    "bucket",
+                    models.PositiveIntegerField(
+                        primary_key=True, serialize=False
+                    ),
+                ),
+                ("last_value", models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -9,12 +9,21 @@ REFER FULL EXAMPLE HERE -
 https://docs.djangoproject.com/en/4.1/topics/auth/customizing/#a-full-example
 """
 
-from django.db import models  # noqa
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, models, router, transaction  # noqa
 from django.contrib.auth.models import (
     AbstractBaseUser,
     PermissionsMixin,
     BaseUserManager,
 )
+from django.db.models.functions import Lower
+
+from core import hashing, sharding, signals
+
+# `email__lower=...` compiles to `LOWER(email) = ...`, the expression of the
+# case-insensitive unique index below, so it is answered by an index seek
+# (unlike `email__iexact`, which is `LIKE` / `UPPER()` depending on backend)
+models.EmailField.register_lookup(Lower)
 
 
 # Create your models here
@@ -47,10 +56,213 @@ class UserManager(BaseUserManager):
         user.set_password(password)
 
         # best practicec to use `using=self._db` when using multiple database
-        # saving a new object using `UserManager`
-        user.save(using=self._db)
+        # saving a new object using `UserManager`; with sharding the user
+        # goes to the shard owning its email (`core/sharding.py`)
+        using = self._db or sharding.shard_for(
+            sharding.bucket_for_email(user.email)
+        )
+        sharding.assign_ids([user], using)
+        # a new row, even with an id already allocated
+        user.save(using=using, force_insert=True)
         return user
 
+    async def acreate_user(self, email: str, password: str = None,
+                           **extra_fields):
+        """
+        async version of `create_user`
+
+        The password is hashed on the hashing service without blocking the
+        event loop, and the row is inserted with `acreate`.
+        """
+
+        if not email:
+            raise ValueError("User *MUST* have an email address")
+
+        user = self.model(email=self.normalize_email(email), **extra_fields)
+        if password is None:
+            user.set_password(None)
+        else:
+            user.password = await hashing.amake_password(password)
+
+        using = self._db or await sharding.ashard_for(
+            sharding.bucket_for_email(user.email)
+        )
+        if sharding.enabled():
+            await sync_to_async(sharding.assign_ids)([user], using)
+        return await self.using(using).acreate(
+            id=user.pk, email=user.email, password=user.password,
+            **extra_fields
+        )
+
+    def bulk_create_users(self, users, batch_size: int = 1000):
+        """
+        create and save many users with batched queries
+
+        Per batch of `batch_size` users this runs one SELECT for email
+        uniqueness, hashes passwords in parallel (`hashing.make_passwords`)
+        and inserts with a single `bulk_create`.
+
+        Args:
+            users: iterable of dicts with `email`, `password` and any extra
+            user fields
+            batch_size: number of users per SELECT / INSERT
+
+        Returns:
+            list aligned with `users`; each item is the new user object, or
+            `None` when the email is already taken
+        """
+
+        users = list(users)
+        if sharding.enabled() and self._db is None:
+            return self._create_users_by_shard(users, batch_size)
+
+        results = []
+        for start in range(0, len(users), batch_size):
+            results.extend(
+                self._create_user_batch(users[start:start + batch_size])
+            )
+        return results
+
+    def _create_users_by_shard(self, users, batch_size):
+        """`bulk_create_users` on the shard of each user's email"""
+
+        by_shard = {}
+        for index, data in enumerate(users):
+            if not data.get("email"):
+                raise ValueError("User *MUST* have an email address")
+            shard = sharding.shard_for(
+                sharding.bucket_for_email(self.normalize_email(data["email"]))
+            )
+            by_shard.setdefault(shard, []).append(index)
+
+        results = [None] * len(users)
+        for shard, indexes in by_shard.items():
+            created = self.db_manager(shard).bulk_create_users(
+                [users[index] for index in indexes], batch_size
+            )
+            for index, user in zip(indexes, created):
+                results[index] = user
+        return results
+
+    def _create_user_batch(self, users):
+        """create one batch of users; see `bulk_create_users`"""
+
+        emails = []
+        for data in users:
+            if not data.get("email"):
+                raise ValueError("User *MUST* have an email address")
+            emails.append(self.normalize_email(data["email"]))
+
+        taken = {
+            email.lower()
+            for email in self.filter(
+                email__lower__in=[email.lower() for email in emails]
+            ).values_list("email", flat=True)
+        }
+
+        pending = []
+        for index, (email, data) in enumerate(zip(emails, users)):
+            if email.lower() in taken:
+                continue
+            taken.add(email.lower())
+            pending.append((index, email, data))
+
+        hashes = hashing.make_passwords(
+            [data.get("password") for _, _, data in pending]
+        )
+
+        results = [None] * len(users)
+        objs = []
+        for (index, email, data), password in zip(pending, hashes):
+            extra_fields = {
+                key: value
+                for key, value in data.items()
+                if key not in ("email", "password")
+            }
+            user = self.model(email=email, password=password, **extra_fields)
+            results[index] = user
+            objs.append(user)
+
+        sharding.assign_ids(objs, self._db)
+        try:
+            with transaction.atomic(using=self._db):
+                self.bulk_create(objs)
+        except IntegrityError:
+            # an email was inserted concurrently since the SELECT above;
+            # fall back to one savepoint per user for this batch only
+            for index, user in enumerate(results):
+                if user is None:
+                    continue
+                if not sharding.enabled():
+                    # sharded ids are allocated, and stay reserved
+                    user.pk = None
+                user._state.adding = True
+                try:
+                    with transaction.atomic(using=self._db):
+                        user.save(using=self._db, force_insert=True)
+                except IntegrityError:
+                    results[index] = None
+
+        return results
+
+    def get_by_natural_key(self, email):
+        """the user with `email`, in any letter case; used by
+        `authenticate` and `createsuperuser`"""
+
+        using = self._db or sharding.shard_for(
+            sharding.bucket_for_email(email)
+        )
+        return self.using(using).get(email__lower=email.lower())
+
+    async def aget_by_natural_key(self, email):
+        """async version of `get_by_natural_key`"""
+
+        using = self._db or await sharding.ashard_for(
+            sharding.bucket_for_email(email)
+        )
+        return await self.using(using).aget(email__lower=email.lower())
+
+    def update_user(self, pk, expected_versions=None, **changes):
+        """
+        update the user `pk` with a single UPDATE that also bumps `version`
+        and send `core.signals.user_updated`
+
+        With `expected_versions` the row is only updated while its version
+        is one of them (optimistic concurrency). With sharded users, a new
+        email of another bucket moves the user there, with a new id and
+        token key (`sharding.relocate_user`).
+
+        Returns:
+            the new version, or `None` when no row was updated
+        """
+
+        using = (
+            self._db
+            or sharding.shard_for(sharding.bucket_for_id(pk))
+            or router.db_for_write(self.model)
+        )
+        queryset = self.using(using).filter(pk=pk)
+        with transaction.atomic(using=using):
+            target = queryset
+            if expected_versions is not None:
+                target = target.filter(version__in=expected_versions)
+            if not target.update(version=models.F("version") + 1, **changes):
+                return None
+            # our UPDATE holds the row lock, this reads our own version
+            version = queryset.values_list("version", flat=True).get()
+            if "email" in changes:
+                sharding.relocate_user(pk, using)
+
+        signals.user_updated.send(sender=self.model, pk=pk)
+        return version
+
+    async def aupdate_user(self, pk, expected_versions=None, **changes):
+        """async version of `update_user`"""
+
+        return await sync_to_async(self.update_user)(
+            pk, expected_versions, **changes
+        )
+
     def create_superuser(self, email, password):
         """
         WHen we call `python manage.py createsuperuser` command, django calls
@@ -84,6 +296,13 @@ class User(AbstractBaseUser, PermissionsMixin):
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
 
+    # last authenticated API request, written behind in batches by
+    # `core.activity` (resolution: the flush interval)
+    last_seen = models.DateTimeField(null=True, blank=True, editable=False)
+
+    # bumped by every save, identifies a state of the row (`ETag` of /me/)
+    version = models.PositiveIntegerField(default=1, editable=False)
+
     # Assign `UserManager` in django to custom user class.
     # When using ORM queries say `objects.get()`, `objects.create()` etc
     # all those methods come from this objects attribute
@@ -91,3 +310,104 @@ class User(AbstractBaseUser, PermissionsMixin):
     objects = UserManager()
 
     USERNAME_FIELD = "email"  # overrides the default user field from base class
+
+    class Meta:
+        constraints = [
+            # emails differing only in letter case belong to the same user;
+            # the email is still stored as entered
+            models.UniqueConstraint(
+                Lower("email"), name="core_user_email_lower_unique"
+            ),
+        ]
+
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        """Save, bumping `version` in the same UPDATE.
+
+        The increment is done by the database and read back in the same
+        transaction, so concurrent saves never end up with the same version.
+        """
+
+        if self._state.adding or (
+            update_fields is not None and not update_fields
+        ):
+            return super().save(force_insert, force_update, using,
+                                update_fields)
+
+        if update_fields is not None:
+            update_fields = {*update_fields, "version"}
+        using = using or router.db_for_write(type(self), instance=self)
+        version = self.version
+        try:
+            with transaction.atomic(using=using):
+                self.version = models.F("version") + 1
+                super().save(force_insert, force_update, using,
+                             update_fields)
+                self.version = (
+                    type(self)._base_manager.using(using)
+                    .filter(pk=self.pk)
+                    .values_list("version", flat=True)
+                    .get()
+                )
+        except Exception:
+            self.version = version
+            raise
+
+    def set_password(self, raw_password):
+        """Hash the password on the shared hashing service (`core.hashing`)
+        rather than on the request thread"""
+
+        if raw_password is None:
+            return super().set_password(raw_password)
+
+        self.password = hashing.make_password(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        """Verify the password on the shared hashing service, upgrading the
+        stored hash when the hasher parameters changed"""
+
+        is_correct, must_update = hashing.check_password(
+            raw_password, self.password
+        )
+        if is_correct and must_update:
+            self.set_password(raw_password)
+            self._password = None
+            self.save(update_fields=["password"])
+        return is_correct
+
+
+class RevokedToken(models.Model):
+    """A revoked signed token (`user/tokens.py`), kept until it expires
+
+    Signed tokens are verified without a lookup, so this small table is the
+    only place a logout or a rotated refresh token is remembered.
+    """
+
+    jti = models.CharField(max_length=32, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.jti
+
+
+class ShardAssignment(models.Model):
+    """A bucket of hash-sharded users moved off its initial shard
+    (`core/sharding.py`), kept on the `default` database"""
+
+    bucket = models.PositiveIntegerField(primary_key=True)
+    shard = models.CharField(max_length=64)
+
+    def __str__(self):
+        return f"{self.bucket} -> {self.shard}"
+
+
+class UserIdSequence(models.Model):
+    """The last user id sequence number of a bucket, kept on the shard
+    owning the bucket (`core/sharding.py`)"""
+
+    bucket = models.PositiveIntegerField(primary_key=True)
+    last_value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.bucket}: {self.last_value}"
@@ -0,0 +1,159 @@
+"""
+Pagination for large admin changelists
+
+The default admin changelist runs an exact `COUNT(*)` and pages with
+`OFFSET`, both of which scan more of the table the bigger it (and the page
+number) gets. `KeysetPaginator` instead:
+
+- reads MySQL's table-statistics row estimate when the list is not filtered
+- navigates with `?after=<id>` / `?before=<id>` (`WHERE id > last_id`),
+  so every page is a single index range scan of `list_per_page` rows
+
+Keyset navigation needs the list ordered by primary key; for any other
+ordering the paginator falls back to regular `OFFSET` pages.
+
+TODO - refer
+https://docs.djangoproject.com/en/4.2/ref/contrib/admin/#django.contrib.admin.ModelAdmin.paginator
+https://dev.mysql.com/doc/refman/8.0/en/information-schema-tables-table.html
+"""
+
+from django.contrib.admin.views.main import ChangeList
+from django.core.paginator import Page, Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+AFTER_VAR = "after"
+BEFORE_VAR = "before"
+
+
+class KeysetPaginator(Paginator):
+    """Paginator with estimated counts and primary-key keyset pages"""
+
+    # below this many rows an exact count is cheap enough
+    estimate_threshold = 10000
+
+    def __init__(self, object_list, per_page, orphans=0,
+                 allow_empty_first_page=True, after=None, before=None):
+        super().__init__(object_list, per_page, orphans,
+                         allow_empty_first_page)
+        self.after = after
+        self.before = before
+        self.count_is_estimate = False
+
+    @cached_property
+    def keyset_enabled(self):
+        """keyset pages are only correct for a list ordered by `pk`"""
+
+        # the admin may repeat the same ordering, e.g. ("id", "id")
+        order_by = list(dict.fromkeys(self.object_list.query.order_by))
+        pk_name = self.object_list.model._meta.pk.name
+        return len(order_by) == 1 and order_by[0] in ("pk", pk_name)
+
+    @cached_property
+    def count(self):
+        if not self.object_list.query.where:
+            estimate = self.estimated_count()
+            if estimate is not None and estimate > self.estimate_threshold:
+                self.count_is_estimate = True
+                return estimate
+        return super().count
+
+    def estimated_count(self):
+        """row count from table statistics, or `None` when unavailable"""
+
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor != "mysql":
+            return None
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        return row[0] if row and row[0] is not None else None
+
+    def validate_number(self, number):
+        # an estimated count must not reject a page that really exists
+        if self.count_is_estimate or self.is_keyset_page():
+            return max(int(number), 1)
+        return super().validate_number(number)
+
+    def is_keyset_page(self):
+        return self.keyset_enabled and (
+            self.after is not None or self.before is not None
+        )
+
+    def page(self, number):
+        if not self.is_keyset_page():
+            return super().page(number)
+
+        queryset = self.object_list
+        if self.after is not None:
+            rows = list(queryset.filter(pk__gt=self.after)[:self.per_page])
+        else:
+            rows = list(
+                queryset.filter(pk__lt=self.before)
+                .reverse()[:self.per_page]
+            )
+            rows.reverse()
+        return Page(rows, number, self)
+
+
+class KeysetChangeList(ChangeList):
+    """ChangeList that understands the `after` / `before` keyset parameters
+    and exposes previous / next links for them"""
+
+    keyset_vars = (AFTER_VAR, BEFORE_VAR)
+
+    def __init__(self, request, *args, **kwargs):
+        super().__init__(request, *args, **kwargs)
+        # keep keyset positions out of sort / filter / search links
+        for var in self.keyset_vars:
+            self.params.pop(var, None)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        for var in self.keyset_vars:
+            lookup_params.pop(var, None)
+        return lookup_params
+
+    def get_results(self, request):
+        super().get_results(request)
+
+        self.keyset_enabled = self.paginator.keyset_enabled
+        self.keyset_previous_url = None
+        self.keyset_next_url = None
+        if not self.keyset_enabled or not self.multi_page:
+            return
+
+        rows = list(self.result_list)
+        if not rows:
+            return
+
+        paginator = self.paginator
+        has_previous = paginator.after is not None or (
+            paginator.before is not None and len(rows) == self.list_per_page
+        )
+        has_next = paginator.before is not None or (
+            len(rows) == self.list_per_page
+        )
+        if has_previous:
+            self.keyset_previous_url = self.get_query_string(
+                {BEFORE_VAR: rows[0].pk}, self.keyset_vars
+            )
+        if has_next:
+            self.keyset_next_url = self.get_query_string(
+                {AFTER_VAR: rows[-1].pk}, self.keyset_vars
+            )
+
+
+def keyset_position(request, var):
+    """read an integer keyset position from the query string"""
+
+    try:
+        return int(request.GET[var])
+    except (KeyError, ValueError):
+        return None
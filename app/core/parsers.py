@@ -0,0 +1,28 @@
+"""
+orjson based JSON parser
+
+TODO - refer
+https://www.django-rest-framework.org/api-guide/parsers/#custom-parsers
+"""
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+
+from core.renderers import orjson
+
+
+class ORJSONParser(JSONParser):
+    """Parses JSON request bodies with orjson, falling back to `JSONParser`
+    for bodies not encoded as UTF-8"""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace("-", "") != "utf8":
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
@@ -0,0 +1,223 @@
+"""
+Permission lookups served from a shared cache
+
+`ModelBackend` resolves a user's permissions with two joins (through
+`user_permissions` and through `groups`) the first time `has_perm` /
+`get_all_permissions` is called on each user object, i.e. on every admin
+request of a staff user. `CachedModelBackend` stores the flattened
+`"app_label.codename"` sets of each user in the `permissions` cache
+(`settings.CACHES`), so a warm user costs one cache read per request and no
+query.
+
+Entries are deleted by the signal handlers below whenever something that
+feeds them changes through the ORM:
+
+- `User.groups` / `User.user_permissions` membership (`m2m_changed`, from
+  either side, including `clear()`)
+- `Group.permissions` membership, and groups or permissions being deleted
+- the user being saved (`is_active`, `is_superuser`), updated through
+  `UserManager.update_user` or deleted
+
+Invalidation also gives the user a new version (`version_key`), which a
+fill reads before loading the sets and stores with them; an entry is only
+served while the version still matches. A load racing a revocation thus
+never serves the sets it read before the revocation.
+
+With sharded users (`core/sharding.py`) a session's user and the user's
+permissions are read from the user's shard.
+
+The cache must be shared by every process: the default `FileBasedCache`
+directory is shared by the workers of a host, use memcached or redis with
+several hosts. With a process-local cache (`LocMemCache`) the other
+processes keep a revoked permission until the entry's `TIMEOUT` (300s by
+default), so `gunicorn.conf.py` refuses it with more than one worker.
+Changes made outside the ORM (raw SQL, `QuerySet.update`) are also only
+seen after `TIMEOUT`.
+
+TODO - refer
+https://docs.djangoproject.com/en/4.1/topics/auth/customizing/#handling-authorization-in-custom-backends
+https://docs.djangoproject.com/en/4.1/ref/signals/#m2m-changed
+"""
+
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import caches
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+
+from core import sharding
+from core.signals import user_updated
+
+CACHE_ALIAS = "permissions"
+
+# `ModelBackend` keeps what it loaded on the user object under these names
+PERM_CACHE_NAMES = {"user": "_user_perm_cache", "group": "_group_perm_cache"}
+
+
+def permissions_key(user_id):
+    return f"user-perms:{user_id}"
+
+
+def version_key(user_id):
+    return f"user-perms-version:{user_id}"
+
+
+def invalidate_permissions(user_ids):
+    cache = caches[CACHE_ALIAS]
+    version = time.time()
+    cache.set_many(
+        {version_key(user_id): version for user_id in user_ids}, None
+    )
+    cache.delete_many([permissions_key(user_id) for user_id in user_ids])
+
+
+class CachedModelBackend(ModelBackend):
+    """`ModelBackend` whose per-user permission sets come from the
+    `permissions` cache"""
+
+    def _get_permissions(self, user_obj, obj, from_name):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+
+        perm_cache_name = PERM_CACHE_NAMES[from_name]
+        if not hasattr(user_obj, perm_cache_name):
+            for name, perms in self.get_cached_permissions(user_obj).items():
+                setattr(user_obj, PERM_CACHE_NAMES[name], perms)
+        return getattr(user_obj, perm_cache_name)
+
+    def get_user(self, user_id):
+        if not sharding.enabled():
+            return super().get_user(user_id)
+        try:
+            user = get_user_model()._default_manager.db_manager(
+                sharding.shard_for(sharding.bucket_for_id(user_id))
+            ).get(pk=user_id)
+        except (get_user_model().DoesNotExist, TypeError, ValueError):
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+    def _get_group_permissions(self, user_obj):
+        if not sharding.enabled():
+            return super()._get_group_permissions(user_obj)
+        # `Permission` rows of a sharded user's groups are on its shard
+        return Permission.objects.db_manager(user_obj._state.db).filter(
+            group__user=user_obj
+        )
+
+    def get_cached_permissions(self, user_obj):
+        """both permission sets of `user_obj`, loaded and cached on a
+        miss"""
+
+        cache = caches[CACHE_ALIAS]
+        key = permissions_key(user_obj.pk)
+        found = cache.get_many([key, version_key(user_obj.pk)])
+        version = found.get(version_key(user_obj.pk))
+        entry = found.get(key)
+        if entry is not None and version is not None and entry[0] == version:
+            return entry[1]
+
+        if version is None:
+            # never invalidated, or evicted: any new value outdates the
+            # entries stored with the previous one
+            version = time.time()
+            if not cache.add(version_key(user_obj.pk), version, None):
+                version = cache.get(version_key(user_obj.pk))
+        perms = {
+            name: super(CachedModelBackend, self)._get_permissions(
+                user_obj, None, name
+            )
+            for name in PERM_CACHE_NAMES
+        }
+        # read before the load: an invalidation meanwhile outdates it
+        cache.set(key, (version, perms))
+        return perms
+
+
+def group_user_ids(group_ids):
+    user_ids = set()
+    for alias in sharding.user_databases():
+        user_ids.update(
+            get_user_model()._default_manager.db_manager(alias)
+            .filter(groups__in=group_ids).values_list("pk", flat=True)
+        )
+    return user_ids
+
+
+def affected_user_ids(instance, model, pk_set, through):
+    """ids of the users whose permissions an m2m change can alter"""
+
+    user_model = get_user_model()
+    if isinstance(instance, user_model):
+        return {instance.pk}
+    if through is Group.permissions.through:
+        if isinstance(instance, Group):
+            return group_user_ids([instance.pk])
+        # Permission.group_set: `pk_set` are group ids
+        if pk_set is None:
+            pk_set = set(instance.group_set.values_list("pk", flat=True))
+        return group_user_ids(pk_set)
+    # Group.user_set / Permission.user_set: `pk_set` are user ids
+    if pk_set is None:
+        return set(instance.user_set.values_list("pk", flat=True))
+    return set(pk_set)
+
+
+@receiver(m2m_changed, sender=get_user_model().groups.through)
+@receiver(m2m_changed, sender=get_user_model().user_permissions.through)
+@receiver(m2m_changed, sender=Group.permissions.through)
+def drop_permissions_on_m2m_change(sender, instance, action, model, pk_set,
+                                   **kwargs):
+    if action == "pre_clear":
+        # the related rows are gone by `post_clear`, find the users now
+        instance._permission_user_ids = affected_user_ids(
+            instance, model, None, sender
+        )
+    elif action == "post_clear":
+        invalidate_permissions(instance.__dict__.pop(
+            "_permission_user_ids", ()
+        ))
+    elif action in ("post_add", "post_remove"):
+        invalidate_permissions(
+            affected_user_ids(instance, model, pk_set, sender)
+        )
+
+
+@receiver(pre_delete, sender=Group)
+def collect_group_users(sender, instance, **kwargs):
+    instance._permission_user_ids = group_user_ids([instance.pk])
+
+
+@receiver(post_delete, sender=Group)
+def drop_permissions_on_group_delete(sender, instance, **kwargs):
+    invalidate_permissions(instance.__dict__.pop("_permission_user_ids", ()))
+
+
+@receiver(post_delete, sender=Permission)
+def drop_permissions_on_permission_delete(sender, instance, **kwargs):
+    # rare (a model or permission removed); any user may have had it
+    caches[CACHE_ALIAS].clear()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def drop_permissions_on_user_save(sender, instance, created, **kwargs):
+    if not created:
+        invalidate_permissions([instance.pk])
+
+
+@receiver(user_updated, sender=settings.AUTH_USER_MODEL)
+def drop_permissions_on_user_update(sender, pk, **kwargs):
+    invalidate_permissions([pk])
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def drop_permissions_on_user_delete(sender, instance, **kwargs):
+    invalidate_permissions([instance.pk])
@@ -0,0 +1,64 @@
+"""
+orjson based JSON renderer
+
+`ORJSONRenderer` produces the same bytes as DRF's `JSONRenderer` for the
+compact, unicode output the API uses, with orjson doing the encoding in C.
+Anything orjson does not do the same way falls back to `JSONRenderer`:
+
+- indented output (`Accept: application/json; indent=4`, browsable API)
+- `UNICODE_JSON = False` or `COMPACT_JSON = False`
+- values orjson cannot encode itself go through DRF's `JSONEncoder`
+- orjson not installed
+
+TODO - refer
+https://github.com/ijl/orjson#serialize
+https://www.django-rest-framework.org/api-guide/renderers/#custom-renderers
+"""
+
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+if orjson is not None:
+    # datetimes go through DRF's encoder, which formats them differently;
+    # dict keys may be ints, like with `json`
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+# U+2028 / U+2029 in UTF-8, escaped by `JSONRenderer`
+LINE_SEPARATOR = "\u2028".encode()
+PARAGRAPH_SEPARATOR = "\u2029".encode()
+
+
+class ORJSONRenderer(JSONRenderer):
+    """Renderer which serializes to JSON with orjson"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        if data is None:
+            return b""
+
+        try:
+            ret = orjson.dumps(
+                data, default=self.encoder_class().default,
+                option=ORJSON_OPTIONS,
+            )
+        except orjson.JSONEncodeError:
+            # e.g. integers over 64 bits
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+
+        if LINE_SEPARATOR in ret or PARAGRAPH_SEPARATOR in ret:
+            ret = ret.replace(LINE_SEPARATOR, b"\\u2028").replace(
+                PARAGRAPH_SEPARATOR, b"\\u2029"
+            )
+        return ret
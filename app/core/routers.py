@@ -0,0 +1,293 @@
+"""
+Read-replica routing with read-your-writes stickiness
+
+Writes always go to the primary (`default`). Reads go to a replica only
+inside a request that `replica_routing_middleware` marked as replica-safe:
+
+- a GET / HEAD / OPTIONS request under `PATH_PREFIXES` (the user API)
+- from a client that has not written anything for `STICKY_SECONDS`; a
+  client is recognised by its `Authorization` header only (an address is
+  shared behind a proxy or NAT), and a view that issues credentials makes
+  them sticky with `stick_credentials`, so the token issued by
+  `POST /api/user/token/` is also read back from the primary
+- to a replica whose lag is at most `MAX_LAG` seconds; lower lag replicas
+  get proportionally more reads, and with no healthy replica reads stay on
+  the primary
+
+Any write during a request (the router sees every `db_for_write`) makes the
+client sticky. Sticky clients are kept in the `CACHE` cache, which must be
+shared between processes (not `LocMemCache`) when the server runs several
+workers; `gunicorn.conf.py` refuses to start otherwise. Keep `MAX_LAG`
+below `STICKY_SECONDS`, so that a replica a client is sent back to already
+has the client's writes.
+
+    REPLICA_ROUTING = {
+        "REPLICAS": ["replica1", "replica2"],
+        "PATH_PREFIXES": ["/api/user/"],
+        "STICKY_SECONDS": 5,
+        "MAX_LAG": 2,
+        "LAG_CHECK_INTERVAL": 5,
+        "CACHE": "replica_sticky",
+    }
+
+Replica lag is read with `SHOW REPLICA STATUS` (MySQL 8.0.22+), so the
+replica user needs the `REPLICATION CLIENT` privilege.
+
+TODO - refer
+https://docs.djangoproject.com/en/4.2/topics/db/multi-db/#database-routers
+https://dev.mysql.com/doc/refman/8.0/en/show-replica-status.html
+"""
+
+import asyncio
+import contextvars
+import hashlib
+import os
+import random
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.decorators import sync_and_async_middleware
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+_state = contextvars.ContextVar("replica_routing", default=None)
+
+
+def get_config() -> dict:
+    config = getattr(settings, "REPLICA_ROUTING", {})
+    return {
+        "REPLICAS": config.get("REPLICAS", []),
+        "PATH_PREFIXES": config.get("PATH_PREFIXES", ["/api/user/"]),
+        "STICKY_SECONDS": config.get("STICKY_SECONDS", 5),
+        "MAX_LAG": config.get("MAX_LAG", 2),
+        "LAG_CHECK_INTERVAL": config.get("LAG_CHECK_INTERVAL", 5),
+        "CACHE": config.get("CACHE", "default"),
+    }
+
+
+class RoutingState:
+    """Routing decision of the current request; mutable so that writes made
+    on a `sync_to_async` thread are seen by the middleware"""
+
+    __slots__ = ("read_db", "wrote", "credentials")
+
+    def __init__(self, read_db=DEFAULT_DB_ALIAS):
+        self.read_db = read_db
+        self.wrote = False
+        # `Authorization` values issued by this request
+        self.credentials = []
+
+
+class ReplicaRouter:
+    """Send reads of replica-safe requests to the chosen replica, everything
+    else to the primary"""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None:
+            return None
+        return DEFAULT_DB_ALIAS if state.wrote else state.read_db
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in get_config()["REPLICAS"]:
+            return False
+        return None
+
+
+def measure_lag(alias):
+    """seconds `alias` is behind its source, `None` when unknown or down"""
+
+    try:
+        connection = connections[alias]
+        if connection.vendor != "mysql":
+            return 0.0
+        with connection.cursor() as cursor:
+            cursor.execute("SHOW REPLICA STATUS")
+            row = cursor.fetchone()
+            columns = [column[0] for column in cursor.description or ()]
+    except Exception:
+        return None
+    if row is None:
+        # not replicating
+        return None
+    lag = dict(zip(columns, row)).get("Seconds_Behind_Source")
+    return None if lag is None else float(lag)
+
+
+class ReplicaMonitor:
+    """Periodically measured replica lag and the lag-weighted replica
+    choice"""
+
+    def __init__(self, replicas, max_lag, interval):
+        self.replicas = list(replicas)
+        self.max_lag = max_lag
+        self.interval = interval
+        self.lags = {}
+        self.checked_at = None
+        self._lock = threading.Lock()
+
+    def is_stale(self):
+        return (
+            self.checked_at is None
+            or time.monotonic() - self.checked_at >= self.interval
+        )
+
+    def refresh(self):
+        """measure every replica, unless another thread already is"""
+
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self.lags = {alias: measure_lag(alias) for alias in self.replicas}
+            self.checked_at = time.monotonic()
+        finally:
+            self._lock.release()
+
+    def choose(self):
+        """a replica within `max_lag`, lower lag weighted higher, or the
+        primary"""
+
+        # measurements from several intervals ago say nothing about now
+        if self.checked_at is None or (
+            time.monotonic() - self.checked_at > 3 * self.interval
+        ):
+            return DEFAULT_DB_ALIAS
+        healthy = [
+            (alias, lag) for alias, lag in self.lags.items()
+            if lag is not None and lag <= self.max_lag
+        ]
+        if not healthy:
+            return DEFAULT_DB_ALIAS
+        aliases, lags = zip(*healthy)
+        return random.choices(aliases, [1 / (1 + lag) for lag in lags])[0]
+
+
+_monitors = {}
+_monitors_lock = threading.Lock()
+
+
+def get_monitor() -> ReplicaMonitor:
+    """Return this process's replica monitor"""
+
+    pid = os.getpid()
+    monitor = _monitors.get(pid)
+    if monitor is None:
+        with _monitors_lock:
+            monitor = _monitors.get(pid)
+            if monitor is None:
+                config = get_config()
+                monitor = ReplicaMonitor(
+                    config["REPLICAS"], config["MAX_LAG"],
+                    config["LAG_CHECK_INTERVAL"],
+                )
+                _monitors.clear()
+                _monitors[pid] = monitor
+    return monitor
+
+
+def sticky_key(authorization):
+    return "replica-sticky:" + hashlib.sha256(
+        authorization.encode()
+    ).hexdigest()
+
+
+def sticky_keys(request):
+    """cache keys identifying the client of `request`: none without
+    credentials"""
+
+    authorization = request.META.get("HTTP_AUTHORIZATION")
+    return [sticky_key(authorization)] if authorization else []
+
+
+def stick_credentials(authorization):
+    """make the client that will send `authorization` (e.g. a token this
+    request created) read from the primary like the current client"""
+
+    state = _state.get()
+    if state is not None:
+        state.credentials.append(authorization)
+
+
+def written_keys(keys, state):
+    return keys + [sticky_key(value) for value in state.credentials]
+
+
+def is_replica_safe(request, config):
+    return request.method in SAFE_METHODS and request.path.startswith(
+        tuple(config["PATH_PREFIXES"])
+    )
+
+
+@sync_and_async_middleware
+def replica_routing_middleware(get_response):
+    """Pick the database reads of each request go to, and make clients that
+    wrote sticky to the primary"""
+
+    config = get_config()
+    if not config["REPLICAS"]:
+        raise MiddlewareNotUsed
+    cache = caches[config["CACHE"]]
+    sticky_seconds = config["STICKY_SECONDS"]
+
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            keys = sticky_keys(request)
+            state = RoutingState()
+            if is_replica_safe(request, config) and not (
+                await cache.aget_many(keys)
+            ):
+                monitor = get_monitor()
+                if monitor.is_stale():
+                    # measuring lag queries the replicas
+                    await sync_to_async(monitor.refresh)()
+                state.read_db = monitor.choose()
+
+            token = _state.set(state)
+            try:
+                response = await get_response(request)
+            finally:
+                _state.reset(token)
+            if state.wrote:
+                await cache.aset_many(
+                    dict.fromkeys(written_keys(keys, state), 1),
+                    sticky_seconds,
+                )
+            return response
+    else:
+        def middleware(request):
+            keys = sticky_keys(request)
+            state = RoutingState()
+            if is_replica_safe(request, config) and not cache.get_many(keys):
+                monitor = get_monitor()
+                if monitor.is_stale():
+                    monitor.refresh()
+                state.read_db = monitor.choose()
+
+            token = _state.set(state)
+            try:
+                response = get_response(request)
+            finally:
+                _state.reset(token)
+            if state.wrote:
+                cache.set_many(
+                    dict.fromkeys(written_keys(keys, state), 1),
+                    sticky_seconds,
+                )
+            return response
+
+    return middleware
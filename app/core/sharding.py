@@ -0,0 +1,489 @@
+"""
+Hash-sharded users
+
+With `SHARDING["SHARDS"]` set, users are spread over several databases.
+Each user belongs to one of `BUCKETS` buckets, a hash of their lower-cased
+email, and each bucket to one shard:
+
+- bucket `b` starts on `SHARDS[b % len(SHARDS)]`
+- `rebalance_users --bucket b --to <alias>` moves it, recorded as a
+  `core.ShardAssignment` row on the `default` database; every process
+  reloads those rows each `MAP_REFRESH_INTERVAL` seconds
+
+A user's id carries its bucket (`id % BUCKETS`; ids are allocated per bucket
+from `core.UserIdSequence` on the owning shard) and so does the key of an
+API token (its first 4 hex digits). Login (by email) and token, signed token
+and session authentication (by key or user id) each go straight to the
+owning shard, without a directory lookup.
+
+`ShardRouter` sends a user, its tokens, its group / permission memberships
+and the id sequences to the shard of the instance they are read or saved
+for. Every database gets the full schema (migrations run everywhere), rows
+of other models stay on `default`. A query with no user to go by, e.g.
+`User.objects.all()`, runs on `default`: loop over `user_databases()` for
+those.
+
+    SHARDING = {
+        "SHARDS": ["shard0", "shard1", "shard2"],
+        "BUCKETS": 1024,
+        "MAP_REFRESH_INTERVAL": 30,
+    }
+
+`BUCKETS` is fixed for the life of the data (at most 65536, it is part of
+every id and token key); shards are added by moving buckets.
+
+TODO - refer
+https://docs.djangoproject.com/en/4.1/topics/db/multi-db/
+https://instagram-engineering.com/sharding-ids-at-instagram-1cf5a71e5a5c
+"""
+
+import hashlib
+import os
+import secrets
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, models, transaction
+
+SHARDED_MODELS = {
+    "core.user",
+    "core.user_groups",
+    "core.user_user_permissions",
+    "core.useridsequence",
+    "authtoken.token",
+}
+
+
+def get_config() -> dict:
+    config = getattr(settings, "SHARDING", {})
+    return {
+        "SHARDS": config.get("SHARDS", []),
+        "BUCKETS": config.get("BUCKETS", 1024),
+        "MAP_REFRESH_INTERVAL": config.get("MAP_REFRESH_INTERVAL", 30),
+    }
+
+
+def enabled() -> bool:
+    return bool(getattr(settings, "SHARDING", {}).get("SHARDS"))
+
+
+def user_databases():
+    """the databases holding users; `[None]` (routed as usual) when not
+    sharded"""
+
+    return get_config()["SHARDS"] or [None]
+
+
+def bucket_for_email(email: str) -> int:
+    digest = hashlib.blake2b(
+        email.strip().lower().encode(), digest_size=8
+    ).digest()
+    return int.from_bytes(digest, "big") % get_config()["BUCKETS"]
+
+
+def bucket_for_id(user_id) -> int:
+    return int(user_id) % get_config()["BUCKETS"]
+
+
+def bucket_for_token_key(key: str):
+    try:
+        return int(key[:4], 16) % get_config()["BUCKETS"]
+    except ValueError:
+        return None
+
+
+def make_id(bucket: int, sequence: int) -> int:
+    return sequence * get_config()["BUCKETS"] + bucket
+
+
+def make_token_key(user_id) -> str:
+    """a 40 hex digit API token key starting with the user's bucket"""
+
+    return f"{bucket_for_id(user_id):04x}{secrets.token_hex(18)}"
+
+
+def initial_shard(bucket: int) -> str:
+    shards = get_config()["SHARDS"]
+    return shards[bucket % len(shards)]
+
+
+class ShardMap:
+    """Bucket to shard alias: the initial layout plus the moved buckets,
+    reloaded every `refresh_interval` seconds"""
+
+    def __init__(self, refresh_interval):
+        self.refresh_interval = refresh_interval
+        self.moved = {}
+        self.loaded_at = None
+        self._lock = threading.Lock()
+
+    def is_stale(self):
+        return (
+            self.loaded_at is None
+            or time.monotonic() - self.loaded_at >= self.refresh_interval
+        )
+
+    def refresh(self):
+        assignments = apps.get_model("core", "ShardAssignment")
+        with self._lock:
+            self.moved = dict(
+                assignments._base_manager.using(DEFAULT_DB_ALIAS)
+                .values_list("bucket", "shard")
+            )
+            self.loaded_at = time.monotonic()
+
+    def shard_for(self, bucket):
+        """the owning shard of `bucket`, as last loaded"""
+
+        return self.moved.get(bucket) or initial_shard(bucket)
+
+
+_maps = {}
+_maps_lock = threading.Lock()
+
+
+def get_shard_map() -> ShardMap:
+    """Return this process's shard map, without reloading it"""
+
+    pid = os.getpid()
+    shard_map = _maps.get(pid)
+    if shard_map is None:
+        with _maps_lock:
+            shard_map = _maps.get(pid)
+            if shard_map is None:
+                shard_map = ShardMap(get_config()["MAP_REFRESH_INTERVAL"])
+                # a forked child must not share the parent's lock
+                _maps.clear()
+                _maps[pid] = shard_map
+    return shard_map
+
+
+def shard_for(bucket):
+    """alias of the shard owning `bucket`, `None` when not sharded (or no
+    bucket)"""
+
+    if bucket is None or not enabled():
+        return None
+    shard_map = get_shard_map()
+    if shard_map.is_stale():
+        shard_map.refresh()
+    return shard_map.shard_for(bucket)
+
+
+async def ashard_for(bucket):
+    """async version of `shard_for`"""
+
+    if bucket is None or not enabled():
+        return None
+    shard_map = get_shard_map()
+    if shard_map.is_stale():
+        # reloading queries `default`
+        await sync_to_async(shard_map.refresh)()
+    return shard_map.shard_for(bucket)
+
+
+def allocate_ids(bucket: int, count: int, using: str):
+    """reserve `count` new user ids of `bucket` on the shard `using`"""
+
+    sequences = apps.get_model("core", "UserIdSequence")._base_manager.using(
+        using
+    )
+    increment = {"last_value": models.F("last_value") + count}
+    with transaction.atomic(using=using):
+        if not sequences.filter(bucket=bucket).update(**increment):
+            try:
+                with transaction.atomic(using=using):
+                    sequences.create(bucket=bucket, last_value=count)
+            except IntegrityError:
+                # created concurrently
+                sequences.filter(bucket=bucket).update(**increment)
+        last = sequences.filter(bucket=bucket).values_list(
+            "last_value", flat=True
+        ).get()
+    return [
+        make_id(bucket, value) for value in range(last - count + 1, last + 1)
+    ]
+
+
+def assign_ids(users, using: str):
+    """set the ids of new `users`, all owned by the shard `using`"""
+
+    if not enabled():
+        return
+    by_bucket = {}
+    for user in users:
+        by_bucket.setdefault(bucket_for_email(user.email), []).append(user)
+    for bucket, bucket_users in by_bucket.items():
+        ids = allocate_ids(bucket, len(bucket_users), using)
+        for user, user_id in zip(bucket_users, ids):
+            user.pk = user_id
+
+
+def reserve_sequence(bucket: int, last_value: int, using: str):
+    """make the sequence of `bucket` on `using` start after
+    `last_value`"""
+
+    sequences = apps.get_model("core", "UserIdSequence")._base_manager.using(
+        using
+    )
+    sequences.get_or_create(bucket=bucket)
+    sequences.filter(bucket=bucket, last_value__lt=last_value).update(
+        last_value=last_value
+    )
+
+
+def get_or_create_token(user):
+    """`Token.objects.get_or_create(user=user)` on the user's shard, with a
+    key carrying the user's bucket"""
+
+    from rest_framework.authtoken.models import Token
+
+    if not enabled():
+        return Token.objects.get_or_create(user=user)
+    return Token.objects.using(user._state.db).get_or_create(
+        user=user, defaults={"key": make_token_key(user.pk)}
+    )
+
+
+async def aget_or_create_token(user):
+    """async version of `get_or_create_token`"""
+
+    from rest_framework.authtoken.models import Token
+
+    if not enabled():
+        return await Token.objects.aget_or_create(user=user)
+    return await Token.objects.using(user._state.db).aget_or_create(
+        user=user, defaults={"key": make_token_key(user.pk)}
+    )
+
+
+def is_sharded(obj):
+    return obj._meta.label_lower in SHARDED_MODELS
+
+
+class ShardRouter:
+    """Send users and the rows that belong to them to the user's shard"""
+
+    def db_for_read(self, model, **hints):
+        return self.db_for_model(model, hints.get("instance"))
+
+    def db_for_write(self, model, **hints):
+        return self.db_for_model(model, hints.get("instance"))
+
+    def db_for_model(self, model, instance):
+        if not enabled():
+            return None
+        if model._meta.label_lower == "core.shardassignment":
+            return DEFAULT_DB_ALIAS
+        if instance is None or not is_sharded(instance):
+            return None
+        if instance._state.db:
+            return instance._state.db
+        # a new row
+        if isinstance(instance, get_user_model()):
+            return shard_for(bucket_for_email(instance.email))
+        if hasattr(instance, "user_id"):
+            return shard_for(bucket_for_id(instance.user_id))
+        return shard_for(getattr(instance, "bucket", None))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if not enabled() or obj1._state.db == obj2._state.db:
+            return None
+        if is_sharded(obj1) or is_sharded(obj2):
+            return False
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # every database has every table
+        return None
+
+
+def misplaced_users(source: str, batch_size: int, moves=None):
+    """batches of `(owning shard, user ids)` of the users on `source`
+    that belong elsewhere; `moves` (bucket -> shard) overrides the shard
+    map"""
+
+    moves = moves or {}
+    users = get_user_model()._base_manager.using(source).order_by("pk")
+    last_pk = None
+    while True:
+        batch = users if last_pk is None else users.filter(pk__gt=last_pk)
+        rows = list(batch.values_list("pk", "email")[:batch_size])
+        if not rows:
+            return
+        last_pk = rows[-1][0]
+        by_owner = {}
+        for pk, email in rows:
+            bucket = bucket_for_email(email)
+            owner = moves.get(bucket) or shard_for(bucket)
+            if owner != source:
+                by_owner.setdefault(owner, []).append(pk)
+        yield from by_owner.items()
+
+
+def move_users(user_ids, source: str, target: str, replace=True) -> int:
+    """copy the users `user_ids` of `source`, with their tokens and their
+    group / permission memberships, to `target`, then delete them from
+    `source`; returns the number of users moved
+
+    Re-running it after an interruption is safe: copies already on `target`
+    are replaced, unless `replace` is false (an email taken on `target`
+    then raises `IntegrityError`). A user whose id does not carry its
+    bucket (created before sharding, or whose email changed), or collides
+    with another user of `target`, gets a new id there, and a new token
+    key. `source` may be `target`, for a user renumbered in place.
+    """
+
+    from django.contrib.auth.models import Group, Permission
+    from rest_framework.authtoken.models import Token
+
+    user_model = get_user_model()
+    users = list(user_model._base_manager.using(source).filter(
+        pk__in=user_ids
+    ))
+    if not users:
+        return 0
+    old_ids = [user.pk for user in users]
+    tokens = list(Token.objects.using(source).filter(user_id__in=old_ids))
+    groups = list(
+        user_model.groups.through._base_manager.using(source)
+        .filter(user_id__in=old_ids).values_list("user_id", "group__name")
+    )
+    permissions = list(
+        user_model.user_permissions.through._base_manager.using(source)
+        .filter(user_id__in=old_ids).values_list(
+            "user_id",
+            "permission__content_type__app_label",
+            "permission__codename",
+        )
+    )
+    target_users = user_model._base_manager.using(target)
+    sequences = apps.get_model("core", "UserIdSequence")._base_manager
+
+    with transaction.atomic(using=target):
+        if source == target:
+            # their tokens and memberships are recreated below
+            target_users.filter(pk__in=old_ids).delete()
+        elif replace:
+            # copies left by an interrupted run (the email is unique per
+            # bucket)
+            target_users.filter(
+                email__lower__in=[user.email.lower() for user in users]
+            ).delete()
+        taken = set(target_users.filter(pk__in=old_ids).values_list(
+            "pk", flat=True
+        ))
+
+        # new ids on `target` must not reuse those of `source`
+        last_values = {}
+        renumbered = {}
+        for user in users:
+            bucket = bucket_for_email(user.email)
+            last_values.setdefault(bucket, 0)
+            if bucket_for_id(user.pk) != bucket or user.pk in taken:
+                renumbered.setdefault(bucket, []).append(user)
+            else:
+                last_values[bucket] = max(
+                    last_values[bucket], user.pk // get_config()["BUCKETS"]
+                )
+        for bucket, last_value in sequences.using(source).filter(
+            bucket__in=last_values
+        ).values_list("bucket", "last_value"):
+            last_values[bucket] = max(last_values[bucket], last_value)
+        for bucket, last_value in last_values.items():
+            reserve_sequence(bucket, last_value, target)
+
+        new_ids = {}
+        for bucket, bucket_users in renumbered.items():
+            ids = allocate_ids(bucket, len(bucket_users), target)
+            for user, user_id in zip(bucket_users, ids):
+                new_ids[user.pk] = user_id
+
+        for user in users:
+            user.pk = new_ids.get(user.pk, user.pk)
+        target_users.bulk_create(users)
+
+        for token in tokens:
+            if token.user_id in new_ids:
+                token.user_id = new_ids[token.user_id]
+                token.key = make_token_key(token.user_id)
+        Token.objects.using(target).bulk_create(tokens)
+
+        # groups and permissions are matched by name on `target`
+        group_ids = dict(
+            Group.objects.using(target).values_list("name", "pk")
+        )
+        user_model.groups.through._base_manager.using(target).bulk_create([
+            user_model.groups.through(
+                user_id=new_ids.get(user_id, user_id),
+                group_id=group_ids[name],
+            )
+            for user_id, name in groups if name in group_ids
+        ])
+        permission_ids = {
+            (app_label, codename): pk
+            for pk, app_label, codename in Permission.objects.using(target)
+            .values_list("pk", "content_type__app_label", "codename")
+        }
+        through = user_model.user_permissions.through
+        through._base_manager.using(target).bulk_create([
+            through(
+                user_id=new_ids.get(user_id, user_id),
+                permission_id=permission_ids[(app_label, codename)],
+            )
+            for user_id, app_label, codename in permissions
+            if (app_label, codename) in permission_ids
+        ])
+
+    if source != target:
+        with transaction.atomic(using=source):
+            user_model._base_manager.using(source).filter(
+                pk__in=old_ids
+            ).delete()
+    return len(users)
+
+
+def relocate_user(user_id, using: str):
+    """move the user `user_id` of `using`, whose email changed to another
+    bucket, to that bucket: the bucket's shard, a new id and a new token
+    key (see `move_users`). Call it in a transaction on `using` together
+    with the email change, an email taken on the new shard then rolls both
+    back with `IntegrityError`.
+
+    Returns:
+        the user's id, new or unchanged
+    """
+
+    if not enabled():
+        return user_id
+    users = get_user_model()._base_manager
+    email = users.using(using).values_list("email", flat=True).get(
+        pk=user_id
+    )
+    bucket = bucket_for_email(email)
+    if bucket == bucket_for_id(user_id):
+        return user_id
+    target = shard_for(bucket)
+    move_users([user_id], using, target, replace=False)
+    return users.using(target).values_list("pk", flat=True).get(
+        email__lower=email.lower()
+    )
+
+
+def assign_bucket(bucket: int, shard: str):
+    """record `bucket` as owned by `shard`, at once in this process and
+    within `MAP_REFRESH_INTERVAL` in the others"""
+
+    assignments = apps.get_model(
+        "core", "ShardAssignment"
+    )._base_manager.using(DEFAULT_DB_ALIAS)
+    if shard == initial_shard(bucket):
+        assignments.filter(bucket=bucket).delete()
+    else:
+        assignments.update_or_create(bucket=bucket,
+                                     defaults={"shard": shard})
+    get_shard_map().refresh()
@@ -0,0 +1,12 @@
+"""
+Signals sent by `core.models`
+
+`user_updated` is sent by `UserManager.update_user` after its queryset
+UPDATE, which Django sends no `post_save` for. Arguments: `sender` (the user
+model) and `pk`.
+"""
+
+from django.db.models.signals import ModelSignal
+
+# a model signal, so receivers may name the sender as "app_label.Model"
+user_updated = ModelSignal(use_caching=True)
@@ -0,0 +1,113 @@
+"""
+Tests for the write-behind `last_seen` tracking
+"""
+
+import fcntl
+import io
+import os
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import activity
+from core.activity import LOCK_FILE, ActivityTracker
+from user.authentication import token_cache
+
+
+class ActivityTrackerTests(TestCase):
+    """Test buffering, spooling and flushing activity"""
+
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.users = [
+            get_user_model().objects.create_user(
+                email=f"user{i}@example.com", password="password@321"
+            )
+            for i in range(3)
+        ]
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def tracker(self, **kwargs):
+        return ActivityTracker(self.tmpdir.name, interval=0, **kwargs)
+
+    def last_seen(self, user):
+        user.refresh_from_db()
+        return user.last_seen.timestamp() if user.last_seen else None
+
+    def test_flush_coalesces_into_batches(self):
+        """Test repeated activity is one batched UPDATE per batch"""
+
+        tracker = self.tracker(batch_size=2)
+        for now in (1000, 1001, 1002):
+            for user in self.users:
+                tracker.touch(user.pk, now=now)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(tracker.flush(), 3)
+
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(self.last_seen(self.users[0]), 1002)
+        self.assertEqual(os.listdir(self.tmpdir.name), [LOCK_FILE])
+
+    def test_flush_merges_workers(self):
+        """Test spool files of several processes are merged, latest wins,
+        and a timestamp never moves backwards"""
+
+        worker, other = self.tracker(), self.tracker()
+        worker.touch(self.users[0].pk, now=2000)
+        other.touch(self.users[0].pk, now=1500)
+        other.touch(self.users[1].pk, now=1500)
+        other.spool()
+
+        self.assertEqual(worker.flush(), 2)
+        self.assertEqual(self.last_seen(self.users[0]), 2000)
+
+        other.touch(self.users[0].pk, now=1800)
+        self.assertEqual(other.flush(), 0)
+        self.assertEqual(self.last_seen(self.users[0]), 2000)
+
+    def test_flush_skipped_while_locked(self):
+        """Test a process does not flush while another one is"""
+
+        tracker = self.tracker()
+        tracker.touch(self.users[0].pk, now=1000)
+        with open(os.path.join(self.tmpdir.name, LOCK_FILE), "a") as lock:
+            tracker.spool()
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self.assertEqual(tracker.flush(), 0)
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+        self.assertIsNone(self.last_seen(self.users[0]))
+        self.assertEqual(tracker.flush(), 1)
+
+    def test_authenticated_request_recorded_without_write(self):
+        """Test an API request only buffers activity and the command
+        writes it"""
+
+        token_cache.clear()
+        activity._trackers.clear()
+        token = Token.objects.create(user=self.users[0])
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+        with override_settings(ACTIVITY_TRACKING={
+            "ENABLED": True, "DIR": self.tmpdir.name, "FLUSH_INTERVAL": 0,
+        }):
+            with CaptureQueriesContext(connection) as queries:
+                client.get(reverse("me"))
+            self.assertFalse(any(query["sql"].startswith("UPDATE")
+                                 for query in queries))
+
+            call_command("flush_activity", stdout=io.StringIO())
+        activity._trackers.clear()
+
+        self.assertIsNotNone(self.last_seen(self.users[0]))
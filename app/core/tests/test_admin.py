@@ -2,11 +2,20 @@
 Tests for the django admin modifications
 """
 
-from django.test import TestCase
+import io
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
 from django.test import Client
 from django.contrib.auth import get_user_model
 from django.shortcuts import reverse
 
+from core.admin import UserAdmin
+from core.pagination import KeysetPaginator
+
 
 class AdminSiteTests(TestCase):
     """Tests for django admin"""
@@ -60,9 +69,92 @@ class AdminSiteTests(TestCase):
         res = self.client.get(url)
         self.assertEqual(res.status_code, 200)
 
+    def test_static_files_served(self):
+        """Test the admin's CSS is served from `STATIC_ROOT` with DEBUG
+        off"""
+
+        static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_root)
+        with override_settings(STATIC_ROOT=static_root):
+            call_command("collectstatic", interactive=False,
+                         stdout=io.StringIO())
+            res = self.client.get("/static/admin/css/base.css")
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn("text/css", res["Content-Type"])
+
     def test_create_user_group(self):
         """Test the create user page works"""
 
         url = reverse("admin:core_user_add")
         res = self.client.get(url)
         self.assertEqual(res.status_code, 200)
+
+
+@patch.object(UserAdmin, "list_per_page", 2)
+class AdminKeysetPaginationTests(TestCase):
+    """Tests for keyset pages and estimated counts in the user changelist"""
+
+    def setUp(self) -> None:
+        self.client = Client()
+        self.admin_user = get_user_model().objects.create_superuser(
+            email="admin@example.com", password="adminpass@123"
+        )
+        self.client.force_login(self.admin_user)
+        self.users = [
+            get_user_model().objects.create_user(
+                email=f"user{i}@example.com", password="testpass123"
+            )
+            for i in range(4)
+        ]
+        self.url = reverse("admin:core_user_changelist")
+
+    def test_next_link_uses_keyset(self):
+        """Test the first page links to the next page by last id"""
+
+        res = self.client.get(self.url)
+
+        self.assertContains(res, f"?after={self.users[0].pk}")
+        self.assertNotContains(res, self.users[1].email)
+
+    def test_after_page(self):
+        """Test `?after=<id>` lists the rows following that id"""
+
+        res = self.client.get(self.url, {"after": self.users[0].pk})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertContains(res, self.users[1].email)
+        self.assertContains(res, self.users[2].email)
+        self.assertNotContains(res, self.users[0].email)
+        self.assertContains(res, f"?before={self.users[1].pk}")
+        self.assertContains(res, f"?after={self.users[2].pk}")
+
+    def test_before_page(self):
+        """Test `?before=<id>` lists the rows preceding that id"""
+
+        res = self.client.get(self.url, {"before": self.users[3].pk})
+
+        self.assertContains(res, self.users[1].email)
+        self.assertContains(res, self.users[2].email)
+        self.assertNotContains(res, self.users[3].email)
+
+    def test_sorted_list_falls_back_to_offset(self):
+        """Test lists sorted by another column use page numbers"""
+
+        res = self.client.get(self.url, {"o": "1"})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotContains(res, "?after=")
+
+    def test_estimated_count_only_without_filters(self):
+        """Test the table estimate replaces COUNT(*) on unfiltered lists"""
+
+        queryset = get_user_model().objects.order_by("id")
+        with patch.object(KeysetPaginator, "estimated_count",
+                          return_value=10 ** 7):
+            paginator = KeysetPaginator(queryset, 2)
+            self.assertEqual(paginator.count, 10 ** 7)
+            self.assertTrue(paginator.count_is_estimate)
+
+            paginator = KeysetPaginator(queryset.filter(is_staff=True), 2)
+            self.assertEqual(paginator.count, 1)
@@ -0,0 +1,83 @@
+"""
+Tests for the user API benchmark
+"""
+
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase
+
+from core.benchmark import compare, run_benchmark, summarize
+
+
+class BenchmarkMetricsTests(SimpleTestCase):
+    """Test summarizing and comparing benchmark results"""
+
+    def test_summarize(self):
+        """Test percentiles, throughput and queries per request"""
+
+        metrics = summarize([0.001 * i for i in range(1, 101)],
+                            [3] * 100, errors=2, elapsed=2.0)
+
+        self.assertEqual(metrics["requests"], 100)
+        self.assertEqual(metrics["errors"], 2)
+        self.assertEqual(metrics["rps"], 50)
+        self.assertAlmostEqual(metrics["p50_ms"], 51)
+        self.assertAlmostEqual(metrics["p99_ms"], 100)
+        self.assertEqual(metrics["queries_per_request"], 3)
+
+    def test_compare(self):
+        """Test only changes beyond the threshold are regressions"""
+
+        baseline = {"me_get": {"p50_ms": 10, "p95_ms": 20, "p99_ms": 30,
+                               "rps": 100, "queries_per_request": 2}}
+        current = {"me_get": {"p50_ms": 10.5, "p95_ms": 25, "p99_ms": 30,
+                              "rps": 80, "queries_per_request": 3}}
+
+        regressions = compare(baseline, current, threshold=0.10)
+
+        self.assertEqual(len(regressions), 3)
+        self.assertTrue(regressions[0].startswith("me_get p95_ms"))
+        self.assertEqual(compare(baseline, baseline), [])
+
+
+class BenchmarkRunTests(TestCase):
+    """Test running the benchmark against the test database"""
+
+    def test_run_benchmark(self):
+        """Test every scenario succeeds and benchmark users are removed"""
+
+        results = run_benchmark(requests=2, concurrency=1)
+
+        for scenario, metrics in results.items():
+            self.assertEqual(metrics["errors"], 0, scenario)
+            self.assertEqual(metrics["requests"], 2)
+            self.assertGreater(metrics["queries_per_request"], 0)
+        self.assertFalse(get_user_model().objects.exists())
+
+    def test_command_output_and_compare(self):
+        """Test results are saved and compared against a baseline"""
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "bench.json")
+            call_command("benchmark_api", "me_get", requests=2,
+                         concurrency=1, output=path, stdout=StringIO(),
+                         stderr=StringIO())
+            with open(path) as saved:
+                baseline = json.load(saved)
+            self.assertIn("me_get", baseline["results"])
+
+            # a baseline nothing can beat
+            baseline["results"]["me_get"].update(
+                p50_ms=0, queries_per_request=0
+            )
+            with open(path, "w") as saved:
+                json.dump(baseline, saved)
+            with self.assertRaises(CommandError):
+                call_command("benchmark_api", "me_get", requests=2,
+                             concurrency=1, compare=path, stdout=StringIO(),
+                             stderr=StringIO())
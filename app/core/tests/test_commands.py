@@ -2,12 +2,21 @@
 Test custom django management commands
 """
 
+import json
+import os
+import tempfile
+from io import StringIO
 from unittest.mock import patch
 from MySQLdb import Error
 
-from django.core.management import call_command
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TestCase
+
+from core import hashing
+from core.management.commands.wait_for_db import Command as WaitForDbCommand
+from core.warmup import hot_queries
 
 
 @patch("core.management.commands.wait_for_db.Command.check")
@@ -29,3 +38,184 @@ class CommandTests(SimpleTestCase):
         call_command("wait_for_db")
         self.assertEqual(patched_check.call_count, 6)
         patched_check.assert_called_with(databases=["default"])
+
+    @patch("time.sleep")
+    def test_wait_for_db_timeout(self, patched_sleep, patched_check):
+        """Test the command fails once the timeout has passed"""
+
+        patched_check.side_effect = OperationalError
+        with patch("time.monotonic", side_effect=[0, 1, 2, 31]):
+            with self.assertRaises(CommandError):
+                call_command("wait_for_db", timeout=30, stdout=StringIO())
+        self.assertEqual(patched_check.call_count, 3)
+
+    @patch("time.sleep")
+    def test_wait_for_db_checks_every_alias(self, patched_sleep,
+                                            patched_check):
+        """Test every given alias is checked until it is up"""
+
+        down_once = {"replica"}
+
+        def check(databases):
+            if databases[0] in down_once:
+                down_once.discard(databases[0])
+                raise OperationalError
+
+        patched_check.side_effect = check
+        call_command("wait_for_db", databases=["default", "replica"],
+                     stdout=StringIO())
+
+        patched_check.assert_any_call(databases=["default"])
+        self.assertEqual(
+            patched_check.call_args_list.count(
+                ((), {"databases": ["replica"]})
+            ), 2,
+        )
+
+    def test_wait_for_db_backoff(self, patched_check):
+        """Test the backoff grows exponentially up to the cap"""
+
+        backoff = WaitForDbCommand.backoff
+        self.assertTrue(0.025 <= backoff(0, 0.05, 2) <= 0.05)
+        self.assertTrue(0.2 <= backoff(3, 0.05, 2) <= 0.4)
+        self.assertTrue(1 <= backoff(20, 0.05, 2) <= 2)
+
+
+class ImportUsersCommandTests(TestCase):
+    """Test the `import_users` command"""
+
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def write_file(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, "w") as stream:
+            stream.write(content)
+        return path
+
+    def test_import_jsonl(self):
+        """Test users are imported from a JSONL file"""
+
+        rows = [
+            {"email": f"user{i}@EXAMPLE.com", "password": "password@321",
+             "name": f"User {i}"}
+            for i in range(5)
+        ]
+        path = self.write_file(
+            "users.jsonl", "\n".join(json.dumps(row) for row in rows)
+        )
+        out = StringIO()
+        call_command("import_users", path, batch_size=2, stdout=out)
+
+        users = get_user_model().objects.order_by("email")
+        self.assertEqual(users.count(), 5)
+        self.assertEqual(users[0].email, "user0@example.com")
+        self.assertTrue(users[0].check_password("password@321"))
+        self.assertIn("rows/s", out.getvalue())
+        self.assertFalse(os.path.exists(f"{path}.checkpoint"))
+
+    def test_import_csv_skips_existing_and_invalid(self):
+        """Test existing emails and rows without email are counted"""
+
+        get_user_model().objects.create_user("taken@example.com", "pass@123")
+        path = self.write_file(
+            "users.csv",
+            "email,password,name\n"
+            "new@example.com,password@321,\"New, User\"\n"
+            "taken@example.com,password@321,Taken\n"
+            ",password@321,No email\n",
+        )
+        out = StringIO()
+        call_command("import_users", path, stdout=out)
+
+        self.assertEqual(
+            get_user_model().objects.get(email="new@example.com").name,
+            "New, User",
+        )
+        self.assertIn("1 created, 1 already existed, 1 invalid",
+                      out.getvalue())
+
+    def test_import_counts_bad_rows_and_goes_on(self):
+        """Test lines that are not JSON and rows failing validation are
+        counted as invalid without stopping the import"""
+
+        path = self.write_file("users.jsonl", "\n".join([
+            json.dumps({"email": "one@example.com", "name": "One"}),
+            '{"email": "broken@example.com",',
+            json.dumps({"email": "long@example.com", "name": "x" * 256}),
+            json.dumps(["not", "an", "object"]),
+            json.dumps({"email": "two@example.com", "name": "Two"}),
+        ]))
+        out = StringIO()
+        call_command("import_users", path, batch_size=2, stdout=out)
+
+        self.assertEqual(
+            sorted(get_user_model().objects.values_list("email", flat=True)),
+            ["one@example.com", "two@example.com"],
+        )
+        self.assertIn("2 created, 0 already existed, 3 invalid",
+                      out.getvalue())
+
+    def test_import_hashes_on_worker_pool(self):
+        """Test passwords are hashed on a pool of `--workers` processes"""
+
+        self.addCleanup(setattr, hashing, "_batch_service", None)
+        rows = [
+            {"email": f"user{i}@example.com", "password": "password@321",
+             "name": f"User {i}"}
+            for i in range(3)
+        ]
+        path = self.write_file(
+            "users.jsonl", "\n".join(json.dumps(row) for row in rows)
+        )
+
+        call_command("import_users", path, workers=2, stdout=StringIO())
+        pool = hashing.get_batch_hashing_service()
+        self.addCleanup(pool._executor.shutdown)
+
+        self.assertEqual(pool.workers, 2)
+        self.assertEqual(pool.metrics()["completed"], 3)
+        user = get_user_model().objects.get(email="user2@example.com")
+        self.assertTrue(user.check_password("password@321"))
+
+    def test_import_resumes_from_checkpoint(self):
+        """Test rows before the checkpointed offset are not read again"""
+
+        lines = [
+            json.dumps({"email": f"user{i}@example.com", "name": str(i)})
+            for i in range(4)
+        ]
+        path = self.write_file("users.jsonl", "\n".join(lines) + "\n")
+        offset = len(lines[0]) + len(lines[1]) + 2
+        with open(f"{path}.checkpoint", "w") as checkpoint:
+            json.dump({"offset": offset, "rows": 2, "created": 2,
+                       "existing": 0, "invalid": 0}, checkpoint)
+
+        call_command("import_users", path, stdout=StringIO())
+
+        self.assertEqual(
+            sorted(get_user_model().objects.values_list("name", flat=True)),
+            ["2", "3"],
+        )
+
+
+class WaitForDbWarmUpTests(TestCase):
+    """Test the `wait_for_db --warm-up` phase"""
+
+    def test_warm_up_runs_hot_queries(self):
+        """Test warm-up runs the user and token queries of every alias"""
+
+        out = StringIO()
+        with self.assertNumQueries(3):
+            call_command("wait_for_db", warm_up=True, stdout=out)
+
+        self.assertIn("default: ran 3 warm-up queries", out.getvalue())
+
+    def test_warm_up_login_query_uses_email_index(self):
+        """Test the login warm-up query is the `LOWER(email)` lookup of
+        `get_by_natural_key`, the one the functional index serves"""
+
+        login = str(hot_queries("default")[0].query)
+
+        self.assertIn("WHERE LOWER(", login)
@@ -0,0 +1,125 @@
+"""
+Tests for the streaming user export
+"""
+
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.export import accepts_gzip, export_users
+
+
+class AcceptsGzipTests(SimpleTestCase):
+    """Test `Accept-Encoding` negotiation of the export"""
+
+    def test_accepts_gzip(self):
+        """Test gzip is used only when allowed with a q-value above 0"""
+
+        for header, expected in [
+            ("gzip", True),
+            ("deflate, gzip;q=0.5", True),
+            ("*", True),
+            ("", False),
+            ("gzip;q=0", False),
+            ("gzip;q=0.0, br", False),
+            ("*;q=0.1, gzip;q=0", False),
+            ("identity", False),
+        ]:
+            self.assertEqual(accepts_gzip(header), expected, header)
+
+
+class ExportTests(TestCase):
+    """Test exporting users as NDJSON / CSV"""
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="password@321", name="User"
+        )
+        self.admin = get_user_model().objects.create_superuser(
+            email="admin@example.com", password="adminpass@123"
+        )
+
+    def test_export_ndjson(self):
+        """Test every user is written as one JSON line without password"""
+
+        body = b"".join(export_users("ndjson", chunk_size=1))
+        rows = [json.loads(line) for line in body.splitlines()]
+
+        self.assertEqual([row["email"] for row in rows],
+                         ["user@example.com", "admin@example.com"])
+        self.assertNotIn("password", rows[0])
+        self.assertTrue(rows[1]["is_staff"])
+
+    def test_export_csv_gzip(self):
+        """Test CSV output is compressed into one valid gzip stream"""
+
+        body = gzip.decompress(b"".join(export_users("csv", compress=True)))
+        rows = list(csv.DictReader(io.StringIO(body.decode())))
+
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]["name"], "User")
+
+    def test_export_command_to_file(self):
+        """Test the command writes the export to a file"""
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "users.ndjson.gz")
+            call_command("export_users", output=path, gzip=True,
+                         stdout=io.StringIO())
+            with gzip.open(path) as export:
+                self.assertEqual(len(export.read().splitlines()), 2)
+
+    def test_export_endpoint_staff_only(self):
+        """Test only staff can stream the export"""
+
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        res = client.get(reverse("export"))
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_export_endpoint_streams_gzip(self):
+        """Test the endpoint honours Accept-Encoding: gzip"""
+
+        client = APIClient()
+        client.force_authenticate(user=self.admin)
+        res = client.get(reverse("export"), {"type": "csv"},
+                         HTTP_ACCEPT_ENCODING="gzip")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        self.assertEqual(res["Content-Encoding"], "gzip")
+        body = gzip.decompress(b"".join(res.streaming_content)).decode()
+        self.assertIn("user@example.com", body)
+
+    def test_export_endpoint_gzip_refused(self):
+        """Test `gzip;q=0` gets an uncompressed body"""
+
+        client = APIClient()
+        client.force_authenticate(user=self.admin)
+        res = client.get(reverse("export"), HTTP_ACCEPT_ENCODING="gzip;q=0")
+
+        self.assertNotIn("Content-Encoding", res)
+        self.assertIn(b"user@example.com", b"".join(res.streaming_content))
+
+    async def test_export_endpoint_wsgi_only(self):
+        """Test the endpoint refuses ASGI requests instead of querying on
+        the event loop"""
+
+        token = await Token.objects.acreate(user=self.admin)
+        res = await self.async_client.get(
+            reverse("export"), AUTHORIZATION=f"Token {token.key}"
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_501_NOT_IMPLEMENTED)
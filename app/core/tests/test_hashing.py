@@ -0,0 +1,130 @@
+"""
+Tests for the password hashing service
+"""
+
+import os
+import time
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import check_password
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import hashing
+from core.hashing import HashingBusy, HashingService
+
+
+def slow_hash_with_pid(raw_password):
+    """stands in for `_make_password` in the pool processes"""
+
+    time.sleep(0.3)
+    return str(os.getpid())
+
+
+class HashingServiceTests(SimpleTestCase):
+    """Tests for `core.hashing.HashingService`"""
+
+    def test_inline_hash_and_check(self):
+        """Test hashing without workers runs on the calling thread"""
+
+        service = HashingService(workers=0, max_pending=2, queue_timeout=0)
+        encoded = service.make_password("password@321")
+
+        self.assertTrue(check_password("password@321", encoded))
+        self.assertEqual(service.check_password("password@321", encoded),
+                         (True, False))
+        self.assertEqual(service.check_password("wrong", encoded)[0], False)
+        self.assertEqual(service.metrics()["completed"], 3)
+
+    def test_process_pool_hash_and_check(self):
+        """Test hashing on a worker process"""
+
+        service = HashingService(workers=1, max_pending=2, queue_timeout=5)
+        encoded = service.make_password("password@321")
+
+        self.assertTrue(check_password("password@321", encoded))
+        self.assertTrue(service.check_password("password@321", encoded)[0])
+        self.assertGreater(service.metrics()["hash_seconds_total"], 0)
+
+    def test_full_queue_raises_busy(self):
+        """Test callers get `HashingBusy` once every slot is taken"""
+
+        service = HashingService(workers=0, max_pending=1, queue_timeout=0)
+        service._slots.acquire()
+
+        with self.assertRaises(HashingBusy):
+            service.make_password("password@321")
+        self.assertEqual(service.metrics()["rejected"], 1)
+
+    def test_unusable_password_not_queued(self):
+        """Test unusable hashes are rejected without hashing"""
+
+        service = HashingService(workers=0, max_pending=1, queue_timeout=0)
+
+        self.assertEqual(service.check_password("x", "!unusable"),
+                         (False, False))
+        self.assertEqual(service.metrics()["submitted"], 0)
+
+
+class BatchHashingTests(SimpleTestCase):
+    """Tests batches of `core.hashing.make_passwords`"""
+
+    def setUp(self) -> None:
+        self.addCleanup(setattr, hashing, "_batch_service", None)
+        self.addCleanup(self.stop_batch_pool)
+        hashing._batch_service = None
+
+    @staticmethod
+    def stop_batch_pool():
+        if hashing._batch_service and hashing._batch_service._executor:
+            hashing._batch_service._executor.shutdown()
+
+    @patch("os.cpu_count", return_value=4)
+    @patch("core.hashing._make_password", slow_hash_with_pid)
+    def test_batch_hashed_in_parallel(self, patched_cpu_count):
+        """Test a batch is hashed on one process per CPU at once with the
+        default settings (inline request hashing)"""
+
+        self.assertEqual(hashing.get_hashing_service().workers, 0)
+
+        started = time.monotonic()
+        pids = hashing.make_passwords([f"password{i}" for i in range(8)])
+        elapsed = time.monotonic() - started
+
+        self.assertEqual(len(pids), 8)
+        self.assertGreater(len(set(pids)), 1)
+        self.assertNotIn(str(os.getpid()), pids)
+        # 8 hashes of 0.3s, 4 at a time
+        self.assertLess(elapsed, 8 * 0.3 / 2)
+        self.assertEqual(hashing.get_batch_hashing_service().workers, 4)
+
+    @patch("core.hashing.hash_seconds", return_value=0.2)
+    def test_batch_capacity(self, patched_hash_seconds):
+        """Test the capacity grows with the time and the pool size"""
+
+        hashing.configure_batch(4)
+
+        self.assertEqual(hashing.batch_capacity(15), 300)
+        self.assertEqual(hashing.batch_capacity(0.1), 4)
+
+
+class HashingBusyApiTests(TestCase):
+    """Tests the user API when the hashing queue is saturated"""
+
+    @patch("core.hashing.make_password", side_effect=HashingBusy)
+    def test_create_user_busy_returns_503(self, patched_make_password):
+        """Test a saturated hashing queue returns 503 with Retry-After"""
+
+        payload = {
+            "email": "test@example.com",
+            "password": "password@321",
+            "name": "Test Name"
+        }
+        res = APIClient().post(reverse("create"), payload)
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(res["Retry-After"], "1")
+        self.assertFalse(get_user_model().objects.exists())
@@ -0,0 +1,234 @@
+"""
+Tests for the request instrumentation
+"""
+
+import json
+import os
+import re
+import tempfile
+import time
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import instrumentation
+from core.instrumentation import RequestTimings, timed
+
+
+def server_timing(response):
+    """`Server-Timing` durations by name, and the SQL description"""
+
+    header = response["Server-Timing"]
+    durations = {
+        name: float(duration)
+        for name, duration in re.findall(r"(\w+);dur=([\d.]+)", header)
+    }
+    return durations, re.search(r'desc="(\d+) queries"', header).group(1)
+
+
+class TimedTests(SimpleTestCase):
+    """Test phase timing"""
+
+    def test_nested_phases_not_counted_twice(self):
+        """Test a phase's time excludes the phases nested in it"""
+
+        timings = RequestTimings()
+        token = instrumentation._timings.set(timings)
+        try:
+            with timed("serializer"):
+                time.sleep(0.01)
+                with timed("hash"):
+                    time.sleep(0.02)
+        finally:
+            instrumentation._timings.reset(token)
+
+        self.assertGreaterEqual(timings.phases["hash"], 0.02)
+        self.assertGreaterEqual(timings.phases["serializer"], 0.01)
+        self.assertLess(timings.phases["serializer"], 0.02)
+
+    def test_no_timing_outside_requests(self):
+        """Test timed blocks outside a request are a no-op"""
+
+        with timed("sql"):
+            pass
+
+
+class InstrumentationMiddlewareTests(TestCase):
+    """Test the Server-Timing header and the /metrics endpoint"""
+
+    def setUp(self) -> None:
+        self.metrics_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.metrics_dir.cleanup)
+        settings = override_settings(METRICS={
+            "DIR": self.metrics_dir.name, "FLUSH_INTERVAL": 0,
+            "ALLOWED_IPS": ["127.0.0.1"], "TOKEN": "scrape",
+            "SERVER_TIMING": True,
+        })
+        settings.enable()
+        self.addCleanup(settings.disable)
+        instrumentation._stores.clear()
+        self.addCleanup(instrumentation._stores.clear)
+
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="password@321", name="User"
+        )
+        self.client = APIClient()
+
+    def test_token_request_breakdown(self):
+        """Test a token request reports SQL, hash and serializer time"""
+
+        res = self.client.post(reverse("token"), {
+            "email": "user@example.com", "password": "password@321",
+        })
+        durations, queries = server_timing(res)
+
+        self.assertGreater(int(queries), 0)
+        self.assertGreater(durations["hash"], 0)
+        self.assertGreater(durations["serializer"], 0)
+        self.assertGreaterEqual(
+            durations["total"],
+            durations["sql"] + durations["hash"] + durations["serializer"],
+        )
+
+    def test_no_server_timing_by_default(self):
+        """Test the breakdown is not sent unless DEBUG or
+        `SERVER_TIMING`"""
+
+        with override_settings(METRICS={"DIR": self.metrics_dir.name,
+                                        "FLUSH_INTERVAL": 0}):
+            res = self.client.post(reverse("token"), {
+                "email": "user@example.com", "password": "password@321",
+            })
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn("Server-Timing", res)
+
+    def test_metrics_restricted(self):
+        """Test /metrics is refused to other addresses unless staff or with
+        the scrape token"""
+
+        url = reverse("metrics")
+        outside = {"REMOTE_ADDR": "10.0.0.1"}
+
+        self.assertEqual(self.client.get(url, **outside).status_code, 403)
+        self.assertEqual(
+            self.client.get(url, HTTP_AUTHORIZATION="Bearer wrong",
+                            **outside).status_code,
+            403,
+        )
+        self.assertEqual(
+            self.client.get(url, HTTP_AUTHORIZATION="Bearer scrape",
+                            **outside).status_code,
+            200,
+        )
+        staff = get_user_model().objects.create_superuser(
+            email="admin@example.com", password="password@321"
+        )
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(url, **outside).status_code, 200)
+
+    def test_metrics_aggregate_processes(self):
+        """Test /metrics sums the histograms written by every process"""
+
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+        self.client.get(reverse("me"))
+
+        # another worker process that served one slow `me` request
+        other = {"routes": {"me": {
+            "buckets": [0] * 10 + [1], "count": 1, "sum": 7.5,
+            "queries": 2, "phases": {"sql": 0.5, "hash": 0.0,
+                                     "serializer": 0.0},
+        }}}
+        path = os.path.join(self.metrics_dir.name, "metrics-1.json")
+        with open(path, "w") as other_file:
+            json.dump(other, other_file)
+
+        body = self.client.get(reverse("metrics")).content.decode()
+
+        self.assertIn(
+            'app_request_duration_seconds_count{route="me"} 2', body
+        )
+        self.assertIn(
+            'app_request_duration_seconds_bucket{route="me",le="+Inf"} 2',
+            body,
+        )
+        self.assertRegex(
+            body, r'app_request_sql_queries_total\{route="me"\} [3-9]'
+        )
+
+    def test_metrics_serve_collectors(self):
+        """Test registered collectors are served per process"""
+
+        instrumentation.register_collector(
+            "test_pool", lambda: {"db": {"in_use": 2, "wait": 0.5}},
+            label="alias",
+        )
+        self.addCleanup(instrumentation._collectors.pop, "test_pool")
+
+        body = self.client.get(reverse("metrics")).content.decode()
+
+        process = f'process="{os.getpid()}"'
+        self.assertIn(f'app_test_pool_in_use{{{process},alias="db"}} 2',
+                      body)
+        self.assertIn(f'app_test_pool_wait{{{process},alias="db"}} 0.5',
+                      body)
+        # the password hashing queue registers itself
+        self.assertIn(f"app_password_hashing_pending{{{process}}} 0", body)
+
+
+class MetricsStoreTests(SimpleTestCase):
+    """Test the per-process metrics files"""
+
+    def setUp(self) -> None:
+        self.metrics_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.metrics_dir.cleanup)
+
+    def observe(self, store, seconds):
+        timings = RequestTimings()
+        timings.queries = 1
+        store.observe("me", timings, seconds)
+
+    def test_flushed_by_thread(self):
+        """Test requests do not write the file, the flush thread does"""
+
+        store = instrumentation.MetricsStore(self.metrics_dir.name, 0.05)
+        self.observe(store, 0.01)
+
+        self.assertFalse(os.path.exists(store.path))
+        for _ in range(100):
+            if os.path.exists(store.path):
+                break
+            time.sleep(0.01)
+        with open(store.path) as process_file:
+            self.assertEqual(
+                json.load(process_file)["routes"]["me"]["count"], 1
+            )
+        # park the thread before the directory is removed
+        store.flush_interval = 3600
+        time.sleep(0.1)
+
+    def test_retire_process(self):
+        """Test an exited process's routes are kept and its file
+        removed"""
+
+        store = instrumentation.MetricsStore(self.metrics_dir.name, 0)
+        for pid in (1, 2):
+            store.path = os.path.join(
+                self.metrics_dir.name, f"metrics-{pid}.json"
+            )
+            store.routes = {}
+            self.observe(store, 0.01)
+            instrumentation.retire_process(self.metrics_dir.name, pid)
+            self.assertFalse(os.path.exists(store.path))
+
+        store.path = os.path.join(self.metrics_dir.name, "metrics-3.json")
+        store.routes = {}
+        self.assertEqual(store.aggregate()["me"]["count"], 2)
+        self.assertEqual(
+            sorted(os.listdir(self.metrics_dir.name)),
+            ["metrics-3.json", "metrics-exited.json"],
+        )
@@ -0,0 +1,83 @@
+"""
+Tests for the browser-only middleware and the startup benchmark
+"""
+
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import AsyncClient, TestCase
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+
+class WebOnlyMiddlewareTests(TestCase):
+    """Test API requests skip the session, CSRF, messages and XFrame
+    middleware while browser pages keep them"""
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(
+            email="test@example.com", password="password@321"
+        )
+        self.token = Token.objects.create(user=self.user)
+
+    def test_api_request(self):
+        """Test an API response carries no browser headers or cookies"""
+
+        self.client.force_login(self.user)
+        res = self.client.get(
+            reverse("me"), HTTP_AUTHORIZATION=f"Token {self.token.key}"
+        )
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn("X-Frame-Options", res.headers)
+        self.assertNotIn("Cookie", res.headers.get("Vary", ""))
+        self.assertFalse(res.cookies)
+        self.assertFalse(hasattr(res.wsgi_request, "session"))
+
+    def test_api_post_without_csrf_token(self):
+        """Test API writes are not subject to the CSRF check"""
+
+        self.client.handler.enforce_csrf_checks = True
+        res = self.client.post(
+            reverse("token"),
+            {"email": "test@example.com", "password": "password@321"},
+        )
+
+        self.assertEqual(res.status_code, 200)
+
+    def test_browser_request(self):
+        """Test pages outside the API still get the browser middleware"""
+
+        res = self.client.get(reverse("admin:login"))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers["X-Frame-Options"], "DENY")
+        self.assertIn("csrftoken", res.cookies)
+        self.assertTrue(hasattr(res.wsgi_request, "session"))
+
+    async def test_async_requests(self):
+        """Test the bypass under the ASGI handler"""
+
+        client = AsyncClient()
+        api = await client.get(
+            reverse("me"), AUTHORIZATION=f"Token {self.token.key}"
+        )
+        page = await client.get(reverse("ready"))
+
+        self.assertEqual(api.status_code, 200)
+        self.assertNotIn("X-Frame-Options", api.headers)
+        self.assertEqual(page.headers["X-Frame-Options"], "DENY")
+
+
+class BenchmarkStartupTests(TestCase):
+    """Test the `benchmark_startup` command"""
+
+    def test_profiles(self):
+        """Test a fresh worker boots under each profile"""
+
+        out = StringIO()
+        call_command("benchmark_startup", repeat=1, stdout=out)
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[0] for line in lines], ["full", "api"])
@@ -0,0 +1,134 @@
+"""
+Tests for the cached permissions backend
+"""
+
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import caches
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.permissions import CACHE_ALIAS
+
+
+class CachedModelBackendTests(TestCase):
+    """Test permission sets are cached and invalidated"""
+
+    def setUp(self) -> None:
+        caches[CACHE_ALIAS].clear()
+        self.view_user = Permission.objects.get(codename="view_user")
+        self.change_user = Permission.objects.get(codename="change_user")
+        self.group = Group.objects.create(name="support")
+        self.group.permissions.add(self.view_user)
+        self.user = get_user_model().objects.create_user(
+            email="staff@example.com", password="password@321"
+        )
+        self.user.is_staff = True
+        self.user.save()
+        self.user.groups.add(self.group)
+
+    def fresh_user(self):
+        """a new user object, as loaded by the next request"""
+
+        return get_user_model().objects.get(pk=self.user.pk)
+
+    def test_permissions_cached(self):
+        """Test a warm user's permission checks run no query"""
+
+        self.assertTrue(self.fresh_user().has_perm("core.view_user"))
+
+        user = self.fresh_user()
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_perm("core.view_user"))
+            self.assertFalse(user.has_perm("core.change_user"))
+            self.assertTrue(user.has_module_perms("core"))
+
+    def test_group_permission_change(self):
+        """Test adding a permission to a group reaches its users"""
+
+        self.assertFalse(self.fresh_user().has_perm("core.change_user"))
+        self.group.permissions.add(self.change_user)
+
+        self.assertTrue(self.fresh_user().has_perm("core.change_user"))
+
+    def test_permission_group_set_clear(self):
+        """Test clearing a permission's groups from the permission side"""
+
+        self.assertTrue(self.fresh_user().has_perm("core.view_user"))
+        self.view_user.group_set.clear()
+
+        self.assertFalse(self.fresh_user().has_perm("core.view_user"))
+
+    def test_user_groups_change(self):
+        """Test removing the user from the group, from either side"""
+
+        self.assertTrue(self.fresh_user().has_perm("core.view_user"))
+        self.group.user_set.clear()
+        self.assertFalse(self.fresh_user().has_perm("core.view_user"))
+
+        self.user.groups.add(self.group)
+        self.assertTrue(self.fresh_user().has_perm("core.view_user"))
+
+    def test_user_permissions_change(self):
+        """Test direct user permissions, added from the permission side"""
+
+        self.assertFalse(self.fresh_user().has_perm("core.change_user"))
+        self.change_user.user_set.add(self.user)
+
+        self.assertTrue(self.fresh_user().has_perm("core.change_user"))
+
+    def test_group_delete(self):
+        """Test deleting a group drops its users' permissions"""
+
+        self.assertTrue(self.fresh_user().has_perm("core.view_user"))
+        self.group.delete()
+
+        self.assertFalse(self.fresh_user().has_perm("core.view_user"))
+
+    def test_revoked_during_load(self):
+        """Test sets loaded before a revocation are not served after it"""
+
+        load = ModelBackend._get_permissions
+
+        def load_then_revoke(backend, user_obj, obj, from_name):
+            perms = load(backend, user_obj, obj, from_name)
+            if from_name == "group":
+                # committed by another request while this one loads
+                self.group.permissions.remove(self.view_user)
+            return perms
+
+        with patch.object(ModelBackend, "_get_permissions", load_then_revoke):
+            self.assertTrue(self.fresh_user().has_perm("core.view_user"))
+
+        self.assertFalse(self.fresh_user().has_perm("core.view_user"))
+
+    def test_deactivated_user(self):
+        """Test an inactive user has no permissions"""
+
+        self.assertTrue(self.fresh_user().has_perm("core.view_user"))
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertFalse(self.fresh_user().has_perm("core.view_user"))
+
+    def test_admin_without_permission_queries(self):
+        """Test staff admin pages stop querying permissions once warm"""
+
+        client = Client()
+        client.force_login(self.user)
+        url = reverse("admin:core_user_changelist")
+        client.get(url)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = client.get(url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertFalse(
+            [query["sql"] for query in queries
+             if "auth_permission" in query["sql"]]
+        )
@@ -0,0 +1,187 @@
+"""
+Tests for the pooled MySQL backend
+"""
+
+import threading
+from unittest.mock import MagicMock, patch
+
+from django.db import DatabaseError
+from django.test import SimpleTestCase
+
+from core.backends.mysql_pool import base
+from core.backends.mysql_pool.pool import ConnectionPool, PoolTimeout
+from core.instrumentation import collect
+
+
+class FakeConnection:
+    def __init__(self):
+        self.alive = True
+        self.closed = False
+        self.pings = 0
+
+    def ping(self):
+        self.pings += 1
+        if not self.alive:
+            raise OSError("gone away")
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """Test `ConnectionPool`"""
+
+    def make_pool(self, **kwargs):
+        self.opened = []
+
+        def connect():
+            self.opened.append(FakeConnection())
+            return self.opened[-1]
+
+        return ConnectionPool(connect, **kwargs)
+
+    def test_connections_are_reused(self):
+        """Test a returned connection is handed out again"""
+
+        pool = self.make_pool(max_size=2)
+        first, reused = pool.getconn()
+        self.assertFalse(reused)
+        pool.putconn(first)
+        second, reused = pool.getconn()
+
+        self.assertIs(first, second)
+        self.assertTrue(reused)
+        self.assertEqual(len(self.opened), 1)
+
+    def test_min_size_opened_on_first_checkout(self):
+        """Test the first checkout opens `min_size` connections"""
+
+        pool = self.make_pool(min_size=3, max_size=5)
+        pool.getconn()
+
+        self.assertEqual(len(self.opened), 3)
+        self.assertEqual(pool.metrics()["idle"], 2)
+
+    def test_checkout_times_out_when_exhausted(self):
+        """Test checkouts beyond `max_size` wait, then raise"""
+
+        pool = self.make_pool(max_size=1, timeout=0.05)
+        pool.getconn()
+
+        with self.assertRaises(PoolTimeout):
+            pool.getconn()
+        metrics = pool.metrics()
+        self.assertEqual(metrics["timeouts"], 1)
+        self.assertEqual(metrics["size"], 1)
+
+    def test_waiting_checkout_gets_returned_connection(self):
+        """Test a waiting checkout receives a connection returned
+        meanwhile"""
+
+        pool = self.make_pool(max_size=1, timeout=5)
+        connection, _ = pool.getconn()
+        timer = threading.Timer(0.05, pool.putconn, [connection])
+        timer.start()
+
+        self.assertIs(pool.getconn()[0], connection)
+        timer.join()
+        self.assertGreater(pool.metrics()["wait_seconds_p99"], 0)
+
+    def test_dead_connection_replaced_on_checkout(self):
+        """Test an idle connection failing its ping is replaced"""
+
+        pool = self.make_pool(check_idle=0)
+        connection, _ = pool.getconn()
+        pool.putconn(connection)
+        connection.alive = False
+
+        replacement, reused = pool.getconn()
+
+        self.assertIsNot(replacement, connection)
+        self.assertFalse(reused)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.metrics()["discarded"], 1)
+
+    def test_recently_used_connection_not_pinged(self):
+        """Test no ping is sent for a connection idle less than
+        `check_idle`"""
+
+        pool = self.make_pool(check_idle=60)
+        connection, _ = pool.getconn()
+        pool.putconn(connection)
+        pool.getconn()
+
+        self.assertEqual(connection.pings, 0)
+
+    def test_expired_connection_closed(self):
+        """Test connections older than `max_lifetime` are not reused"""
+
+        pool = self.make_pool(max_lifetime=0)
+        connection, _ = pool.getconn()
+        pool.putconn(connection)
+
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.metrics()["size"], 0)
+
+    def test_discard(self):
+        """Test a discarded connection frees its slot"""
+
+        pool = self.make_pool(max_size=1, timeout=0)
+        connection, _ = pool.getconn()
+        pool.putconn(connection, discard=True)
+
+        self.assertTrue(connection.closed)
+        self.assertIsNot(pool.getconn()[0], connection)
+
+
+class PooledBackendTests(SimpleTestCase):
+    """Test the `mysql_pool` database wrapper"""
+
+    settings_dict = {
+        "ENGINE": "core.backends.mysql_pool", "NAME": "db", "USER": "",
+        "PASSWORD": "", "HOST": "", "PORT": "", "OPTIONS": {},
+        "TIME_ZONE": None, "CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": False,
+        "AUTOCOMMIT": True, "POOL": {"MAX_SIZE": 1, "TIMEOUT": 0},
+    }
+
+    def setUp(self) -> None:
+        base._pools.clear()
+        self.addCleanup(base._pools.clear)
+
+    def make_wrapper(self):
+        return base.DatabaseWrapper(dict(self.settings_dict), alias="pooled")
+
+    @patch.object(base.mysql.DatabaseWrapper, "init_connection_state")
+    @patch.object(base.Database, "connect")
+    def test_close_returns_connection_to_pool(self, patched_connect,
+                                              patched_init):
+        """Test a closed connection is reused by another wrapper without
+        running the session setup again"""
+
+        patched_connect.side_effect = lambda **params: MagicMock()
+        wrapper = self.make_wrapper()
+        wrapper.ensure_connection()
+        raw = wrapper.connection
+        wrapper.close()
+
+        other = self.make_wrapper()
+        other.ensure_connection()
+        self.assertIs(other.connection, raw)
+        self.assertEqual(patched_connect.call_count, 1)
+        self.assertEqual(patched_init.call_count, 1)
+        raw.close.assert_not_called()
+        self.assertEqual(base.pool_metrics()["pooled"]["checkouts"], 2)
+        # and served by `/metrics`
+        self.assertEqual(
+            collect()["db_pool"]["values"]["pooled"]["checkouts"], 2
+        )
+
+    @patch.object(base.Database, "connect")
+    def test_exhausted_pool_raises_database_error(self, patched_connect):
+        """Test a checkout timeout surfaces as a database error"""
+
+        patched_connect.side_effect = lambda **params: MagicMock()
+        self.make_wrapper().get_new_connection({})
+
+        with self.assertRaises(DatabaseError):
+            self.make_wrapper().ensure_connection()
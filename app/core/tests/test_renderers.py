@@ -0,0 +1,59 @@
+"""
+Tests for the orjson renderer and parser
+"""
+
+import datetime
+import decimal
+import io
+import uuid
+
+from django.test import SimpleTestCase
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from core.parsers import ORJSONParser
+from core.renderers import ORJSONRenderer
+
+
+class ORJSONTests(SimpleTestCase):
+    """Test orjson output matches DRF's JSON classes"""
+
+    data = {
+        "email": "user@example.com",
+        "name": "Ünïcode \u2028 line \u2029 paragraph",
+        "ok": True,
+        "count": 3,
+        1: None,
+        "price": decimal.Decimal("9.99"),
+        "id": uuid.UUID("12345678-1234-5678-1234-567812345678"),
+        "at": datetime.datetime(2023, 1, 2, 3, 4, 5, 6000,
+                                tzinfo=datetime.timezone.utc),
+        "lazy": gettext_lazy("lazy text"),
+        "items": [{"a": 1.5}],
+    }
+
+    def test_same_bytes_as_json_renderer(self):
+        """Test compact output is byte for byte DRF's"""
+
+        self.assertEqual(ORJSONRenderer().render(self.data),
+                         JSONRenderer().render(self.data))
+
+    def test_indent_falls_back(self):
+        """Test indented output is rendered by DRF"""
+
+        media_type = "application/json; indent=4"
+        self.assertEqual(
+            ORJSONRenderer().render(self.data, media_type),
+            JSONRenderer().render(self.data, media_type),
+        )
+
+    def test_parse(self):
+        """Test parsing matches DRF's parser and rejects bad JSON"""
+
+        body = JSONRenderer().render(self.data)
+        self.assertEqual(ORJSONParser().parse(io.BytesIO(body)),
+                         JSONParser().parse(io.BytesIO(body)))
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(io.BytesIO(b"{bad"))
@@ -0,0 +1,168 @@
+"""
+Tests for read-replica routing
+"""
+
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from core import routers
+
+REPLICA_ROUTING = {
+    "REPLICAS": ["replica1", "replica2"],
+    "STICKY_SECONDS": 5,
+    "MAX_LAG": 2,
+}
+
+
+@override_settings(REPLICA_ROUTING=REPLICA_ROUTING)
+class ReplicaRoutingTests(SimpleTestCase):
+    """Test `ReplicaRouter` and `replica_routing_middleware`"""
+
+    def setUp(self) -> None:
+        routers._monitors.clear()
+        cache.clear()
+        self.addCleanup(routers._monitors.clear)
+        self.addCleanup(cache.clear)
+        self.router = routers.ReplicaRouter()
+        self.factory = RequestFactory()
+        self.lags = {"replica1": 0.0, "replica2": 0.0}
+        patcher = patch("core.routers.measure_lag", self.lags.get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def view(self, write=False):
+        """a view recording where its reads would go"""
+
+        def get_response(request):
+            if write:
+                self.router.db_for_write(get_user_model())
+            self.read_db = self.router.db_for_read(get_user_model())
+            return HttpResponse()
+
+        return get_response
+
+    def call(self, request, write=False):
+        routers.replica_routing_middleware(self.view(write))(request)
+        return self.read_db
+
+    def test_no_routing_outside_requests(self):
+        """Test the router leaves reads outside a request to Django"""
+
+        self.assertIsNone(self.router.db_for_read(get_user_model()))
+        self.assertEqual(self.router.db_for_write(get_user_model()),
+                         "default")
+
+    def test_safe_api_reads_use_replica(self):
+        """Test a GET on the user API reads from a replica"""
+
+        read_db = self.call(self.factory.get("/api/user/me/"))
+        self.assertIn(read_db, REPLICA_ROUTING["REPLICAS"])
+
+    def test_other_requests_use_primary(self):
+        """Test unsafe methods and other paths read from the primary"""
+
+        self.assertEqual(self.call(self.factory.patch("/api/user/me/")),
+                         "default")
+        self.assertEqual(self.call(self.factory.get("/admin/")), "default")
+
+    def test_reads_after_write_in_request_use_primary(self):
+        """Test a request reads its own writes"""
+
+        read_db = self.call(self.factory.get("/api/user/me/"), write=True)
+        self.assertEqual(read_db, "default")
+
+    def test_client_sticks_to_primary_after_write(self):
+        """Test reads of a client that just wrote go to the primary"""
+
+        headers = {"HTTP_AUTHORIZATION": "Token abc",
+                   "REMOTE_ADDR": "10.0.0.1"}
+        self.call(self.factory.patch("/api/user/me/", **headers), write=True)
+
+        self.assertEqual(
+            self.call(self.factory.get("/api/user/me/", **headers)),
+            "default",
+        )
+        # another client, even behind the same address, still uses the
+        # replicas
+        self.assertNotEqual(
+            self.call(self.factory.get(
+                "/api/user/me/", HTTP_AUTHORIZATION="Token xyz",
+                REMOTE_ADDR="10.0.0.1",
+            )),
+            "default",
+        )
+
+    def test_issued_credentials_stick_to_primary(self):
+        """Test a token issued by a writing request is read back from the
+        primary"""
+
+        def issue_token(request):
+            self.router.db_for_write(get_user_model())
+            routers.stick_credentials("Token new")
+            return HttpResponse()
+
+        routers.replica_routing_middleware(issue_token)(
+            self.factory.post("/api/user/token/")
+        )
+
+        self.assertEqual(
+            self.call(self.factory.get("/api/user/me/",
+                                       HTTP_AUTHORIZATION="Token new")),
+            "default",
+        )
+        # anonymous clients are never sticky
+        self.assertNotEqual(self.call(self.factory.get("/api/user/me/")),
+                            "default")
+
+    def test_lagging_replicas_skipped(self):
+        """Test replicas over `MAX_LAG` or not replicating get no reads"""
+
+        self.lags.update(replica1=30.0, replica2=None)
+        self.assertEqual(self.call(self.factory.get("/api/user/me/")),
+                         "default")
+
+        routers._monitors.clear()
+        self.lags.update(replica2=1.0)
+        self.assertEqual(self.call(self.factory.get("/api/user/me/")),
+                         "replica2")
+
+    def test_replica_choice_weighted_by_lag(self):
+        """Test a lower lag replica receives more reads"""
+
+        monitor = routers.ReplicaMonitor(["replica1", "replica2"], 10, 60)
+        self.lags.update(replica1=0.0, replica2=9.0)
+        monitor.refresh()
+
+        with patch("random.choices", wraps=routers.random.choices) as spy:
+            monitor.choose()
+        self.assertEqual(spy.call_args.args[1], [1.0, 0.1])
+
+    async def test_async_requests(self):
+        """Test the async middleware routes and sticks the same way"""
+
+        async def get_response(request):
+            if request.method == "PATCH":
+                self.router.db_for_write(get_user_model())
+            self.read_db = self.router.db_for_read(get_user_model())
+            return HttpResponse()
+
+        middleware = routers.replica_routing_middleware(get_response)
+        await middleware(self.factory.get("/api/user/me/"))
+        self.assertNotEqual(self.read_db, "default")
+
+        auth = {"HTTP_AUTHORIZATION": "Token abc"}
+        await middleware(self.factory.patch("/api/user/me/", **auth))
+        await middleware(self.factory.get("/api/user/me/", **auth))
+        self.assertEqual(self.read_db, "default")
+
+    @override_settings(REPLICA_ROUTING={})
+    def test_middleware_unused_without_replicas(self):
+        """Test the middleware drops out when no replica is configured"""
+
+        with self.assertRaises(MiddlewareNotUsed):
+            routers.replica_routing_middleware(self.view())
@@ -0,0 +1,96 @@
+"""
+Tests for the indexed user search
+"""
+
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.search import boolean_query, query_shape, search_users
+
+
+class SearchTests(TestCase):
+    """Test `search_users` and its admin / API integrations"""
+
+    def setUp(self) -> None:
+        self.admin = get_user_model().objects.create_superuser(
+            email="admin@example.com", password="adminpass@123"
+        )
+        create_user = get_user_model().objects.create_user
+        self.bob = create_user("bob.smith@example.com", "pass@123",
+                               name="Robert Smith")
+        self.alice = create_user("alice@example.com", "pass@123",
+                                 name="Alice Bobson")
+        self.carol = create_user("carol@other.com", "pass@123",
+                                 name="Carol Jones")
+
+    def search(self, term):
+        queryset = get_user_model().objects.order_by("id")
+        return list(search_users(queryset, term))
+
+    def test_query_shapes(self):
+        """Test the query shape picked for each kind of input"""
+
+        self.assertEqual(query_shape("bob@example.com"), "email_exact")
+        self.assertEqual(query_shape("bob@exa"), "email_prefix")
+        self.assertEqual(query_shape("bo"), "email_prefix")
+        self.assertEqual(query_shape("bob"), "email_prefix_or_name")
+        self.assertEqual(query_shape("bob smith"), "name_fulltext")
+
+    def test_boolean_query_strips_operators(self):
+        """Test user input cannot inject full-text operators"""
+
+        self.assertEqual(boolean_query('bo-b "smith"*'), "+bo* +b* +smith*")
+
+    def test_search_by_email(self):
+        """Test exact and prefix email search"""
+
+        self.assertEqual(self.search("BOB.smith@example.com"), [self.bob])
+        self.assertEqual(self.search("carol@"), [self.carol])
+        self.assertEqual(self.search("al"), [self.alice])
+
+    def test_search_by_email_prefix_or_name(self):
+        """Test a single word matches email prefixes and names"""
+
+        self.assertEqual(self.search("bob"), [self.bob, self.alice])
+
+    def test_admin_search(self):
+        """Test the admin changelist uses the indexed search"""
+
+        client = Client()
+        client.force_login(self.admin)
+        res = client.get(reverse("admin:core_user_changelist"),
+                         {"q": "carol"})
+
+        self.assertContains(res, self.carol.email)
+        self.assertNotContains(res, self.bob.email)
+
+    def test_search_endpoint(self):
+        """Test the staff-only search endpoint"""
+
+        client = APIClient()
+        client.force_authenticate(user=self.admin)
+        res = client.get(reverse("search"), {"q": "jones"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([row["email"] for row in res.data],
+                         [self.carol.email])
+
+        client.force_authenticate(user=self.bob)
+        res = client.get(reverse("search"), {"q": "jones"})
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_benchmark_command(self):
+        """Test the benchmark command seeds users and times each term"""
+
+        out = StringIO()
+        call_command("benchmark_search", "bench1@example.com", seed=10,
+                     repeat=2, stdout=out)
+
+        self.assertIn("email_exact", out.getvalue())
+        self.assertEqual(get_user_model().objects.count(), 10)
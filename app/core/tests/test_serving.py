@@ -0,0 +1,71 @@
+"""
+Tests for the production serving configuration and readiness endpoint
+"""
+
+import os
+import runpy
+from unittest.mock import patch
+
+from django.conf import settings
+from django.db.utils import OperationalError
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+CONFIG_PATH = os.path.join(settings.BASE_DIR, "gunicorn.conf.py")
+
+
+class ReadyTests(TestCase):
+    """Test `GET /ready`"""
+
+    def test_ready(self):
+        """Test a worker with a reachable database is ready"""
+
+        res = self.client.get(reverse("ready"))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()["databases"], {"default": "ok"})
+
+    def test_database_unavailable(self):
+        """Test a worker whose database is down is reported unavailable"""
+
+        with patch("django.db.backends.utils.CursorWrapper.execute",
+                   side_effect=OperationalError):
+            res = self.client.get(reverse("ready"))
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.json()["status"], "unavailable")
+
+
+class GunicornConfigTests(SimpleTestCase):
+    """Test `gunicorn.conf.py` picks the worker model from the environment"""
+
+    def load(self, **env):
+        with patch.dict(os.environ, env):
+            return runpy.run_path(CONFIG_PATH)
+
+    def test_wsgi(self):
+        """Test pre-forked sync WSGI workers sized from the CPU count"""
+
+        config = self.load(SERVER_MODE="wsgi")
+
+        self.assertEqual(config["wsgi_app"], "app.wsgi:application")
+        self.assertEqual(config["worker_class"], "sync")
+        self.assertEqual(config["workers"], os.cpu_count() * 2 + 1)
+        self.assertTrue(config["preload_app"])
+        self.assertGreater(config["max_requests"], 0)
+
+    def test_asgi(self):
+        """Test uvicorn workers serve the ASGI application"""
+
+        config = self.load(SERVER_MODE="asgi", WEB_CONCURRENCY="3")
+
+        self.assertEqual(config["wsgi_app"], "app.asgi:application")
+        self.assertEqual(config["worker_class"],
+                         "uvicorn.workers.UvicornWorker")
+        self.assertEqual(config["workers"], 3)
+
+    def test_unknown_mode(self):
+        """Test a misspelt mode fails at startup"""
+
+        with self.assertRaises(RuntimeError):
+            self.load(SERVER_MODE="wgsi")
@@ -0,0 +1,477 @@
+"""
+Tests for hash-sharded users
+
+The shard tests need at least two shard databases, e.g. with SQLite files
+standing in for MySQL shards:
+
+    USER_SHARDS=3 USER_SHARDS_SQLITE_DIR=/tmp/user-shards \
+        python manage.py test core.tests.test_sharding
+"""
+
+import tempfile
+import time
+from io import StringIO
+from unittest import skipUnless
+
+from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.models import Group
+from django.core.management import call_command
+from django.db import connections
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import sharding
+from core.activity import ActivityTracker
+from core.models import ShardAssignment
+from core.permissions import CachedModelBackend
+from user.authentication import token_cache
+
+SHARDS = sharding.get_config()["SHARDS"]
+
+
+class BucketTests(SimpleTestCase):
+    """Test buckets of emails, ids and token keys"""
+
+    def test_email_bucket_ignores_case(self):
+        """Test an email lands in the same bucket in any letter case"""
+
+        self.assertEqual(
+            sharding.bucket_for_email("Bob@Example.com"),
+            sharding.bucket_for_email("bob@example.com "),
+        )
+
+    def test_id_carries_bucket(self):
+        """Test ids and token keys name the bucket they were made for"""
+
+        user_id = sharding.make_id(17, 42)
+
+        self.assertEqual(sharding.bucket_for_id(user_id), 17)
+        key = sharding.make_token_key(user_id)
+        self.assertEqual(len(key), 40)
+        self.assertEqual(sharding.bucket_for_token_key(key), 17)
+        self.assertIsNone(sharding.bucket_for_token_key("not-hex"))
+
+
+@skipUnless(len(SHARDS) >= 2, "needs USER_SHARDS=2 or more")
+class ShardedUserTests(TestCase):
+    """Test users are created on, and looked up from, their own shard"""
+
+    databases = {"default", *SHARDS}
+
+    def setUp(self) -> None:
+        token_cache.clear()
+        sharding.get_shard_map().refresh()
+        self.client = APIClient()
+
+    def shard_of(self, email):
+        return sharding.shard_for(sharding.bucket_for_email(email))
+
+    def emails_on_distinct_shards(self):
+        """two emails owned by different shards"""
+
+        first = "user0@example.com"
+        for index in range(1, 100):
+            email = f"user{index}@example.com"
+            if self.shard_of(email) != self.shard_of(first):
+                return first, email
+        self.fail("every email hashed to one shard")
+
+    def assert_only_on(self, alias, user_id):
+        for shard in self.databases:
+            self.assertEqual(
+                get_user_model().objects.using(shard).filter(
+                    pk=user_id
+                ).exists(),
+                shard == alias,
+                shard,
+            )
+
+    def test_create_user(self):
+        """Test a new user is saved on its shard with an id of its
+        bucket"""
+
+        for email in self.emails_on_distinct_shards():
+            user = get_user_model().objects.create_user(
+                email=email, password="password@321"
+            )
+
+            self.assertEqual(user._state.db, self.shard_of(email))
+            self.assertEqual(
+                sharding.bucket_for_id(user.pk),
+                sharding.bucket_for_email(email),
+            )
+            self.assert_only_on(self.shard_of(email), user.pk)
+
+    def test_lookup_by_email(self):
+        """Test login lookups go to the owning shard, in any letter
+        case"""
+
+        user = get_user_model().objects.create_user(
+            email="bob@example.com", password="password@321"
+        )
+
+        found = get_user_model().objects.get_by_natural_key(
+            "BOB@example.com"
+        )
+        self.assertEqual(found.pk, user.pk)
+        self.assertEqual(
+            authenticate(email="bob@example.com", password="password@321"),
+            user,
+        )
+
+    async def test_async_create_and_lookup(self):
+        """Test the async manager methods route like the sync ones"""
+
+        user = await get_user_model().objects.acreate_user(
+            email="async@example.com", password="password@321"
+        )
+
+        self.assertEqual(user._state.db, self.shard_of("async@example.com"))
+        found = await get_user_model().objects.aget_by_natural_key(
+            "Async@example.com"
+        )
+        self.assertEqual(found.pk, user.pk)
+
+    def test_bulk_create_users(self):
+        """Test bulk creation splits users over their shards"""
+
+        emails = self.emails_on_distinct_shards()
+        results = get_user_model().objects.bulk_create_users(
+            [{"email": email, "password": "password@321"} for email in emails]
+            + [{"email": emails[0].upper(), "password": "password@321"}]
+        )
+
+        self.assertIsNone(results[2])
+        for email, user in zip(emails, results):
+            self.assert_only_on(self.shard_of(email), user.pk)
+
+    def test_token_api(self):
+        """Test signup, login and token authentication through the API"""
+
+        email = "api@example.com"
+        res = self.client.post(reverse("create"), {
+            "email": email, "password": "password@321", "name": "Api"
+        })
+        self.assertEqual(res.status_code, 201)
+        res = self.client.post(
+            reverse("token"), {"email": email, "password": "password@321"}
+        )
+        key = res.json()["token"]
+        user = get_user_model().objects.get_by_natural_key(email)
+        self.assertEqual(
+            sharding.bucket_for_token_key(key), sharding.bucket_for_id(user.pk)
+        )
+
+        # the token lookup touches the owning shard only
+        with CaptureQueriesContext(connections["default"]) as default:
+            res = self.client.get(
+                reverse("me"), HTTP_AUTHORIZATION=f"Token {key}"
+            )
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()["email"], email)
+        self.assertEqual(len(default), 0)
+
+        res = self.client.patch(
+            reverse("me"), {"name": "Changed"},
+            HTTP_AUTHORIZATION=f"Token {key}",
+        )
+        self.assertEqual(res.status_code, 200)
+        user.refresh_from_db()
+        self.assertEqual(user.name, "Changed")
+
+    def test_conditional_update(self):
+        """Test an `If-Match` update locks and writes the user's row on its
+        shard"""
+
+        for email in self.emails_on_distinct_shards():
+            user = get_user_model().objects.create_user(email=email)
+            token, _ = sharding.get_or_create_token(user)
+            auth = {"HTTP_AUTHORIZATION": f"Token {token.key}"}
+            etag = self.client.get(reverse("me"), **auth)["ETag"]
+
+            res = self.client.patch(
+                reverse("me"), {"name": "Changed"}, HTTP_IF_MATCH=etag, **auth
+            )
+            self.assertEqual(res.status_code, 200)
+            user.refresh_from_db()
+            self.assertEqual(user.name, "Changed")
+
+            res = self.client.patch(
+                reverse("me"), {"name": "Again"}, HTTP_IF_MATCH=etag, **auth
+            )
+            self.assertEqual(res.status_code, 412)
+
+    def test_change_email_to_other_shard(self):
+        """Test a new email of another shard moves the user there: login
+        works with it and nobody can sign up with it again"""
+
+        old_email, new_email = self.emails_on_distinct_shards()
+        user = get_user_model().objects.create_user(
+            email=old_email, password="password@321"
+        )
+        token, _ = sharding.get_or_create_token(user)
+
+        res = self.client.patch(
+            reverse("me"), {"email": new_email},
+            HTTP_AUTHORIZATION=f"Token {token.key}",
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()["email"], new_email)
+
+        moved = get_user_model().objects.get_by_natural_key(new_email)
+        self.assertEqual(moved._state.db, self.shard_of(new_email))
+        self.assertEqual(
+            sharding.bucket_for_id(moved.pk),
+            sharding.bucket_for_email(new_email),
+        )
+        self.assert_only_on(self.shard_of(new_email), moved.pk)
+        self.assertFalse(
+            get_user_model().objects.using(user._state.db).filter(
+                pk=user.pk
+            ).exists()
+        )
+        res = self.client.post(
+            reverse("token"), {"email": new_email, "password": "password@321"}
+        )
+        self.assertEqual(res.status_code, 200)
+        res = self.client.get(
+            reverse("me"), HTTP_AUTHORIZATION=f"Token {res.json()['token']}"
+        )
+        self.assertEqual(res.json()["email"], new_email)
+        res = self.client.post(reverse("create"), {
+            "email": new_email, "password": "password@321", "name": "Again"
+        })
+        self.assertEqual(res.status_code, 400)
+
+    @override_settings(ROOT_URLCONF="user.async_urls")
+    async def test_async_change_email_to_other_shard(self):
+        """Test the async view moves the user like the sync one"""
+
+        old_email, new_email = self.emails_on_distinct_shards()
+        user = await get_user_model().objects.acreate_user(
+            email=old_email, password="password@321"
+        )
+        token, _ = await sharding.aget_or_create_token(user)
+
+        res = await self.async_client.patch(
+            reverse("me"), {"email": new_email},
+            content_type="application/json",
+            AUTHORIZATION=f"Token {token.key}",
+        )
+
+        self.assertEqual(res.status_code, 200)
+        moved = await get_user_model().objects.aget_by_natural_key(new_email)
+        self.assertEqual(moved._state.db, self.shard_of(new_email))
+        self.assertTrue(res["ETag"].startswith(f'"{moved.pk}-'))
+
+    def test_change_email_to_taken_one(self):
+        """Test an email taken on the other shard is refused and the user
+        stays where it was"""
+
+        old_email, new_email = self.emails_on_distinct_shards()
+        user = get_user_model().objects.create_user(email=old_email)
+        other = get_user_model().objects.create_user(email=new_email)
+        token, _ = sharding.get_or_create_token(user)
+
+        res = self.client.patch(
+            reverse("me"), {"email": new_email.upper()},
+            HTTP_AUTHORIZATION=f"Token {token.key}",
+        )
+
+        self.assertEqual(res.status_code, 400)
+        user.refresh_from_db()
+        self.assertEqual(user.email, old_email)
+        self.assertTrue(get_user_model().objects.using(
+            other._state.db
+        ).filter(pk=other.pk).exists())
+
+    def test_update_user_email_renumbers(self):
+        """Test `update_user` gives a user whose email changed bucket an id
+        of the new bucket, on the same shard too"""
+
+        user = get_user_model().objects.create_user(email="user0@example.com")
+        new_email = next(
+            email for email in (f"other{i}@example.com" for i in range(500))
+            if self.shard_of(email) == user._state.db
+            and sharding.bucket_for_email(email)
+            != sharding.bucket_for_id(user.pk)
+        )
+        token, _ = sharding.get_or_create_token(user)
+
+        get_user_model().objects.update_user(user.pk, email=new_email)
+
+        moved = get_user_model().objects.get_by_natural_key(new_email)
+        self.assertEqual(moved._state.db, user._state.db)
+        self.assertEqual(
+            sharding.bucket_for_id(moved.pk),
+            sharding.bucket_for_email(new_email),
+        )
+        self.assert_only_on(user._state.db, moved.pk)
+        new_token = Token.objects.using(moved._state.db).get(user=moved)
+        self.assertNotEqual(new_token.key, token.key)
+        self.assertEqual(
+            sharding.bucket_for_token_key(new_token.key),
+            sharding.bucket_for_id(moved.pk),
+        )
+
+    @override_settings(SIGNED_TOKENS={"ENABLED": True, "ACCESS_TTL": 60,
+                                      "REFRESH_TTL": 3600})
+    def test_signed_tokens(self):
+        """Test signed access and refresh tokens find the user's shard by
+        id"""
+
+        get_user_model().objects.create_user(
+            email="signed@example.com", password="password@321"
+        )
+        res = self.client.post(reverse("token-signed"), {
+            "email": "signed@example.com", "password": "password@321"
+        })
+        pair = res.json()
+
+        res = self.client.get(
+            reverse("me"), HTTP_AUTHORIZATION=f"Bearer {pair['access']}"
+        )
+        self.assertEqual(res.status_code, 200)
+        res = self.client.post(
+            reverse("token-refresh"), {"refresh": pair["refresh"]}
+        )
+        self.assertEqual(res.status_code, 200)
+
+    def test_session_user(self):
+        """Test a session's user is loaded from its shard"""
+
+        user = get_user_model().objects.create_user(
+            email="session@example.com", password="password@321"
+        )
+
+        found = CachedModelBackend().get_user(user.pk)
+        self.assertEqual(found, user)
+        self.assertEqual(found._state.db, user._state.db)
+
+    def test_update_user_and_activity(self):
+        """Test updates and `last_seen` writes by id reach each shard"""
+
+        users = [
+            get_user_model().objects.create_user(email=email)
+            for email in self.emails_on_distinct_shards()
+        ]
+
+        for user in users:
+            self.assertEqual(
+                get_user_model().objects.update_user(user.pk, name="new"),
+                user.version + 1,
+            )
+        with tempfile.TemporaryDirectory() as directory:
+            tracker = ActivityTracker(directory, interval=0)
+            updated = tracker.write({user.pk: time.time() for user in users})
+
+        self.assertEqual(updated, len(users))
+        for user in users:
+            user.refresh_from_db()
+            self.assertEqual(user.name, "new")
+            self.assertIsNotNone(user.last_seen)
+
+
+@skipUnless(len(SHARDS) >= 2, "needs USER_SHARDS=2 or more")
+class RebalanceUsersTests(TestCase):
+    """Test the `rebalance_users` command"""
+
+    databases = {"default", *SHARDS}
+
+    def setUp(self) -> None:
+        token_cache.clear()
+        sharding.get_shard_map().refresh()
+
+    def rebalance(self, **options):
+        out = StringIO()
+        call_command("rebalance_users", no_wait=True, stdout=out, **options)
+        return out.getvalue()
+
+    def test_move_bucket(self):
+        """Test a bucket's users move with their token and groups"""
+
+        user = get_user_model().objects.create_user(
+            email="move@example.com", password="password@321"
+        )
+        token, _ = sharding.get_or_create_token(user)
+        source = user._state.db
+        target = next(shard for shard in SHARDS if shard != source)
+        for alias in (source, target):
+            Group.objects.using(alias).create(name="support")
+        user.groups.add(Group.objects.using(source).get(name="support"))
+        bucket = sharding.bucket_for_id(user.pk)
+
+        out = self.rebalance(bucket=[bucket], to=target)
+
+        self.assertIn(f"{source}: moved 1 users", out)
+        self.assertEqual(
+            ShardAssignment.objects.get(bucket=bucket).shard, target
+        )
+        moved = get_user_model().objects.get_by_natural_key(user.email)
+        self.assertEqual((moved.pk, moved._state.db), (user.pk, target))
+        self.assertEqual(
+            list(moved.groups.values_list("name", flat=True)), ["support"]
+        )
+        self.assertFalse(
+            get_user_model().objects.using(source).filter(
+                pk=user.pk
+            ).exists()
+        )
+        res = APIClient().get(
+            reverse("me"), HTTP_AUTHORIZATION=f"Token {token.key}"
+        )
+        self.assertEqual(res.status_code, 200)
+
+        # back to its initial shard: the assignment is dropped
+        self.rebalance(bucket=[bucket], to=source)
+        self.assertFalse(ShardAssignment.objects.filter(bucket=bucket))
+        self.assertEqual(
+            get_user_model().objects.get_by_natural_key(
+                user.email
+            )._state.db,
+            source,
+        )
+
+    def test_dry_run(self):
+        """Test a dry run counts the users to move and moves nothing"""
+
+        user = get_user_model().objects.create_user(email="dry@example.com")
+        target = next(shard for shard in SHARDS if shard != user._state.db)
+
+        out = self.rebalance(
+            bucket=[sharding.bucket_for_id(user.pk)], to=target, dry_run=True
+        )
+
+        self.assertIn(f"{user._state.db}: would move 1 users", out)
+        self.assertFalse(ShardAssignment.objects.exists())
+        self.assertEqual(
+            get_user_model().objects.get_by_natural_key(
+                user.email
+            )._state.db,
+            user._state.db,
+        )
+
+    def test_move_users_from_before_sharding(self):
+        """Test users of the unsharded database get ids of their bucket and
+        new token keys"""
+
+        email = "legacy@example.com"
+        bucket = sharding.bucket_for_email(email)
+        legacy_id = bucket + 1
+        get_user_model().objects.using("default").bulk_create(
+            [get_user_model()(id=legacy_id, email=email)]
+        )
+        Token.objects.using("default").create(key="0" * 40, user_id=legacy_id)
+
+        self.rebalance(source=["default"])
+
+        user = get_user_model().objects.get_by_natural_key(email)
+        self.assertEqual(sharding.bucket_for_id(user.pk), bucket)
+        token = Token.objects.using(user._state.db).get(user=user)
+        self.assertEqual(sharding.bucket_for_token_key(token.key), bucket)
+        self.assertFalse(
+            get_user_model().objects.using("default").filter(email=email)
+        )
@@ -0,0 +1,78 @@
+"""
+Operational endpoints
+"""
+
+import hmac
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
+from django.views.static import serve
+
+from core.instrumentation import (
+    get_metrics_store,
+    render_collected,
+    render_prometheus,
+)
+
+
+def can_read_metrics(request):
+    """staff users, `METRICS["ALLOWED_IPS"]` and the `METRICS["TOKEN"]`
+    bearer"""
+
+    config = getattr(settings, "METRICS", {})
+    user = getattr(request, "user", None)
+    if user is not None and user.is_staff:
+        return True
+    if request.META.get("REMOTE_ADDR") in config.get("ALLOWED_IPS", ()):
+        return True
+    token = config.get("TOKEN")
+    auth = request.headers.get("Authorization", "")
+    return bool(token) and hmac.compare_digest(
+        auth.encode(), f"Bearer {token}".encode()
+    )
+
+
+def metrics(request):
+    """Request and collector metrics of every worker process in the
+    Prometheus text format"""
+
+    if not can_read_metrics(request):
+        return HttpResponseForbidden()
+    store = get_metrics_store()
+    return HttpResponse(
+        render_prometheus(store.aggregate())
+        + render_collected(store.collected()),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+def ready(request):
+    """Readiness of this worker: 200 once every database answers, 503
+    otherwise, so a load balancer only routes to workers that can serve"""
+
+    databases = {}
+    for alias in connections:
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute("SELECT 1")
+            databases[alias] = "ok"
+        except Exception as exc:
+            databases[alias] = f"unavailable: {exc.__class__.__name__}"
+
+    is_ready = all(state == "ok" for state in databases.values())
+    return JsonResponse(
+        {"status": "ready" if is_ready else "unavailable",
+         "databases": databases},
+        status=200 if is_ready else 503,
+    )
+
+
+def static(request, path):
+    """The admin's CSS / JS from `STATIC_ROOT` (`manage.py collectstatic`)
+
+    Enough for the admin's few staff users; put a proxy or CDN in front of
+    `STATIC_URL` for anything heavier.
+    """
+
+    return serve(request, path, document_root=settings.STATIC_ROOT)
@@ -0,0 +1,52 @@
+"""
+Connection and query warm-up
+
+The first requests a fresh process serves pay for opening database
+connections and, on a freshly started database, for reading the user / token
+indexes from disk. `warm_up` pays those costs up front:
+
+- opens the connection of every alias (kept open between requests when
+  `CONN_MAX_AGE` allows it)
+- runs the queries behind login, token authentication and `/me` once, so
+  their index pages are in the database's buffer pool
+
+`wait_for_db --warm-up` runs it before the server starts; a server can also
+call it from each worker process as it boots.
+
+TODO - refer
+https://docs.djangoproject.com/en/4.2/ref/databases/#persistent-connections
+"""
+
+from django.contrib.auth import get_user_model
+from django.db import connections
+from rest_framework.authtoken.models import Token
+
+# never matches a real row, only walks the index
+_MISSING_EMAIL = "warm-up@invalid"
+_MISSING_KEY = "0" * 40
+
+
+def hot_queries(alias):
+    """the querysets the user API runs on every request"""
+
+    users = get_user_model().objects.using(alias)
+    return [
+        # CreateTokenView: user by email (`get_by_natural_key`)
+        users.filter(email__lower=_MISSING_EMAIL),
+        # TokenAuthentication: token by key with its user
+        Token.objects.using(alias).select_related("user")
+        .filter(key=_MISSING_KEY),
+        # ManageUserView: user by primary key
+        users.filter(pk=0),
+    ]
+
+
+def warm_up(alias="default"):
+    """open the connection of `alias` and run the hot queries once,
+    returns the number of queries run"""
+
+    connections[alias].ensure_connection()
+    queries = hot_queries(alias)
+    for queryset in queries:
+        list(queryset[:1])
+    return len(queries)
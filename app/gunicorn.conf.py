@@ -0,0 +1,165 @@
+"""
+Gunicorn configuration for production serving
+
+    gunicorn -c gunicorn.conf.py
+
+`SERVER_MODE` picks the worker model:
+
+- `wsgi` (default) - pre-forked sync workers serving `app.wsgi`, with
+  `GUNICORN_THREADS` > 1 switching to threaded (`gthread`) workers
+- `asgi` - pre-forked uvicorn workers serving `app.asgi`, for the native
+  async views (`USER_API_ASYNC=1`)
+
+Django is imported and set up once in the master (`preload_app`) so the
+forked workers share its memory copy-on-write. The master never touches the
+database; each worker opens its own connections (the pool of
+`core.backends.mysql_pool` is per process) and warms them up
+(`core.warmup`), and writes its pending `last_seen` activity when it exits.
+
+With DEBUG off the workers serve the admin's CSS / JS from `STATIC_ROOT`,
+so run `manage.py collectstatic` before starting gunicorn.
+
+`APP_PROFILE=api` boots API-only workers without the admin and its
+browser middleware (see `app/settings.py`, `NOTES/startup.md`).
+
+Workers are recycled after `GUNICORN_MAX_REQUESTS` requests (with jitter,
+so they do not all restart at once) and get `GUNICORN_GRACEFUL_TIMEOUT`
+seconds to finish in-flight requests on SIGTERM / restart. `GET /ready`
+reports whether a worker can serve (see `core.views.ready`).
+
+TODO - refer
+https://docs.gunicorn.org/en/stable/settings.html
+https://www.uvicorn.org/deployment/#gunicorn
+"""
+
+import glob
+import multiprocessing
+import os
+
+# read by app/settings.py when `preload_app` loads Django below; debug
+# stays off unless DJANGO_DEBUG=1 is set explicitly
+os.environ.setdefault("DJANGO_DEBUG", "0")
+
+SERVER_MODE = os.environ.get("SERVER_MODE", "wsgi")
+if SERVER_MODE not in ("wsgi", "asgi"):
+    raise RuntimeError(f"SERVER_MODE must be wsgi or asgi, not {SERVER_MODE}")
+
+_cpus = multiprocessing.cpu_count()
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+
+if SERVER_MODE == "asgi":
+    wsgi_app = "app.asgi:application"
+    worker_class = "uvicorn.workers.UvicornWorker"
+    # an event loop per core is enough, they do not block on I/O
+    workers = int(os.environ.get("WEB_CONCURRENCY", _cpus))
+    # hashing must not block the event loop: the host's cores shared out
+    # between the workers' pools (sync workers hash inline)
+    os.environ.setdefault(
+        "PASSWORD_HASHING_WORKERS", str(max(_cpus // workers, 1))
+    )
+else:
+    wsgi_app = "app.wsgi:application"
+    threads = int(os.environ.get("GUNICORN_THREADS", 1))
+    worker_class = "gthread" if threads > 1 else "sync"
+    workers = int(os.environ.get("WEB_CONCURRENCY", _cpus * 2 + 1))
+
+preload_app = True
+
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 10000))
+max_requests_jitter = int(
+    os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", max_requests // 10)
+)
+
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-")
+
+
+def on_starting(server):
+    """refuse process-local caches that must be shared with several
+    workers and drop metrics files of the previous run's worker
+    processes"""
+
+    from django.conf import settings
+
+    from core import routers
+    from core.permissions import CACHE_ALIAS
+    from user import authentication
+
+    # a permission revoked, a logout, or a write made, in one worker must be
+    # seen by the others
+    shared = [CACHE_ALIAS, authentication.CACHE_ALIAS]
+    if routers.get_config()["REPLICAS"]:
+        shared.append(routers.get_config()["CACHE"])
+    for alias in shared:
+        backend = settings.CACHES[alias]["BACKEND"]
+        if workers > 1 and backend.endswith(".LocMemCache"):
+            raise RuntimeError(
+                f"CACHES[{alias!r}] must be shared by the {workers} "
+                "workers, not a LocMemCache"
+            )
+
+    for path in glob.glob(
+        os.path.join(settings.METRICS["DIR"], "metrics-*.json")
+    ):
+        os.remove(path)
+
+
+def when_ready(server):
+    server.log.info(
+        "ready: %s mode, %s %s workers on %s",
+        SERVER_MODE, server.num_workers, worker_class, bind,
+    )
+
+
+def post_worker_init(worker):
+    """open and warm up this worker's database connections before it
+    accepts requests"""
+
+    from django.conf import settings
+    from django.db import connections
+
+    from core.warmup import warm_up
+
+    for alias in settings.DATABASES:
+        try:
+            warm_up(alias)
+        except Exception:
+            worker.log.exception("warm-up of database %s failed", alias)
+    # requests do not run on this thread under uvicorn: hand the warm
+    # connections back (to the pool with `core.backends.mysql_pool`)
+    connections.close_all()
+
+
+def worker_exit(server, worker):
+    """keep the request metrics and write the `last_seen` activity of an
+    exiting worker"""
+
+    from django.db import connections
+
+    from core.activity import get_settings, get_tracker
+    from core.instrumentation import get_metrics_store
+
+    get_metrics_store().flush(force=True)
+    if get_settings().get("ENABLED"):
+        # waits for a flush of another worker, then writes what is left
+        try:
+            get_tracker().flush(block=True)
+        except Exception:
+            worker.log.exception("last_seen flush failed")
+        finally:
+            connections.close_all()
+
+
+def child_exit(server, worker):
+    """fold the metrics file of an exited worker into the totals of
+    exited workers (runs in the master, after `worker_exit`)"""
+
+    from django.conf import settings
+
+    from core.instrumentation import retire_process
+
+    retire_process(settings.METRICS["DIR"], worker.pid)
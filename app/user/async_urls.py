@@ -0,0 +1,24 @@
+"""URL mapping for the user API served by native async views
+
+Used instead of `user.urls` when `settings.USER_API_ASYNC` is set. The
+create/token/me endpoints are the async views from `user.async_views`; every
+other endpoint is shared with `user.urls`.
+"""
+
+from django.urls import path
+
+from . import async_views
+from .urls import urlpatterns as sync_urlpatterns
+
+ASYNC_VIEWS = {
+    "create": async_views.AsyncCreateUserView,
+    "token": async_views.AsyncCreateTokenView,
+    "me": async_views.AsyncManageUserView,
+}
+
+urlpatterns = [
+    path(f"{name}/", view.as_view(), name=name)
+    for name, view in ASYNC_VIEWS.items()
+] + [
+    pattern for pattern in sync_urlpatterns if pattern.name not in ASYNC_VIEWS
+]
@@ -0,0 +1,257 @@
+"""
+Native async versions of the user API views
+
+Same endpoints, payloads and responses as `user/views.py`, written as async
+Django views so that under an ASGI server (`app/asgi.py`) a request does not
+hold a thread from the sync-to-async bridge while it waits on the client,
+the database or the password hasher:
+
+- database access uses the async ORM (`aget`, `acreate`,
+  `aget_or_create`); `/me` updates use `UserManager.aupdate_user`, one
+  conditional UPDATE that also bumps the user's `version`
+- password hashing is awaited on the hashing service's process pool
+  (`core.hashing`)
+
+They are routed by `user/async_urls.py`, enabled with `USER_API_ASYNC`.
+
+TODO - refer
+https://docs.djangoproject.com/en/4.1/topics/async/
+https://docs.djangoproject.com/en/4.1/topics/db/queries/#asynchronous-queries
+"""
+
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, router
+from django.http import HttpResponseNotModified, JsonResponse, QueryDict
+from django.views import View
+from rest_framework import exceptions, status
+
+from core import hashing, routers, sharding
+
+from .authentication import (
+    CachedTokenAuthentication,
+    SignedTokenAuthentication,
+)
+from .conditional import etag_matches, if_match_versions, user_etag
+from .emails import add_email
+from .exceptions import PreconditionFailed, ServiceUnavailable
+from .serializers import (
+    EMAIL_TAKEN,
+    AsyncAuthTokenSerializer,
+    AsyncUserSerializer,
+    user_read_serializer,
+)
+
+
+def user_data(user):
+    """the `UserSerializer` representation of `user`"""
+
+    return user_read_serializer.to_representation(user)
+
+
+class AsyncAPIView(View):
+    """Base class for the async user views: JSON in, JSON out, DRF-style
+    errors"""
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # token authenticated API, like DRF's `APIView`
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            return self.error_response(exc)
+        except hashing.HashingBusy:
+            response = self.error_response(ServiceUnavailable())
+            response["Retry-After"] = "1"
+            return response
+
+    @staticmethod
+    def error_response(exc):
+        detail = exc.detail
+        if not isinstance(detail, (dict, list)):
+            detail = {"detail": detail}
+        response = JsonResponse(detail, status=exc.status_code, safe=False)
+        if isinstance(exc, (exceptions.NotAuthenticated,
+                            exceptions.AuthenticationFailed)):
+            response["WWW-Authenticate"] = CachedTokenAuthentication.keyword
+        return response
+
+    @staticmethod
+    def get_data(request):
+        """parse a JSON or form encoded request body"""
+
+        if request.content_type == "application/json":
+            try:
+                return json.loads(request.body or b"{}")
+            except ValueError as exc:
+                raise exceptions.ParseError(f"JSON parse error - {exc}")
+        if request.method == "POST":
+            return request.POST.dict()
+        return QueryDict(request.body).dict()
+
+    @staticmethod
+    def validate(serializer):
+        if not serializer.is_valid():
+            raise exceptions.ValidationError(serializer.errors)
+        return serializer.validated_data
+
+
+class AsyncCreateUserView(AsyncAPIView):
+    """Create a new user in the system"""
+
+    async def post(self, request):
+        data = self.validate(AsyncUserSerializer(data=self.get_data(request)))
+        try:
+            user = await get_user_model().objects.acreate_user(**data)
+        except IntegrityError:
+            raise exceptions.ValidationError(EMAIL_TAKEN)
+        return JsonResponse(user_data(user), status=status.HTTP_201_CREATED)
+
+
+class AsyncCreateTokenView(AsyncAPIView):
+    """Return the auth token for valid email / password credentials"""
+
+    async def post(self, request):
+        data = self.validate(
+            AsyncAuthTokenSerializer(data=self.get_data(request))
+        )
+        user_model = get_user_model()
+
+        try:
+            user = await user_model.objects.aget_by_natural_key(
+                data["email"]
+            )
+        except user_model.DoesNotExist:
+            # hash anyway so response time does not reveal unknown emails,
+            # like `ModelBackend.authenticate`
+            await hashing.amake_password(data["password"])
+            user = None
+
+        if user is not None:
+            is_correct, must_update = await hashing.acheck_password(
+                data["password"], user.password
+            )
+            if is_correct and must_update:
+                password = await hashing.amake_password(data["password"])
+                await user_model.objects.aupdate_user(
+                    user.pk, password=password
+                )
+            if not is_correct or not user.is_active:
+                user = None
+
+        if user is None:
+            msg = "unable to authenticate user with given credentials"
+            raise exceptions.ValidationError(
+                {"non_field_errors": [msg]}, code="authorization"
+            )
+
+        token, created = await sharding.aget_or_create_token(user)
+        if created:
+            # the next requests read the new token from the primary
+            routers.stick_credentials(
+                f"{CachedTokenAuthentication.keyword} {token.key}"
+            )
+        return JsonResponse({"token": token.key})
+
+
+class AsyncManageUserView(AsyncAPIView):
+    """
+    get
+    patch
+    put
+
+    for the user authenticated by the `Authorization: Token <key>` (or,
+    with signed tokens enabled, `Bearer <access token>`) header
+    """
+
+    authenticators = [CachedTokenAuthentication(), SignedTokenAuthentication()]
+
+    async def authenticate(self, request):
+        for authenticator in self.authenticators:
+            credentials = await authenticator.aauthenticate(request)
+            if credentials is not None:
+                return credentials[0]
+        raise exceptions.NotAuthenticated()
+
+    async def get(self, request):
+        user = await self.authenticate(request)
+        etag = user_etag(user)
+        if etag_matches(request.headers.get("If-None-Match"), etag,
+                        weak=True):
+            response = HttpResponseNotModified()
+        else:
+            response = JsonResponse(user_data(user))
+        response["ETag"] = etag
+        return response
+
+    async def put(self, request):
+        return await self.update(request, partial=False)
+
+    async def patch(self, request):
+        return await self.update(request, partial=True)
+
+    async def update(self, request, partial):
+        user = await self.authenticate(request)
+        data = self.validate(AsyncUserSerializer(
+            user, data=self.get_data(request), partial=partial
+        ))
+        # like `UserSerializer.update`, only changed columns are written,
+        # diffed against the current row rather than the cached user
+        await sync_to_async(user.refresh_from_db)(
+            using=router.db_for_write(type(user), instance=user),
+            fields=[name for name in data if name != "password"] + ["version"],
+        )
+        changes = {
+            name: value for name, value in data.items()
+            if name == "password" or getattr(user, name) != value
+        }
+
+        password = changes.pop("password", None)
+        if password:
+            changes["password"] = await hashing.amake_password(password)
+
+        if_match = request.headers.get("If-Match")
+        expected_versions = None
+        if if_match is not None:
+            expected_versions = if_match_versions(if_match, user)
+
+        if not changes:
+            # like the sync view, nothing is written: the version just read
+            # is checked instead
+            if (expected_versions is not None
+                    and user.version not in expected_versions):
+                raise PreconditionFailed()
+        else:
+            try:
+                version = await get_user_model().objects.aupdate_user(
+                    user.pk, expected_versions, **changes
+                )
+            except IntegrityError:
+                raise exceptions.ValidationError(EMAIL_TAKEN)
+            if version is None:
+                raise PreconditionFailed()
+            changes["version"] = version
+            if "email" in changes:
+                add_email(changes["email"])
+            if sharding.enabled() and "email" in changes and (
+                sharding.bucket_for_email(changes["email"])
+                != sharding.bucket_for_id(user.pk)
+            ):
+                # moved to the bucket of its new email, with a new id
+                moved = await get_user_model().objects.aget_by_natural_key(
+                    changes["email"]
+                )
+                user.pk, user._state.db = moved.pk, moved._state.db
+
+        for name, value in changes.items():
+            setattr(user, name, value)
+        response = JsonResponse(user_data(user))
+        response["ETag"] = user_etag(user)
+        return response
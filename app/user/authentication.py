@@ -0,0 +1,343 @@
+"""
+Authentication classes for the user API
+
+`CachedTokenAuthentication` behaves like DRF's `TokenAuthentication` but
+keeps recently used token -> user mappings in an in-process LRU, so a hot
+client hitting `/api/user/me/` does not run the `Token` + `User` join on
+every request.
+
+`SignedTokenAuthentication` accepts the signed `Authorization: Bearer`
+tokens of `user/tokens.py` when they are enabled. The token is verified
+without a query and the user comes from the same LRU, so a hot client needs
+no query at all to authenticate.
+
+With sharded users (`core/sharding.py`) a token key or a user id names its
+bucket, so the lookup goes straight to the owning shard.
+
+The LRU is per process. Model signals (see `user/signals.py`) drop a
+changed user's entries in the process that performed the write and record
+the time of the change in the shared `token_auth` cache
+(`settings.CACHES`). Every hit compares that time with the one its entry
+was stored with, a cache read instead of the join, so a logout or a
+deactivation is seen by every process on its next request. A miss only
+caches the row it read when the user's last change came before its query
+started, so a miss racing a write never stores the old row.
+
+Like `permissions`, `token_auth` must be shared by every process
+(`gunicorn.conf.py` refuses a `LocMemCache` with several workers). With
+memcached or redis shared between hosts, `TOKEN_AUTH_CACHE["CLOCK_SKEW"]`
+covers the difference between their clocks.
+
+TODO - refer
+https://docs.djangoproject.com/en/4.1/topics/cache/#cache-arguments
+"""
+
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import (
+    TokenAuthentication,
+    get_authorization_header,
+)
+
+from core import activity, sharding
+from core.lru import LRUCache
+
+from . import tokens
+
+
+# only the user columns needed to authenticate and to serve `/me/`
+USER_FIELDS = (
+    "id", "email", "name", "is_active", "is_staff", "is_superuser", "version",
+)
+
+_cache_settings = getattr(settings, "TOKEN_AUTH_CACHE", {})
+
+CACHE_ALIAS = "token_auth"
+CLOCK_SKEW = _cache_settings.get("CLOCK_SKEW", 0.0)
+
+# token key or ("user", user id)
+#   -> (user id, last change, database alias, user field values)
+token_cache = LRUCache(
+    max_size=_cache_settings.get("MAX_SIZE", 10000),
+    ttl=_cache_settings.get("TTL", 60),
+)
+
+
+def changed_key(user_id):
+    return f"user-auth-changed:{user_id}"
+
+
+def invalidate_user(user_id):
+    """Drop every cached token belonging to `user_id`, in every process"""
+
+    caches[CACHE_ALIAS].set(changed_key(user_id), time.time(), None)
+    token_cache.delete_tag(user_id)
+
+
+def is_current(entry):
+    """whether the user of `entry` is unchanged since it was stored"""
+
+    return caches[CACHE_ALIAS].get(changed_key(entry[0])) == entry[1]
+
+
+async def ais_current(entry):
+    return await caches[CACHE_ALIAS].aget(changed_key(entry[0])) == entry[1]
+
+
+def last_change(user_id, started):
+    """time of the last change of `user_id`, recorded as older than
+    `started` when none is known (never changed or evicted)"""
+
+    cache = caches[CACHE_ALIAS]
+    changed_at = cache.get(changed_key(user_id))
+    if changed_at is None:
+        changed_at = started - CLOCK_SKEW
+        if not cache.add(changed_key(user_id), changed_at, None):
+            changed_at = cache.get(changed_key(user_id))
+    return changed_at
+
+
+async def alast_change(user_id, started):
+    """async version of `last_change`"""
+
+    cache = caches[CACHE_ALIAS]
+    changed_at = await cache.aget(changed_key(user_id))
+    if changed_at is None:
+        changed_at = started - CLOCK_SKEW
+        if not await cache.aadd(changed_key(user_id), changed_at, None):
+            changed_at = await cache.aget(changed_key(user_id))
+    return changed_at
+
+
+def store(key, entry, started):
+    """cache `entry` unless its user changed after the query `started`"""
+
+    if entry[1] is not None and entry[1] + CLOCK_SKEW <= started:
+        token_cache.set(key, entry, tag=entry[0])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication backed by an in-process LRU checked against the
+    shared last change of each user"""
+
+    def get_user_fields(self):
+        """names of the user columns to load, in model field order"""
+
+        return [
+            field.attname
+            for field in get_user_model()._meta.concrete_fields
+            if field.attname in USER_FIELDS
+        ]
+
+    def get_key(self, request):
+        """Return the token key from the `Authorization` header, or `None`
+        when the header does not carry a token"""
+
+        auth = get_authorization_header(request).split()
+
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+
+        if len(auth) == 1:
+            msg = _("Invalid token header. No credentials provided.")
+            raise exceptions.AuthenticationFailed(msg)
+        elif len(auth) > 2:
+            msg = _("Invalid token header. "
+                    "Token string should not contain spaces.")
+            raise exceptions.AuthenticationFailed(msg)
+
+        try:
+            return auth[1].decode()
+        except UnicodeError:
+            msg = _("Invalid token header. "
+                    "Token string should not contain invalid characters.")
+            raise exceptions.AuthenticationFailed(msg)
+
+    def authenticate(self, request):
+        key = self.get_key(request)
+        if key is None:
+            return None
+        return self.authenticate_credentials(key)
+
+    async def aauthenticate(self, request):
+        """Async version of `authenticate` for native async views"""
+
+        key = self.get_key(request)
+        if key is None:
+            return None
+        return await self.aauthenticate_credentials(key)
+
+    def authenticate_credentials(self, key):
+        field_names = self.get_user_fields()
+
+        entry = token_cache.get(key)
+        if entry is None or not is_current(entry):
+            started = time.time()
+            shard = sharding.shard_for(sharding.bucket_for_token_key(key))
+            try:
+                token = self.get_queryset(field_names).using(shard).get(
+                    key=key
+                )
+            except self.get_model().DoesNotExist:
+                raise exceptions.AuthenticationFailed(_("Invalid token."))
+            entry = self.make_entry(
+                token.user, field_names,
+                last_change(token.user_id, started),
+            )
+            store(key, entry, started)
+
+        return self.build_credentials(key, entry, field_names)
+
+    async def aauthenticate_credentials(self, key):
+        """Async version of `authenticate_credentials`"""
+
+        field_names = self.get_user_fields()
+
+        entry = token_cache.get(key)
+        if entry is None or not await ais_current(entry):
+            started = time.time()
+            shard = await sharding.ashard_for(
+                sharding.bucket_for_token_key(key)
+            )
+            try:
+                token = await self.get_queryset(field_names).using(
+                    shard
+                ).aget(key=key)
+            except self.get_model().DoesNotExist:
+                raise exceptions.AuthenticationFailed(_("Invalid token."))
+            entry = self.make_entry(
+                token.user, field_names,
+                await alast_change(token.user_id, started),
+            )
+            store(key, entry, started)
+
+        return self.build_credentials(key, entry, field_names)
+
+    def get_queryset(self, field_names):
+        """token lookup loading only `field_names` of the user"""
+
+        return (
+            self.get_model()
+            .objects.select_related("user")
+            .only("key", "user", *[f"user__{f}" for f in field_names])
+        )
+
+    def make_entry(self, user, field_names, changed_at):
+        return (
+            user.pk,
+            changed_at,
+            user._state.db,
+            tuple(getattr(user, name) for name in field_names),
+        )
+
+    def build_credentials(self, key, entry, field_names):
+        """rebuild a (user, token) pair from a cache entry"""
+
+        user = self.build_user(entry, field_names)
+        token = self.get_model()(key=key, user=user)
+        token._state.adding = False
+        token._state.db = user._state.db
+        return (user, token)
+
+    def build_user(self, entry, field_names):
+        """rebuild an active user from a cache entry and record their
+        activity"""
+
+        db, values = entry[2:]
+        user = get_user_model().from_db(db, field_names, values)
+        if not user.is_active:
+            msg = _("User inactive or deleted.")
+            raise exceptions.AuthenticationFailed(msg)
+        # memory only, `last_seen` is written behind (`core/activity.py`)
+        activity.record(user.pk)
+        return user
+
+
+class SignedTokenAuthentication(CachedTokenAuthentication):
+    """Authentication with the signed access tokens of `user/tokens.py`
+
+    Returns the user and a `tokens.SignedToken`. Does nothing unless
+    `SIGNED_TOKENS["ENABLED"]` is set.
+    """
+
+    keyword = "Bearer"
+
+    def authenticate(self, request):
+        if not tokens.enabled():
+            return None
+        return super().authenticate(request)
+
+    async def aauthenticate(self, request):
+        if not tokens.enabled():
+            return None
+        return await super().aauthenticate(request)
+
+    def authenticate_credentials(self, key):
+        token = self.decode(key)
+        if tokens.get_revocations().is_revoked(token):
+            raise exceptions.AuthenticationFailed(_("Token revoked."))
+
+        field_names = self.get_user_fields()
+        entry = token_cache.get(("user", token.user_id))
+        if entry is None or not is_current(entry):
+            started = time.time()
+            shard = sharding.shard_for(sharding.bucket_for_id(token.user_id))
+            try:
+                user = self.get_user_queryset(field_names).using(shard).get(
+                    pk=token.user_id
+                )
+            except get_user_model().DoesNotExist:
+                msg = _("User inactive or deleted.")
+                raise exceptions.AuthenticationFailed(msg)
+            entry = self.make_entry(
+                user, field_names, last_change(user.pk, started)
+            )
+            store(("user", user.pk), entry, started)
+
+        return (self.build_user(entry, field_names), token)
+
+    async def aauthenticate_credentials(self, key):
+        token = self.decode(key)
+        revocations = tokens.get_revocations()
+        # the bloom filter answers without a query unless it is stale or
+        # the token may be revoked
+        if revocations.is_stale() or revocations.might_contain(token.jti):
+            if await sync_to_async(revocations.is_revoked)(token):
+                raise exceptions.AuthenticationFailed(_("Token revoked."))
+
+        field_names = self.get_user_fields()
+        entry = token_cache.get(("user", token.user_id))
+        if entry is None or not await ais_current(entry):
+            started = time.time()
+            shard = await sharding.ashard_for(
+                sharding.bucket_for_id(token.user_id)
+            )
+            try:
+                user = await self.get_user_queryset(field_names).using(
+                    shard
+                ).aget(pk=token.user_id)
+            except get_user_model().DoesNotExist:
+                msg = _("User inactive or deleted.")
+                raise exceptions.AuthenticationFailed(msg)
+            entry = self.make_entry(
+                user, field_names, await alast_change(user.pk, started)
+            )
+            store(("user", user.pk), entry, started)
+
+        return (self.build_user(entry, field_names), token)
+
+    @staticmethod
+    def decode(key):
+        try:
+            return tokens.decode(key, tokens.ACCESS)
+        except tokens.InvalidToken as exc:
+            raise exceptions.AuthenticationFailed(str(exc))
+
+    def get_user_queryset(self, field_names):
+        return get_user_model()._default_manager.only(*field_names)
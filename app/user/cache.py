@@ -0,0 +1,55 @@
+"""
+Response cache for `GET /api/user/me/`
+
+Stores the rendered JSON bytes of each user's `/me` response in the
+`user_responses` cache (`settings.CACHES`), keyed by user id, together with
+the user `version` they were rendered from. A hit then costs the token check
+and one cache read.
+
+Entries are deleted by model signals (`user/signals.py`) whenever a user is
+saved or deleted through the ORM (serializer updates, admin edits) or
+updated by `UserManager.update_user`. An entry is also only served while its
+version equals the version of the authenticated user, so bytes rendered
+from a row that changed meanwhile are never returned for the new version.
+
+The default backend is `LocMemCache`, one cache per process: a change made
+through one worker invalidates only that worker's entry and the other
+workers notice on the user's next request, when token authentication
+reloads the user (and with it the version). Shared by all workers,
+memcached or redis is invalidated for every worker at once. A
+`FileBasedCache` directory (on tmpfs, `/dev/shm/user-responses`) is too,
+but culling lists and reads the whole directory on every set once it holds
+`MAX_ENTRIES` files, so it only suits a small `MAX_ENTRIES` (1000 by
+default).
+
+TODO - refer
+https://docs.djangoproject.com/en/4.2/topics/cache/#the-low-level-cache-api
+https://docs.djangoproject.com/en/4.2/topics/cache/#redis
+https://docs.djangoproject.com/en/4.2/topics/cache/#filesystem-caching
+"""
+
+from django.core.cache import caches
+
+CACHE_ALIAS = "user_responses"
+
+
+def me_key(user_id):
+    return f"user-me:{user_id}"
+
+
+def get_me_response(user):
+    """cached `/me` bytes of `user`, `None` on a miss or an outdated
+    entry"""
+
+    entry = caches[CACHE_ALIAS].get(me_key(user.pk))
+    if entry is None or entry[0] != user.version:
+        return None
+    return entry[1]
+
+
+def set_me_response(user, body):
+    caches[CACHE_ALIAS].set(me_key(user.pk), (user.version, body))
+
+
+def invalidate_me_response(user_id):
+    caches[CACHE_ALIAS].delete(me_key(user_id))
@@ -0,0 +1,48 @@
+"""
+Conditional requests for `/api/user/me/`
+
+The ETag of a user is its primary key and `version`, which every save
+bumps, so it changes exactly when the row does:
+
+- `If-None-Match` on GET: 304 when the client's copy is current, without
+  serializing anything
+- `If-Match` on PUT / PATCH: 412 when the client edited an outdated copy
+
+TODO - refer
+https://developer.mozilla.org/en-US/docs/Web/HTTP/Conditional_requests
+https://www.rfc-editor.org/rfc/rfc9110#name-conditional-requests
+"""
+
+from django.utils.http import parse_etags
+
+
+def user_etag(user):
+    return f'"{user.pk}-{user.version}"'
+
+
+def etag_matches(header, etag, weak=False):
+    """whether the `If-Match` / `If-None-Match` `header` matches `etag`;
+    `If-None-Match` uses the weak comparison"""
+
+    if header is None:
+        return False
+    etags = parse_etags(header)
+    if "*" in etags:
+        return True
+    if weak:
+        return etag in {tag.removeprefix("W/") for tag in etags}
+    return etag in etags
+
+
+def if_match_versions(header, user):
+    """versions of `user` listed by an `If-Match` header, `None` for `*`"""
+
+    etags = parse_etags(header)
+    if "*" in etags:
+        return None
+    prefix = f'"{user.pk}-'
+    return [
+        int(tag[len(prefix):-1])
+        for tag in etags
+        if tag.startswith(prefix) and tag[len(prefix):-1].isdigit()
+    ]
@@ -0,0 +1,109 @@
+"""
+Cheap "is this email taken" checks for signup forms
+
+`email_taken` answers from an in-memory Bloom filter of every user email
+(lower-cased), warmed from the table on first use and rebuilt every
+`EMAIL_FILTER["REFRESH_INTERVAL"]` seconds (in the background, see
+`core.bloom.RefreshingBloomFilter`):
+
+- not in the filter -> not taken, without a query
+- in the filter -> confirmed with one lookup on the `LOWER(email)` index,
+  so the answer is never a false "taken"
+
+Users created by this process are added to the filter as they are saved
+(`user/signals.py`); a user created by another process is only seen after
+the next rebuild. That is fine for a form hint: the signup itself is still
+guarded by the unique index.
+
+TODO - refer
+https://docs.djangoproject.com/en/4.1/ref/databases/#mysql-notes
+"""
+
+import os
+import threading
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from core import sharding
+from core.bloom import RefreshingBloomFilter
+
+
+def get_settings():
+    return getattr(settings, "EMAIL_FILTER", {})
+
+
+def normalize(email: str) -> str:
+    return email.strip().lower()
+
+
+def load_emails():
+    """every user email, lower-cased, read in primary key order one chunk
+    per query
+
+    Keyset pages rather than `.iterator()`: MySQL's client library buffers
+    a whole result set, so one query would hold every email in memory.
+    """
+
+    chunk_size = get_settings().get("CHUNK_SIZE", 10000)
+    for alias in sharding.user_databases():
+        users = get_user_model()._default_manager.db_manager(
+            alias
+        ).order_by("pk")
+        last_pk = None
+        while True:
+            batch = users if last_pk is None else users.filter(pk__gt=last_pk)
+            rows = list(batch.values_list("pk", "email")[:chunk_size])
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            for _, email in rows:
+                yield normalize(email)
+
+
+def count_emails():
+    """the number of user emails, to size the filter"""
+
+    return sum(
+        get_user_model()._default_manager.db_manager(alias).count()
+        for alias in sharding.user_databases()
+    )
+
+
+_filters = {}
+_filters_lock = threading.Lock()
+
+
+def get_email_filter() -> RefreshingBloomFilter:
+    """Return this process's email filter"""
+
+    pid = os.getpid()
+    email_filter = _filters.get(pid)
+    if email_filter is None:
+        with _filters_lock:
+            email_filter = _filters.get(pid)
+            if email_filter is None:
+                email_filter = RefreshingBloomFilter(
+                    load_emails,
+                    get_settings().get("REFRESH_INTERVAL", 300),
+                    count=count_emails,
+                )
+                # a forked child must not share the parent's lock
+                _filters.clear()
+                _filters[pid] = email_filter
+    return email_filter
+
+
+def email_taken(email: str) -> bool:
+    email = normalize(email)
+    if email not in get_email_filter():
+        return False
+    return get_user_model()._default_manager.db_manager(
+        sharding.shard_for(sharding.bucket_for_email(email))
+    ).filter(email__lower=email).exists()
+
+
+def add_email(email: str):
+    """make a new user's email visible to this process's filter"""
+
+    get_email_filter().add(normalize(email))
@@ -0,0 +1,44 @@
+"""
+Exception handling for the user API
+
+TODO - refer
+https://www.django-rest-framework.org/api-guide/exceptions/#custom-exception-handling
+"""
+
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.views import exception_handler as drf_exception_handler
+
+from core.hashing import HashingBusy
+
+
+class ServiceUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Service temporarily unavailable, try again later."
+    default_code = "service_unavailable"
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = "The resource was modified, fetch it again."
+    default_code = "precondition_failed"
+
+
+class WSGIOnly(APIException):
+    status_code = status.HTTP_501_NOT_IMPLEMENTED
+    default_detail = "Only served by WSGI workers (SERVER_MODE=wsgi)."
+    default_code = "wsgi_only"
+
+
+def exception_handler(exc, context):
+    """DRF's exception handler, plus HTTP 503 when the password hashing
+    queue is saturated"""
+
+    busy = isinstance(exc, HashingBusy)
+    if busy:
+        exc = ServiceUnavailable()
+
+    response = drf_exception_handler(exc, context)
+    if busy and response is not None:
+        response["Retry-After"] = "1"
+    return response
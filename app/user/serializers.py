@@ -1,37 +1,199 @@
+from operator import attrgetter
+
 from rest_framework import serializers
 from django.contrib.auth import get_user_model, authenticate
+from django.db import IntegrityError, router, transaction
+
+from core import sharding
+from core.instrumentation import TimedSerializerMixin, timed
+
+from . import tokens
+from .emails import add_email
+
+# same message as the `UniqueValidator` of the email field
+EMAIL_TAKEN = {"email": ["user with this email already exists."]}
+
 
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """Serializer for the user object
 
-class UserSerializer(serializers.ModelSerializer):
-    """Serializer for the user object"""
+    Email uniqueness is enforced by the unique index alone: a duplicate is
+    reported from the `IntegrityError` of the INSERT / UPDATE, with the
+    message `UniqueValidator` would give, instead of a SELECT beforehand
+    that costs a round trip and still races with concurrent signups.
+    """
 
     class Meta:
         model = get_user_model()
         fields = ["email", "password", "name"]
         extra_kwargs = {
             "password": {"write_only": True, "min_length": 5},
-            "email": {"min_length": 5},
+            "email": {"min_length": 5, "validators": []},
         }
 
     def create(self, validated_data):
         """Create and return a user with encrypted password"""
 
-        return get_user_model().objects.create_user(**validated_data)
+        user_model = get_user_model()
+        using = sharding.shard_for(
+            sharding.bucket_for_email(validated_data["email"])
+        ) or router.db_for_write(user_model)
+        try:
+            with transaction.atomic(using=using):
+                return user_model.objects.create_user(**validated_data)
+        except IntegrityError:
+            raise serializers.ValidationError(EMAIL_TAKEN)
 
     def update(self, instance, validated_data):
-        """Update and return user"""
+        """Update and return user
 
-        password = validated_data.pop("password", None)
-        user = super().update(instance, validated_data)
+        Only the columns whose value changes are written, in one UPDATE
+        (plus the `version` bump, see `User.save`); a new password is
+        hashed before it. Nothing is written when nothing changed.
+
+        `instance` may be a cached copy of the user (see
+        `user/authentication.py`), so the fields are first reloaded from
+        the primary: the diff is against the current row.
 
+        With sharded users, a new email of another bucket moves the user
+        to it (`sharding.relocate_user`): `instance` gets its new id and
+        shard, and the client a new token key.
+        """
+
+        using = router.db_for_write(type(instance), instance=instance)
+        password = validated_data.pop("password", None)
+        instance.refresh_from_db(
+            using=using, fields=[*validated_data, "version"]
+        )
+        changed = [
+            name for name, value in validated_data.items()
+            if getattr(instance, name) != value
+        ]
+        for name in changed:
+            setattr(instance, name, validated_data[name])
         if password:
-            user.set_password(password)
-            user.save()
+            instance.set_password(password)
+            changed.append("password")
+
+        if not changed:
+            return instance
+
+        try:
+            with transaction.atomic(using=using):
+                instance.save(update_fields=changed)
+                if "email" in changed:
+                    user_id = sharding.relocate_user(instance.pk, using)
+        except IntegrityError:
+            raise serializers.ValidationError(EMAIL_TAKEN)
+        if "email" in changed:
+            add_email(instance.email)
+        if "email" in changed and user_id != instance.pk:
+            instance.pk = user_id
+            instance._state.db = sharding.shard_for(
+                sharding.bucket_for_id(user_id)
+            )
+        return instance
+
+
+def _identity(instance):
+    return instance
+
+
+class CompiledReadSerializer:
+    """Read-only fast path producing the same output as `serializer_class`
+
+    A `ModelSerializer` builds its fields from the model on every instance
+    and walks them generically on every `.data`. This works out the
+    readable fields once, on first use, and then only reads attributes;
+    string and boolean values, which need no conversion, skip
+    `to_representation`.
+    """
+
+    PASSTHROUGH_FIELDS = (
+        serializers.CharField,
+        serializers.BooleanField,
+        serializers.IntegerField,
+    )
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self._plan = None
+
+    @property
+    def plan(self):
+        if self._plan is None:
+            plan = []
+            for name, field in self.serializer_class().fields.items():
+                if field.write_only:
+                    continue
+                convert = None
+                if not isinstance(field, self.PASSTHROUGH_FIELDS):
+                    convert = field.to_representation
+                if field.source == "*":
+                    get_attribute = _identity
+                else:
+                    get_attribute = attrgetter(field.source)
+                plan.append((name, get_attribute, convert))
+            self._plan = plan
+        return self._plan
+
+    def to_representation(self, instance):
+        with timed("serializer"):
+            data = {}
+            for name, get_attribute, convert in self.plan:
+                value = get_attribute(instance)
+                if value is not None and convert is not None:
+                    value = convert(value)
+                data[name] = value
+            return data
+
+
+user_read_serializer = CompiledReadSerializer(UserSerializer)
+
+
+class BulkUserSerializer(UserSerializer):
+    """Serializer for one row of a bulk user creation
+
+    Email uniqueness is checked with one query per batch by
+    `UserManager.bulk_create_users`.
+    """
+
+
+class ImportUserSerializer(BulkUserSerializer):
+    """Serializer for one row of `manage.py import_users`
+
+    The password may be left out: the user gets an unusable password.
+    """
+
+    class Meta(UserSerializer.Meta):
+        extra_kwargs = {
+            **UserSerializer.Meta.extra_kwargs,
+            "password": {"write_only": True, "min_length": 5,
+                         "required": False, "allow_blank": True,
+                         "allow_null": True},
+        }
+
 
-        return user
+class AsyncUserSerializer(BulkUserSerializer):
+    """Serializer for the native async user views
 
+    Validation must not touch the database from the event loop; like
+    `UserSerializer`, email uniqueness is left to the unique index (see
+    `user/async_views.py`).
+    """
 
-class AuthTokenSerializer(serializers.Serializer):
+
+class UserSearchSerializer(TimedSerializerMixin,
+                           serializers.ModelSerializer):
+    """Read-only serializer for user search results"""
+
+    class Meta:
+        model = get_user_model()
+        fields = ["id", "email", "name", "is_active", "is_staff"]
+        read_only_fields = fields
+
+
+class AuthTokenSerializer(TimedSerializerMixin, serializers.Serializer):
     """Serializer for user auth token"""
 
     email = serializers.EmailField()
@@ -41,9 +203,6 @@ class AuthTokenSerializer(serializers.Serializer):
         """validate and authenticate the user"""
 
         email = data.get("email")
-        if email.isupper():
-            raise serializers.ValidationError("Email is not as per standards")
-
         password = data.get("password")
 
         # this is just to validate given email and password combination
@@ -58,3 +217,29 @@ class AuthTokenSerializer(serializers.Serializer):
 
         data["user"] = user
         return data
+
+
+class AsyncAuthTokenSerializer(AuthTokenSerializer):
+    """Field validation for the async token view, which authenticates with
+    the async ORM itself instead of the synchronous `authenticate`"""
+
+    def validate(self, data):
+        return data
+
+
+class RefreshTokenSerializer(serializers.Serializer):
+    """Serializer for a signed refresh token (`user/tokens.py`)"""
+
+    refresh = serializers.CharField()
+
+    def validate_refresh(self, value):
+        try:
+            return tokens.decode(value, tokens.REFRESH)
+        except tokens.InvalidToken as exc:
+            raise serializers.ValidationError(str(exc))
+
+
+class EmailCheckSerializer(serializers.Serializer):
+    """Serializer for the `email-taken` query"""
+
+    email = serializers.EmailField()
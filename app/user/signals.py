@@ -0,0 +1,49 @@
+"""
+Model signal handlers for the user API
+
+Keep the token caches of `user.authentication` consistent with writes
+made through the ORM (in every process, see its docstring), drop cached
+`/me` responses (`user/cache.py`) and add new emails to the email filter
+(`user/emails.py`).
+"""
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from core.signals import user_updated
+
+from .authentication import invalidate_user
+from .cache import invalidate_me_response
+from .emails import add_email
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def drop_cached_user_on_save(sender, instance, created, **kwargs):
+    """a saved (or deactivated) user must be re-read on the next request"""
+
+    if created:
+        add_email(instance.email)
+    else:
+        invalidate_user(instance.pk)
+        invalidate_me_response(instance.pk)
+
+
+@receiver(user_updated, sender=settings.AUTH_USER_MODEL)
+def drop_cached_user_on_update(sender, pk, **kwargs):
+    invalidate_user(pk)
+    invalidate_me_response(pk)
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def drop_cached_user_on_delete(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+    invalidate_me_response(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def drop_cached_token_on_delete(sender, instance, **kwargs):
+    """a logout must be seen by every process"""
+
+    invalidate_user(instance.user_id)
@@ -0,0 +1,185 @@
+"""
+Tests the native async user API views (`USER_API_ASYNC`)
+"""
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+
+from user import emails
+from user.authentication import token_cache
+
+
+@override_settings(ROOT_URLCONF="user.async_urls")
+class AsyncUserApiTests(TestCase):
+    """Test the async create, token and me endpoints"""
+
+    def setUp(self) -> None:
+        token_cache.clear()
+
+    async def test_create_user_success(self):
+        """Test creating a user hashes the password"""
+
+        payload = {
+            "email": "test@EXAMPLE.com",
+            "password": "password@321",
+            "name": "Test Name"
+        }
+        res = await self.async_client.post(
+            reverse("create"), payload, content_type="application/json"
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.json(), {"email": "test@example.com",
+                                      "name": "Test Name"})
+        user = await get_user_model().objects.aget(email="test@example.com")
+        self.assertTrue(user.password.startswith("pbkdf2_sha256$"))
+
+    async def test_create_user_short_password(self):
+        """Test serializer validation errors are returned as 400"""
+
+        payload = {"email": "test@example.com", "password": "pw"}
+        res = await self.async_client.post(
+            reverse("create"), payload, content_type="application/json"
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("password", res.json())
+
+    async def test_create_token_for_user(self):
+        """Test a token is returned for valid credentials only"""
+
+        await get_user_model().objects.acreate_user(
+            email="test@example.com", password="password@321"
+        )
+        url = reverse("token")
+
+        res = await self.async_client.post(
+            url, {"email": "test@example.com", "password": "password@321"},
+            content_type="application/json",
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(await Token.objects.filter(
+            key=res.json()["token"]).aexists())
+
+        res = await self.async_client.post(
+            url, {"email": "test@example.com", "password": "badpass"},
+            content_type="application/json",
+        )
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNotIn("token", res.json())
+
+        res = await self.async_client.post(
+            url, {"email": "TEST@example.com", "password": "password@321"},
+            content_type="application/json",
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    async def test_retrieve_user_unauthorized(self):
+        """Test authentication is required for `me`"""
+
+        res = await self.async_client.get(reverse("me"))
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_retrieve_and_update_profile(self):
+        """Test GET and PATCH for the authenticated user"""
+
+        user = await get_user_model().objects.acreate_user(
+            email="test@example.com", password="password@321", name="Test"
+        )
+        token = await Token.objects.acreate(user=user)
+        # AsyncClient takes raw header names in Django 4.1
+        auth = {"AUTHORIZATION": f"Token {token.key}"}
+
+        res = await self.async_client.get(reverse("me"), **auth)
+        self.assertEqual(res.json(), {"email": "test@example.com",
+                                      "name": "Test"})
+
+        res = await self.async_client.patch(
+            reverse("me"), {"name": "updated", "password": "newpass@321"},
+            content_type="application/json", **auth,
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json()["name"], "updated")
+
+        user = await get_user_model().objects.aget(pk=user.pk)
+        self.assertEqual(user.name, "updated")
+        self.assertTrue(user.check_password("newpass@321"))
+
+        res = await self.async_client.get(reverse("me"), **auth)
+        self.assertEqual(res.json()["name"], "updated")
+
+    async def test_changed_email_added_to_filter(self):
+        """Test an email changed through `/me` is seen by the email filter
+        before a rebuild"""
+
+        user = await get_user_model().objects.acreate_user(
+            email="test@example.com", password="password@321", name="Test"
+        )
+        token = await Token.objects.acreate(user=user)
+        emails._filters.clear()
+        await sync_to_async(emails.get_email_filter().refresh)()
+
+        res = await self.async_client.patch(
+            reverse("me"), {"email": "moved@example.com"},
+            content_type="application/json",
+            AUTHORIZATION=f"Token {token.key}",
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(
+            emails.get_email_filter().might_contain("moved@example.com")
+        )
+
+    async def test_update_diffs_against_current_row(self):
+        """Test a PATCH back to the cached value is written when the row
+        changed behind the cache"""
+
+        user = await get_user_model().objects.acreate_user(
+            email="test@example.com", password="password@321", name="Test"
+        )
+        token = await Token.objects.acreate(user=user)
+        auth = {"AUTHORIZATION": f"Token {token.key}"}
+        await self.async_client.get(reverse("me"), **auth)
+        # bypasses `User.save`, the cached user keeps "Test"
+        await get_user_model().objects.filter(pk=user.pk).aupdate(name="new")
+
+        res = await self.async_client.patch(
+            reverse("me"), {"name": "Test"},
+            content_type="application/json", **auth,
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        user = await get_user_model().objects.aget(pk=user.pk)
+        self.assertEqual(user.name, "Test")
+
+    async def test_conditional_update_without_changes(self):
+        """Test an `If-Match` PATCH changing nothing writes nothing and is
+        checked against the current version"""
+
+        user = await get_user_model().objects.acreate_user(
+            email="test@example.com", password="password@321", name="Test"
+        )
+        token = await Token.objects.acreate(user=user)
+        auth = {"AUTHORIZATION": f"Token {token.key}"}
+        etag = (await self.async_client.get(reverse("me"), **auth))["ETag"]
+
+        res = await self.async_client.patch(
+            reverse("me"), {"name": "Test"}, content_type="application/json",
+            IF_MATCH=etag, **auth,
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res["ETag"], etag)
+        changed = await get_user_model().objects.aget(pk=user.pk)
+        self.assertEqual(changed.version, user.version)
+
+        await get_user_model().objects.aupdate_user(user.pk, name="new")
+        res = await self.async_client.patch(
+            reverse("me"), {"name": "new"}, content_type="application/json",
+            IF_MATCH=etag, **auth,
+        )
+        self.assertEqual(res.status_code, status.HTTP_412_PRECONDITION_FAILED)
@@ -0,0 +1,167 @@
+"""
+Tests for the cached token authentication used by `/api/user/me/`
+"""
+
+import time
+
+from django.core.cache import caches
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.lru import LRUCache
+from user.authentication import CACHE_ALIAS, changed_key, token_cache
+
+
+ME_URL = reverse("me")
+
+
+class LRUCacheTests(TestCase):
+    """Tests for the in-process LRU cache"""
+
+    def test_evicts_least_recently_used(self):
+        """Test the oldest untouched entry is evicted when full"""
+
+        cache = LRUCache(max_size=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_expired_entry_is_missing(self):
+        """Test entries are not returned after their TTL"""
+
+        cache = LRUCache(max_size=2, ttl=-1)
+        cache.set("a", 1)
+
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+    def test_delete_tag(self):
+        """Test all entries sharing a tag are dropped together"""
+
+        cache = LRUCache(max_size=10, ttl=60)
+        cache.set("a", 1, tag="user-1")
+        cache.set("b", 2, tag="user-1")
+        cache.set("c", 3, tag="user-2")
+        cache.delete_tag("user-1")
+
+        self.assertIsNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Tests authenticating `/api/user/me/` with a cached token"""
+
+    def setUp(self) -> None:
+        token_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email="test@example.com",
+            password="password@321",
+            name="Test name"
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def test_repeated_requests_skip_token_lookup(self):
+        """Test only the first request queries the database"""
+
+        with self.assertNumQueries(1):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.data, {"name": "Test name",
+                                    "email": "test@example.com"})
+
+    def test_user_save_invalidates_cache(self):
+        """Test saving the user makes the next request reload it"""
+
+        self.client.get(ME_URL)
+        self.user.name = "renamed"
+        self.user.save()
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.data["name"], "renamed")
+
+    def test_deactivated_user_rejected(self):
+        """Test a cached user is rejected once deactivated"""
+
+        self.client.get(ME_URL)
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_token_rejected(self):
+        """Test a cached token is rejected once deleted"""
+
+        self.client.get(ME_URL)
+        self.token.delete()
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_update_through_cached_user(self):
+        """Test PATCH works on the partially loaded cached user"""
+
+        self.client.get(ME_URL)
+        payload = {"name": "new", "password": "newpass1"}
+        res = self.client.patch(ME_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.name, "new")
+        self.assertTrue(self.user.check_password("newpass1"))
+
+    def test_update_diffs_against_current_row(self):
+        """Test a PATCH back to the cached value is written when the row
+        changed behind the cache"""
+
+        self.client.get(ME_URL)
+        # bypasses `User.save`, the cached user keeps "Test name"
+        get_user_model().objects.filter(pk=self.user.pk).update(name="new")
+        res = self.client.patch(ME_URL, {"name": "Test name"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.name, "Test name")
+
+    def test_change_in_other_process_seen(self):
+        """Test a cached user is reloaded once another process recorded a
+        change of it"""
+
+        self.client.get(ME_URL)
+        # another worker deactivated the user: only the shared cache and
+        # the row changed
+        get_user_model().objects.filter(pk=self.user.pk).update(
+            is_active=False
+        )
+        caches[CACHE_ALIAS].set(changed_key(self.user.pk), time.time(), None)
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_miss_racing_a_change_not_cached(self):
+        """Test a row read before the user's last change is served but not
+        cached"""
+
+        caches[CACHE_ALIAS].set(
+            changed_key(self.user.pk), time.time() + 60, None
+        )
+        self.addCleanup(caches[CACHE_ALIAS].delete, changed_key(self.user.pk))
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsNone(token_cache.get(self.token.key))
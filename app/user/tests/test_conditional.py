@@ -0,0 +1,141 @@
+"""
+Tests for ETag / conditional requests on `/api/user/me/`
+"""
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from user.authentication import token_cache
+
+ME_URL = reverse("me")
+
+
+class UserVersionTests(TestCase):
+    """Test `User.version`"""
+
+    def test_version_bumped_on_every_save(self):
+        """Test full and partial saves and `update_user` bump the version"""
+
+        user = get_user_model().objects.create_user(
+            email="user@example.com", password="password@321"
+        )
+        self.assertEqual(user.version, 1)
+
+        user.name = "Name"
+        user.save()
+        self.assertEqual(user.version, 2)
+        user.save(update_fields=["name"])
+        self.assertEqual(user.version, 3)
+
+        version = get_user_model().objects.update_user(user.pk, name="New")
+        self.assertEqual(version, 4)
+        user.refresh_from_db()
+        self.assertEqual(user.version, 4)
+
+    def test_update_user_expected_versions(self):
+        """Test `update_user` skips rows at another version"""
+
+        user = get_user_model().objects.create_user(
+            email="user@example.com", password="password@321"
+        )
+        manager = get_user_model().objects
+
+        self.assertIsNone(manager.update_user(user.pk, [7], name="x"))
+        self.assertEqual(manager.update_user(user.pk, [1], name="x"), 2)
+
+
+class ConditionalMeTests(TestCase):
+    """Test ETag, If-None-Match and If-Match on `/me/`"""
+
+    def setUp(self) -> None:
+        token_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="password@321", name="User"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_not_modified(self):
+        """Test a current If-None-Match gets an empty 304"""
+
+        etag = self.client.get(ME_URL)["ETag"]
+        res = self.client.get(ME_URL, HTTP_IF_NONE_MATCH=f"W/{etag}")
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res.content, b"")
+        self.assertEqual(res["ETag"], etag)
+
+    def test_etag_changes_on_update(self):
+        """Test an update returns the new ETag, the old one no longer
+        matches"""
+
+        etag = self.client.get(ME_URL)["ETag"]
+        res = self.client.patch(ME_URL, {"name": "New"})
+        self.assertNotEqual(res["ETag"], etag)
+
+        res = self.client.get(ME_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["name"], "New")
+
+    @override_settings(USER_API_FAST_READ=False)
+    def test_not_modified_compatible_read(self):
+        """Test conditional GET with the serializer read path"""
+
+        etag = self.client.get(ME_URL)["ETag"]
+        res = self.client.get(ME_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_if_match(self):
+        """Test If-Match accepts the current version and refuses an old
+        one"""
+
+        etag = self.client.get(ME_URL)["ETag"]
+        res = self.client.patch(ME_URL, {"name": "First"},
+                                HTTP_IF_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        res = self.client.patch(ME_URL, {"name": "Second"},
+                                HTTP_IF_MATCH=etag)
+        self.assertEqual(res.status_code,
+                         status.HTTP_412_PRECONDITION_FAILED)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.name, "First")
+
+
+@override_settings(ROOT_URLCONF="user.async_urls")
+class AsyncConditionalMeTests(TestCase):
+    """Test conditional requests on the async `/me/` view"""
+
+    def setUp(self) -> None:
+        token_cache.clear()
+        user = get_user_model().objects.create_user(
+            email="user@example.com", password="password@321", name="User"
+        )
+        self.auth = f"Token {Token.objects.create(user=user).key}"
+
+    async def test_conditional_get_and_update(self):
+        """Test 304 for a current ETag and 412 for an outdated If-Match"""
+
+        client = self.async_client
+        url = reverse("me")
+        etag = (await client.get(url, AUTHORIZATION=self.auth))["ETag"]
+
+        res = await client.get(url, AUTHORIZATION=self.auth,
+                               IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        res = await client.patch(url, {"name": "New"},
+                                 content_type="application/json",
+                                 AUTHORIZATION=self.auth, IF_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res["ETag"], etag)
+
+        res = await client.patch(url, {"name": "Other"},
+                                 content_type="application/json",
+                                 AUTHORIZATION=self.auth, IF_MATCH=etag)
+        self.assertEqual(res.status_code,
+                         status.HTTP_412_PRECONDITION_FAILED)
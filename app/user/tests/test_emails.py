@@ -0,0 +1,92 @@
+"""
+Tests for the `email-taken` check and its email filter
+"""
+
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from rest_framework.throttling import AnonRateThrottle
+
+from user import emails
+
+EMAIL_TAKEN_URL = reverse("email-taken")
+
+
+class EmailTakenTests(TestCase):
+    """Tests for `/api/user/email-taken/`"""
+
+    def setUp(self) -> None:
+        emails._filters.clear()
+        # the throttle history
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email="taken@example.com", password="password@321"
+        )
+        self.client = APIClient()
+
+    def test_taken(self):
+        """Test an existing email is reported taken, ignoring case"""
+
+        res = self.client.get(EMAIL_TAKEN_URL, {"email": "Taken@Example.com"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.data["taken"])
+
+    def test_free_email_needs_no_query(self):
+        """Test a free email is answered from the warm filter alone"""
+
+        emails.get_email_filter().refresh()
+
+        with self.assertNumQueries(0):
+            res = self.client.get(EMAIL_TAKEN_URL,
+                                  {"email": "free@example.com"})
+        self.assertFalse(res.data["taken"])
+
+    def test_new_user_added_to_filter(self):
+        """Test a user created in this process is seen before a rebuild"""
+
+        emails.get_email_filter().refresh()
+        self.client.post(reverse("create"), {
+            "email": "new@example.com", "password": "password@321",
+            "name": "New",
+        })
+
+        self.assertTrue(emails.email_taken("new@example.com"))
+
+    def test_changed_email_added_to_filter(self):
+        """Test an email changed through `/me` is seen before a rebuild"""
+
+        emails.get_email_filter().refresh()
+        self.client.force_authenticate(user=self.user)
+        res = self.client.patch(reverse("me"), {"email": "moved@example.com"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(
+            emails.get_email_filter().might_contain("moved@example.com")
+        )
+
+    @patch.object(AnonRateThrottle, "THROTTLE_RATES", {"anon": "2/minute"})
+    def test_throttled(self):
+        """Test a client is throttled past the anonymous rate"""
+
+        for _ in range(2):
+            res = self.client.get(EMAIL_TAKEN_URL,
+                                  {"email": "free@example.com"})
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        res = self.client.get(EMAIL_TAKEN_URL, {"email": "free@example.com"})
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn("Retry-After", res)
+
+    def test_invalid_email(self):
+        """Test the email parameter is validated"""
+
+        res = self.client.get(EMAIL_TAKEN_URL, {"email": "nope"})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,50 @@
+"""
+Tests for the fast `/me` read path
+"""
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from user.serializers import (
+    CompiledReadSerializer,
+    UserSearchSerializer,
+    UserSerializer,
+    user_read_serializer,
+)
+
+ME_URL = reverse("me")
+
+
+class CompiledReadSerializerTests(TestCase):
+    """Test `CompiledReadSerializer` matches the serializer it replaces"""
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="password@321", name="User"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_same_output_as_serializer(self):
+        """Test the output equals `.data` of the serializer"""
+
+        self.assertEqual(user_read_serializer.to_representation(self.user),
+                         UserSerializer(self.user).data)
+        search = CompiledReadSerializer(UserSearchSerializer)
+        self.assertEqual(search.to_representation(self.user),
+                         UserSearchSerializer(self.user).data)
+
+    def test_me_fast_and_compatible_output(self):
+        """Test GET /me/ is identical with the fast path on and off"""
+
+        res = self.client.get(ME_URL)
+        with override_settings(USER_API_FAST_READ=False):
+            compatible = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.content, compatible.content)
+        self.assertEqual(res.json(), {"email": "user@example.com",
+                                      "name": "User"})
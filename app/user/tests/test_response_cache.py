@@ -0,0 +1,111 @@
+"""
+Tests for the `/me` response cache
+"""
+
+import tempfile
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from user.authentication import token_cache
+from user.cache import CACHE_ALIAS, get_me_response, me_key
+
+ME_URL = reverse("me")
+
+
+class MeResponseCacheTests(TestCase):
+    """Test caching and invalidation of rendered `/me` responses"""
+
+    def setUp(self) -> None:
+        token_cache.clear()
+        caches[CACHE_ALIAS].clear()
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="password@321", name="User"
+        )
+        self.client = APIClient()
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+    def cached(self):
+        self.user.refresh_from_db()
+        return get_me_response(self.user)
+
+    def test_hit_skips_serialization(self):
+        """Test the second GET returns the cached bytes"""
+
+        first = self.client.get(ME_URL)
+        self.assertEqual(self.cached(), first.content)
+
+        with patch("user.views.user_read_serializer") as serializer:
+            second = self.client.get(ME_URL)
+        serializer.to_representation.assert_not_called()
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second["Content-Type"], "application/json")
+        self.assertEqual(second.data["name"], "User")
+
+    def test_update_invalidates(self):
+        """Test a PATCH drops the entry and the next GET is fresh"""
+
+        self.client.get(ME_URL)
+        self.client.patch(ME_URL, {"name": "New"})
+
+        self.assertIsNone(self.cached())
+        self.assertEqual(self.client.get(ME_URL).data["name"], "New")
+
+    def test_admin_edit_invalidates(self):
+        """Test saving the user through the admin drops the entry"""
+
+        self.client.get(ME_URL)
+        admin = get_user_model().objects.create_superuser(
+            email="admin@example.com", password="adminpass@123"
+        )
+        client = Client()
+        client.force_login(admin)
+        url = reverse("admin:core_user_change", args=[self.user.pk])
+        client.post(url, {"email": self.user.email, "name": "Admin",
+                          "is_active": "on"})
+
+        self.assertIsNone(caches[CACHE_ALIAS].get(me_key(self.user.pk)))
+        self.assertEqual(self.client.get(ME_URL).data["name"], "Admin")
+
+    def test_manager_update_invalidates(self):
+        """Test `UserManager.update_user` drops the entry"""
+
+        self.client.get(ME_URL)
+        get_user_model().objects.update_user(self.user.pk, name="Manager")
+
+        self.assertIsNone(caches[CACHE_ALIAS].get(me_key(self.user.pk)))
+
+    def test_outdated_entry_not_served(self):
+        """Test an entry rendered for another version is a miss"""
+
+        self.client.get(ME_URL)
+        caches[CACHE_ALIAS].set(me_key(self.user.pk), (0, b'{"x":1}'))
+
+        self.assertIsNone(self.cached())
+        self.assertEqual(self.client.get(ME_URL).data["name"], "User")
+
+
+class FileBasedMeResponseCacheTests(MeResponseCacheTests):
+    """Test the same with a file based cache shared by workers"""
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        cache_settings = override_settings(CACHES={
+            **settings.CACHES,
+            CACHE_ALIAS: {
+                "BACKEND": "django.core.cache.backends.filebased."
+                           "FileBasedCache",
+                "LOCATION": directory.name,
+            },
+        })
+        cache_settings.enable()
+        self.addCleanup(cache_settings.disable)
+        super().setUp()
@@ -0,0 +1,280 @@
+"""
+Tests for the signed access / refresh tokens
+"""
+
+import io
+import threading
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.bloom import BloomFilter, RefreshingBloomFilter
+from core.models import RevokedToken
+from user import tokens
+from user.authentication import token_cache
+
+SIGNED_TOKENS = {
+    "ENABLED": True,
+    "ACCESS_TTL": 60,
+    "REFRESH_TTL": 3600,
+    "REVOCATION_REFRESH_INTERVAL": 30,
+}
+
+
+class BloomFilterTests(SimpleTestCase):
+    """Tests for the Bloom filter"""
+
+    def test_no_false_negatives(self):
+        """Test every added item is reported as present"""
+
+        bloom = BloomFilter.from_items(f"item-{i}" for i in range(5000))
+
+        self.assertEqual(len(bloom), 5000)
+        self.assertTrue(all(f"item-{i}" in bloom for i in range(5000)))
+
+    def test_false_positive_rate(self):
+        """Test items never added are rarely reported as present"""
+
+        bloom = BloomFilter(capacity=5000, error_rate=0.01)
+        for i in range(5000):
+            bloom.add(f"item-{i}")
+
+        false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_sized_from_count(self):
+        """Test a filter with a known count is sized from it"""
+
+        bloom = BloomFilter.from_items(
+            (f"item-{i}" for i in range(3000)), count=3000
+        )
+
+        self.assertEqual(bloom.capacity, 6000)
+        self.assertEqual(len(bloom), 3000)
+
+    def test_stale_filter_rebuilt_in_background(self):
+        """Test a stale filter keeps answering while its rebuild runs, and
+        keeps the items added meanwhile"""
+
+        release = threading.Event()
+        loads = [["a"], ["a", "b"]]
+
+        def load():
+            if len(loads) == 1:
+                release.wait(5)
+            yield from loads.pop(0)
+
+        bloom = RefreshingBloomFilter(load, refresh_interval=0)
+        bloom.refresh()
+
+        self.assertFalse("b" in bloom)
+        bloom.add("c")
+        release.set()
+        bloom._rebuild.join(5)
+
+        self.assertTrue(bloom.might_contain("b"))
+        self.assertTrue(bloom.might_contain("c"))
+
+
+@override_settings(SIGNED_TOKENS=SIGNED_TOKENS)
+class SignedTokenTests(SimpleTestCase):
+    """Tests for encoding and verifying signed tokens"""
+
+    def test_round_trip(self):
+        """Test a token decodes to its user and kind"""
+
+        token = tokens.decode(tokens.encode(tokens.ACCESS, 42, 60),
+                              tokens.ACCESS)
+
+        self.assertEqual(token.user_id, 42)
+        self.assertEqual(token.kind, tokens.ACCESS)
+
+    def test_tampered_token_rejected(self):
+        """Test changing the user id invalidates the signature"""
+
+        key = tokens.encode(tokens.ACCESS, 42, 60)
+
+        with self.assertRaises(tokens.InvalidToken):
+            tokens.decode(key.replace(".42.", ".43.", 1), tokens.ACCESS)
+
+    def test_wrong_kind_rejected(self):
+        """Test a refresh token is not accepted as an access token"""
+
+        key = tokens.encode(tokens.REFRESH, 42, 60)
+
+        with self.assertRaises(tokens.InvalidToken):
+            tokens.decode(key, tokens.ACCESS)
+
+    def test_malformed_token_rejected(self):
+        """Test non-ASCII and oddly shaped keys are invalid, not errors"""
+
+        for key in ["x.\u00e9", "\u00e9", "\ud800.x", "", "a.b.c"]:
+            with self.assertRaises(tokens.InvalidToken):
+                tokens.decode(key, tokens.ACCESS)
+
+    def test_expired_token_rejected(self):
+        """Test a token past its expiry is rejected"""
+
+        key = tokens.encode(tokens.ACCESS, 42, 60)
+
+        with mock.patch("time.time", return_value=time.time() + 61):
+            with self.assertRaisesMessage(tokens.InvalidToken, "expired"):
+                tokens.decode(key, tokens.ACCESS)
+
+
+@override_settings(SIGNED_TOKENS=SIGNED_TOKENS)
+class SignedTokenApiTests(TestCase):
+    """Tests for the signed token endpoints and authentication"""
+
+    def setUp(self) -> None:
+        token_cache.clear()
+        tokens._revocations.clear()
+        self.user = get_user_model().objects.create_user(
+            email="test@example.com", password="password@321", name="Test"
+        )
+        self.client = APIClient()
+
+    def obtain(self):
+        res = self.client.post(reverse("token-signed"), {
+            "email": "test@example.com", "password": "password@321"
+        })
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def test_obtain_writes_nothing(self):
+        """Test login returns a token pair without a token row"""
+
+        pair = self.obtain()
+
+        self.assertEqual(set(pair), {"access", "refresh", "expires_in"})
+        self.assertFalse(Token.objects.exists())
+
+    def test_me_without_auth_queries(self):
+        """Test a warm process authenticates with zero queries"""
+
+        access = self.obtain()["access"]
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+
+        # revocation set build + user load
+        with self.assertNumQueries(2):
+            res = self.client.get(reverse("me"))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["email"], "test@example.com")
+
+        with self.assertNumQueries(0):
+            res = self.client.get(reverse("me"))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_invalid_bearer_rejected(self):
+        """Test a forged access token is rejected"""
+
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer a.1.9999999999.x.y")
+        res = self.client.get(reverse("me"))
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_non_ascii_refresh_rejected(self):
+        """Test a refresh token with non-ASCII characters is invalid"""
+
+        res = self.client.post(reverse("token-refresh"),
+                               {"refresh": "x.\u00e9"}, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("refresh", res.data)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer x.\u00e9")
+        res = self.client.get(reverse("me"))
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh_rotates(self):
+        """Test a refresh token can be exchanged exactly once"""
+
+        refresh = self.obtain()["refresh"]
+
+        res = self.client.post(reverse("token-refresh"), {"refresh": refresh})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res.data["refresh"], refresh)
+
+        res = self.client.post(reverse("token-refresh"), {"refresh": refresh})
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revoke_rejects_access_token(self):
+        """Test a revoked access token and its refresh token stop working"""
+
+        pair = self.obtain()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {pair['access']}")
+        self.client.get(reverse("me"))
+
+        res = self.client.post(reverse("token-revoke"),
+                               {"refresh": pair["refresh"]})
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+
+        res = self.client.get(reverse("me"))
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        res = self.client.post(reverse("token-refresh"),
+                               {"refresh": pair["refresh"]})
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revocation_from_table_after_rebuild(self):
+        """Test a revocation written by another process is picked up when
+        the filter is rebuilt"""
+
+        access = self.obtain()["access"]
+        token = tokens.decode(access, tokens.ACCESS)
+        revocations = tokens.get_revocations()
+        revocations.refresh()
+        RevokedToken.objects.create(jti=token.jti,
+                                    expires_at="2999-01-01T00:00:00Z")
+
+        self.assertFalse(revocations.is_revoked(token))
+        revocations.refresh(force=True)
+        self.assertTrue(revocations.is_revoked(token))
+
+    def test_disabled(self):
+        """Test the endpoints and Bearer tokens are off unless enabled"""
+
+        access = self.obtain()["access"]
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+
+        with override_settings(SIGNED_TOKENS={"ENABLED": False}):
+            res = self.client.post(reverse("token-signed"), {
+                "email": "test@example.com", "password": "password@321"
+            })
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+            res = self.client.get(reverse("me"))
+            self.assertEqual(res.status_code,
+                             status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(ROOT_URLCONF="user.async_urls")
+    async def test_async_me_with_bearer(self):
+        """Test the async `/me` view accepts signed access tokens"""
+
+        user = await get_user_model().objects.aget(pk=self.user.pk)
+        access = tokens.encode(tokens.ACCESS, user.pk, 60)
+        res = await self.async_client.get(
+            reverse("me"), AUTHORIZATION=f"Bearer {access}"
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json()["email"], "test@example.com")
+
+    def test_prune_command(self):
+        """Test expired revocations are deleted"""
+
+        RevokedToken.objects.create(jti="old",
+                                    expires_at="2000-01-01T00:00:00Z")
+        RevokedToken.objects.create(jti="new",
+                                    expires_at="2999-01-01T00:00:00Z")
+
+        call_command("prune_revoked_tokens", stdout=io.StringIO())
+
+        self.assertEqual(
+            list(RevokedToken.objects.values_list("jti", flat=True)),
+            ["new"],
+        )
@@ -6,6 +6,7 @@ Tests the user API
 - HTTP POST `/api/user/token/`
 
 - HTTP GET, PUT, PATCH   -  `/api/user/me`
+- HTTP POST `/api/user/bulk-create/` (staff)
 
 # Types of endpoint based on authorization
 - public
@@ -13,7 +14,11 @@ Tests the user API
 
 """
 
-from django.test import TestCase
+from django.db import connection
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.test import APIClient
 from django.contrib.auth import get_user_model
@@ -23,6 +28,7 @@ from rest_framework import status
 CREATE_USER_URL = reverse("create")
 TOKEN_URL = reverse("token")
 ME_URL = reverse("me")
+BULK_CREATE_URL = reverse("bulk-create")
 
 
 class PublicUserApiTests(TestCase):
@@ -81,6 +87,19 @@ class PublicUserApiTests(TestCase):
 
         res = self.client.post(CREATE_USER_URL, payload)
         self.assertEqual(res.status_code, 400)
+        self.assertEqual(res.data["email"],
+                         ["user with this email already exists."])
+
+    def test_create_user_no_uniqueness_select(self):
+        """Test email uniqueness is left to the INSERT (and its index)"""
+
+        payload = {"email": "test@example.com", "password": "password@321",
+                   "name": "Test Name"}
+
+        # savepoint, INSERT, release
+        with self.assertNumQueries(3):
+            res = self.client.post(CREATE_USER_URL, payload)
+        self.assertEqual(res.status_code, 201)
 
     def test_create_token_for_user(self):
         """Test generates a token for valid user credentials"""
@@ -96,6 +115,28 @@ class PublicUserApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertIn("token", res.data)
 
+    def test_create_token_email_any_case(self):
+        """Test login matches the email regardless of letter case"""
+
+        self.create_user(email="Test@example.com", password="password@321")
+        payload = {"email": "TEST@EXAMPLE.COM", "password": "password@321"}
+        res = self.client.post(TOKEN_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn("token", res.data)
+
+    def test_create_user_email_other_case_exists(self):
+        """Test an email differing only in letter case is taken"""
+
+        self.create_user(email="test@example.com", password="password@321")
+        payload = {"email": "TEST@example.com", "password": "password@321",
+                   "name": "Test Name"}
+        res = self.client.post(CREATE_USER_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data["email"],
+                         ["user with this email already exists."])
+
     def test_retrive_user_unauthorized(self):
         """Test authentication is required for the user"""
 
@@ -188,6 +229,52 @@ class PrivateUserApiTests(TestCase):
         self.assertEqual(self.user.name, payload.get("name"))
         self.assertEqual(self.user.email, payload.get("email"))
 
+    def update_statements(self, payload):
+        """PATCH `/me` and return the UPDATE statements it ran"""
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.patch(ME_URL, payload)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [query["sql"] for query in queries
+                if query["sql"].startswith("UPDATE")]
+
+    def test_update_only_changed_columns(self):
+        """Test a PATCH with a password is one UPDATE of the changed
+        columns"""
+
+        updates = self.update_statements(
+            {"name": "Test name", "email": "new@example.com",
+             "password": "newpass@321"}
+        )
+
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"email"', updates[0])
+        self.assertIn('"password"', updates[0])
+        self.assertNotIn('"name"', updates[0])
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password("newpass@321"))
+
+    def test_update_without_changes_skips_write(self):
+        """Test a PATCH that changes nothing runs no UPDATE"""
+
+        version = self.user.version
+        updates = self.update_statements({"name": "Test name"})
+
+        self.assertEqual(updates, [])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.version, version)
+
+    def test_update_email_taken(self):
+        """Test changing the email to a taken one is a validation error"""
+
+        self.create_user(email="other@example.com", password="password@321")
+        res = self.client.patch(ME_URL, {"email": "other@example.com"})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("email", res.data)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.email, "test@example.com")
+
     def test_post_me_not_allowed(self):
         """Test POST is not allowed for the me endpoint"""
 
@@ -195,4 +282,100 @@ class PrivateUserApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
 
 
+class BulkCreateUserApiTests(TestCase):
+    """Test the staff-only bulk user creation endpoint"""
+
+    def setUp(self) -> None:
+        self.admin = get_user_model().objects.create_superuser(
+            email="admin@example.com", password="adminpass@123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def test_bulk_create_requires_staff(self):
+        """Test non-staff users cannot bulk create"""
+
+        user = get_user_model().objects.create_user(
+            email="user@example.com", password="password@321"
+        )
+        self.client.force_authenticate(user=user)
+        res = self.client.post(BULK_CREATE_URL, [], format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_bulk_create_results_per_row(self):
+        """Test each row gets a created / exists / invalid result"""
+
+        payload = [
+            {"email": "one@example.com", "password": "password@1",
+             "name": "One"},
+            {"email": "admin@EXAMPLE.com", "password": "password@2",
+             "name": "Taken"},
+            {"email": "bad", "password": "x", "name": "Bad"},
+            {"email": "one@example.com", "password": "password@3",
+             "name": "Duplicate in request"},
+        ]
+        res = self.client.post(BULK_CREATE_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["created"], 1)
+        self.assertEqual(
+            [row["status"] for row in res.data["results"]],
+            ["created", "exists", "invalid", "exists"],
+        )
+        self.assertIn("email", res.data["results"][2]["errors"])
+
+        user = get_user_model().objects.get(email="one@example.com")
+        self.assertEqual(user.name, "One")
+        self.assertTrue(user.check_password("password@1"))
+
+    def test_bulk_create_queries_per_batch(self):
+        """Test uniqueness is checked with one query for the whole batch"""
+
+        payload = [
+            {"email": f"user{i}@example.com", "password": "password@321",
+             "name": f"User {i}"}
+            for i in range(20)
+        ]
+        # SELECT emails + savepoint + INSERT + release savepoint
+        with self.assertNumQueries(4):
+            res = self.client.post(BULK_CREATE_URL, payload, format="json")
+
+        self.assertEqual(res.data["created"], 20)
+
+    def test_bulk_create_rejects_non_list(self):
+        """Test the request body must be a list"""
+
+        res = self.client.post(BULK_CREATE_URL, {"email": "x"}, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    @override_settings(USER_BULK_CREATE={"MAX_ROWS": 2, "BATCH_SIZE": 1000})
+    def test_bulk_create_rejects_too_many_rows(self):
+        """Test a request over `MAX_ROWS` is refused before any work"""
+
+        payload = [
+            {"email": f"user{i}@example.com", "password": "password@321"}
+            for i in range(3)
+        ]
+        with self.assertNumQueries(0):
+            res = self.client.post(BULK_CREATE_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("import_users", res.data[0])
+
+    @override_settings(USER_BULK_CREATE={"MAX_ROWS": 0, "HASH_SECONDS": 1,
+                                         "BATCH_SIZE": 1000})
+    @patch("core.hashing.batch_capacity", return_value=2)
+    def test_bulk_create_rows_fit_hash_time(self, patched_capacity):
+        """Test by default the rows are capped to what the batch pool hashes
+        in `HASH_SECONDS`"""
+
+        payload = [
+            {"email": f"user{i}@example.com", "password": "password@321"}
+            for i in range(3)
+        ]
+        res = self.client.post(BULK_CREATE_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        patched_capacity.assert_called_once_with(1)
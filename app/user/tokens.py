@@ -0,0 +1,184 @@
+"""
+Signed access / refresh tokens
+
+An opt-in alternative (`SIGNED_TOKENS["ENABLED"]`) to DRF's database
+tokens. A token is
+
+    <kind>.<user id>.<expiry, unix time>.<jti>.<signature>
+
+where `kind` is `a` (access) or `r` (refresh), `jti` is a random token id
+and the signature is a base64url HMAC-SHA256 of everything before it. A
+token is verified with CPU only: signature, kind and expiry.
+
+Revocation (logout, a refresh token that was already used) is recorded in
+the `core.RevokedToken` table. Each process checks it through an in-memory
+Bloom filter rebuilt from the unexpired rows every
+`REVOCATION_REFRESH_INTERVAL` seconds, so:
+
+- a token that was never revoked (the common case) needs no query
+- a Bloom filter hit is confirmed with one indexed lookup
+- a revocation made by another process is seen within the interval;
+  revocations made by this process are seen immediately
+
+Access tokens are short lived because of that interval; refresh tokens are
+single use and rotated by `/api/user/token/refresh/`.
+
+TODO - refer
+https://datatracker.ietf.org/doc/html/rfc2104
+https://datatracker.ietf.org/doc/html/rfc6749#section-1.5
+"""
+
+import base64
+import datetime
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from core.bloom import RefreshingBloomFilter
+from core.models import RevokedToken
+
+ACCESS = "a"
+REFRESH = "r"
+
+SignedToken = namedtuple("SignedToken", "key kind user_id expires jti")
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def get_settings():
+    return getattr(settings, "SIGNED_TOKENS", {})
+
+
+def enabled():
+    return get_settings().get("ENABLED", False)
+
+
+def _signature(payload: str) -> str:
+    key = get_settings().get("SIGNING_KEY") or settings.SECRET_KEY
+    digest = hmac.new(key.encode(), payload.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+
+def encode(kind: str, user_id, ttl: int) -> str:
+    """a new signed token of `kind` for `user_id`, valid for `ttl`
+    seconds"""
+
+    expires = int(time.time()) + ttl
+    # token_urlsafe never contains the "." separator
+    payload = f"{kind}.{user_id}.{expires}.{secrets.token_urlsafe(12)}"
+    return f"{payload}.{_signature(payload)}"
+
+
+def decode(key: str, kind: str) -> SignedToken:
+    """verify a token of `kind`, raising `InvalidToken` when the signature
+    does not match or the token expired"""
+
+    payload, _, signature = key.rpartition(".")
+    try:
+        # bytes: `compare_digest` refuses str with non-ASCII characters
+        if not hmac.compare_digest(
+            signature.encode(), _signature(payload).encode()
+        ):
+            raise InvalidToken("Invalid token.")
+        token_kind, user_id, expires, jti = payload.split(".")
+        user_id, expires = int(user_id), int(expires)
+    except (TypeError, ValueError):
+        # not valid UTF-8, or not the shape `encode` makes
+        raise InvalidToken("Invalid token.")
+
+    if token_kind != kind:
+        raise InvalidToken("Invalid token.")
+    if expires <= time.time():
+        raise InvalidToken("Token expired.")
+    return SignedToken(key, token_kind, user_id, expires, jti)
+
+
+def issue_pair(user) -> dict:
+    """response body with a new access and refresh token for `user`"""
+
+    config = get_settings()
+    access_ttl = config.get("ACCESS_TTL", 900)
+    return {
+        "access": encode(ACCESS, user.pk, access_ttl),
+        "refresh": encode(REFRESH, user.pk, config.get("REFRESH_TTL", 86400)),
+        "expires_in": access_ttl,
+    }
+
+
+class RevocationSet(RefreshingBloomFilter):
+    """Revoked token ids of this process: a Bloom filter of the unexpired
+    `RevokedToken` rows, rebuilt every `refresh_interval` seconds"""
+
+    def __init__(self, refresh_interval: float):
+        super().__init__(self.load_revoked, refresh_interval)
+
+    @staticmethod
+    def load_revoked():
+        return RevokedToken.objects.filter(
+            expires_at__gt=timezone.now()
+        ).values_list("jti", flat=True)
+
+    def is_revoked(self, token: SignedToken):
+        if token.jti not in self:
+            return False
+        return RevokedToken.objects.filter(jti=token.jti).exists()
+
+
+_revocations = {}
+_revocations_lock = threading.Lock()
+
+
+def get_revocations() -> RevocationSet:
+    """Return this process's revocation set"""
+
+    pid = os.getpid()
+    revocations = _revocations.get(pid)
+    if revocations is None:
+        with _revocations_lock:
+            revocations = _revocations.get(pid)
+            if revocations is None:
+                revocations = RevocationSet(
+                    get_settings().get("REVOCATION_REFRESH_INTERVAL", 30)
+                )
+                # a forked child must not share the parent's lock
+                _revocations.clear()
+                _revocations[pid] = revocations
+    return revocations
+
+
+def revoke(token: SignedToken) -> bool:
+    """Revoke `token`; False when it was already revoked
+
+    The unique `jti` makes this safe to use as a compare-and-set: of two
+    concurrent refreshes with the same token only one gets True.
+    """
+
+    expires_at = datetime.datetime.fromtimestamp(
+        token.expires, tz=datetime.timezone.utc
+    )
+    try:
+        with transaction.atomic():
+            RevokedToken.objects.create(jti=token.jti, expires_at=expires_at)
+    except IntegrityError:
+        return False
+    get_revocations().add(token.jti)
+    return True
+
+
+def prune(now=None) -> int:
+    """delete revocations of tokens that have expired anyway"""
+
+    deleted, _ = RevokedToken.objects.filter(
+        expires_at__lte=now or timezone.now()
+    ).delete()
+    return deleted
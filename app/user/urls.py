@@ -2,7 +2,14 @@
 
 /api/user/
 /api/user/create
+/api/user/email-taken/
+/api/user/token/signed/
+/api/user/token/refresh/
+/api/user/token/revoke/
 /api/user/me/
+/api/user/bulk-create/
+/api/user/export/
+/api/user/search/
 """
 
 from django.urls import path
@@ -11,6 +18,33 @@ from . import views
 
 urlpatterns = [
     path("create/", views.CreateUserView.as_view(), name="create"),
+    path(
+        "email-taken/",
+        views.EmailTakenView.as_view(),
+        name="email-taken",
+    ),
     path("token/", views.CreateTokenView.as_view(), name="token"),
-    path("me/", views.ManageUserView.as_view(), name="me")
+    path(
+        "token/signed/",
+        views.CreateSignedTokenView.as_view(),
+        name="token-signed",
+    ),
+    path(
+        "token/refresh/",
+        views.RefreshSignedTokenView.as_view(),
+        name="token-refresh",
+    ),
+    path(
+        "token/revoke/",
+        views.RevokeSignedTokenView.as_view(),
+        name="token-revoke",
+    ),
+    path("me/", views.ManageUserView.as_view(), name="me"),
+    path(
+        "bulk-create/",
+        views.BulkCreateUserView.as_view(),
+        name="bulk-create",
+    ),
+    path("export/", views.ExportUsersView.as_view(), name="export"),
+    path("search/", views.SearchUserView.as_view(), name="search"),
 ]
@@ -1,19 +1,100 @@
+import json
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIRequest
+from django.db import router, transaction
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
 
-from .serializers import UserSerializer, AuthTokenSerializer
-from rest_framework.generics import CreateAPIView, RetrieveUpdateAPIView
+from .serializers import (
+    UserSerializer,
+    AuthTokenSerializer,
+    BulkUserSerializer,
+    UserSearchSerializer,
+    EmailCheckSerializer,
+    RefreshTokenSerializer,
+    user_read_serializer,
+)
+from rest_framework.generics import (
+    CreateAPIView,
+    ListAPIView,
+    RetrieveUpdateAPIView,
+)
 from rest_framework.authtoken.views import ObtainAuthToken
-from rest_framework import authentication, permissions
+from rest_framework import exceptions, permissions, serializers, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.throttling import AnonRateThrottle
+from rest_framework.views import APIView
+
+from core import hashing, routers, sharding
+from core.export import FORMATS, accepts_gzip, export_users
+from core.search import search_users
+
+from . import tokens
+from .authentication import (
+    CachedTokenAuthentication,
+    SignedTokenAuthentication,
+)
+from .cache import get_me_response, set_me_response
+from .emails import email_taken
+from .conditional import etag_matches, user_etag
+from .exceptions import PreconditionFailed, WSGIOnly
 
 # Create your views here.
 
 
+class RenderedResponse(Response):
+    """Response with an already rendered JSON body, e.g. from a cache;
+    `data` is only decoded from it when accessed"""
+
+    def __init__(self, rendered, **kwargs):
+        super().__init__(**kwargs)
+        self.rendered = rendered
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = json.loads(self.rendered)
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+
+    @property
+    def rendered_content(self):
+        self["Content-Type"] = self.accepted_renderer.media_type
+        return self.rendered
+
+
 class CreateUserView(CreateAPIView):
     """Create a new user in the system"""
 
     serializer_class = UserSerializer
 
 
+class EmailTakenView(APIView):
+    """
+    get - `?email=<email>` -> `{"email": ..., "taken": true|false}`
+
+    A hint for signup forms answered from an in-memory Bloom filter (see
+    `user/emails.py`); an email that is not taken usually costs no query.
+    Throttled per client IP, so it cannot be used to enumerate emails.
+    """
+
+    authentication_classes = []
+    permission_classes = []
+    throttle_classes = [AnonRateThrottle]
+
+    def get(self, request):
+        serializer = EmailCheckSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        email = serializer.validated_data["email"]
+        return Response({"email": email, "taken": email_taken(email)})
+
+
 class CreateTokenView(ObtainAuthToken):
     """
     TODO
@@ -24,6 +105,97 @@ class CreateTokenView(ObtainAuthToken):
 
     serializer_class = AuthTokenSerializer
 
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        # on the user's shard, when sharded
+        token, created = sharding.get_or_create_token(
+            serializer.validated_data["user"]
+        )
+        if created:
+            # the next requests read the new token from the primary
+            routers.stick_credentials(
+                f"{CachedTokenAuthentication.keyword} {token.key}"
+            )
+        return Response({"token": token.key})
+
+
+class SignedTokenMixin:
+    """the signed token endpoints only exist with
+    `SIGNED_TOKENS["ENABLED"]`"""
+
+    def initial(self, request, *args, **kwargs):
+        if not tokens.enabled():
+            raise exceptions.NotFound()
+        super().initial(request, *args, **kwargs)
+
+
+class CreateSignedTokenView(SignedTokenMixin, ObtainAuthToken):
+    """
+    post - signed access and refresh tokens (`user/tokens.py`) for valid
+    email / password credentials; nothing is written to the database
+    """
+
+    serializer_class = AuthTokenSerializer
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(tokens.issue_pair(serializer.validated_data["user"]))
+
+
+class RefreshSignedTokenView(SignedTokenMixin, APIView):
+    """
+    post - exchange a refresh token for a new access / refresh pair
+
+    A refresh token can be used once: it is revoked by the exchange.
+    """
+
+    authentication_classes = []
+    permission_classes = []
+
+    def get_authenticate_header(self, request):
+        # a refused refresh token is a 401, like a refused access token
+        return SignedTokenAuthentication.keyword
+
+    def post(self, request):
+        serializer = RefreshTokenSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        refresh = serializer.validated_data["refresh"]
+
+        user = get_user_model().objects.using(
+            sharding.shard_for(sharding.bucket_for_id(refresh.user_id))
+        ).filter(pk=refresh.user_id, is_active=True).first()
+        if user is None or not tokens.revoke(refresh):
+            raise exceptions.AuthenticationFailed("Token revoked.")
+        return Response(tokens.issue_pair(user))
+
+
+class RevokeSignedTokenView(SignedTokenMixin, APIView):
+    """
+    post - log out: revoke the access token of the request and, when given,
+    the `refresh` token of the same user
+    """
+
+    authentication_classes = [SignedTokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        refresh = None
+        if "refresh" in request.data:
+            serializer = RefreshTokenSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            refresh = serializer.validated_data["refresh"]
+            if refresh.user_id != request.user.pk:
+                raise serializers.ValidationError(
+                    {"refresh": ["Invalid token."]}
+                )
+
+        tokens.revoke(request.auth)
+        if refresh is not None:
+            tokens.revoke(refresh)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 
 class ManageUserView(RetrieveUpdateAPIView):
     """
@@ -39,7 +211,10 @@ class ManageUserView(RetrieveUpdateAPIView):
 
     serializer_class = UserSerializer
 
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [
+        CachedTokenAuthentication,
+        SignedTokenAuthentication,
+    ]
 
     # TODO - refer
     # https://www.django-rest-framework.org/api-guide/permissions/#setting-the-permission-policy
@@ -53,3 +228,215 @@ class ManageUserView(RetrieveUpdateAPIView):
         """
 
         return self.request.user
+
+    def retrieve(self, request, *args, **kwargs):
+        """GET with an `ETag`, 304 for a current `If-None-Match` (see
+        `user/conditional.py`)
+
+        The body is the output of `UserSerializer` without building it,
+        unless `USER_API_FAST_READ` is off. JSON bodies are served from the
+        per-user response cache when possible.
+        """
+
+        user = self.get_object()
+        etag = user_etag(user)
+        if etag_matches(request.headers.get("If-None-Match"), etag,
+                        weak=True):
+            return Response(status=status.HTTP_304_NOT_MODIFIED,
+                            headers={"ETag": etag})
+
+        # rendered JSON bytes are cached per user, see `user/cache.py`
+        cacheable = isinstance(request.accepted_renderer, JSONRenderer) and (
+            "indent" not in request.accepted_media_type
+        )
+        body = get_me_response(user) if cacheable else None
+        if body is not None:
+            response = RenderedResponse(body)
+        else:
+            response = Response(self.get_read_data(user))
+            if cacheable:
+                response.add_post_render_callback(
+                    lambda rendered: set_me_response(user, rendered.content)
+                )
+        response["ETag"] = etag
+        return response
+
+    def get_read_data(self, user):
+        if settings.USER_API_FAST_READ:
+            return user_read_serializer.to_representation(user)
+        return self.get_serializer(user).data
+
+    def update(self, request, *args, **kwargs):
+        """PUT / PATCH, refused with 412 when `If-Match` does not name the
+        current version"""
+
+        if_match = request.headers.get("If-Match")
+        if if_match is None:
+            response = super().update(request, *args, **kwargs)
+        else:
+            user = self.get_object()
+            # the user's shard when users are sharded
+            using = router.db_for_write(type(user), instance=user)
+            with transaction.atomic(using=using):
+                # the row stays locked until our save is committed
+                user.version = (
+                    get_user_model().objects.using(using).select_for_update()
+                    .values_list("version", flat=True).get(pk=user.pk)
+                )
+                if not etag_matches(if_match, user_etag(user)):
+                    raise PreconditionFailed()
+                response = super().update(request, *args, **kwargs)
+
+        response["ETag"] = user_etag(self.get_object())
+        return response
+
+
+class BulkCreateUserView(APIView):
+    """
+    post - create many users in one request (staff only)
+
+    Expects a JSON list of user objects (`email`, `password`, `name`) and
+    returns one result per row, in request order:
+
+        {"index": 0, "email": "...", "status": "created"}
+        {"index": 1, "email": "...", "status": "exists"}
+        {"index": 2, "email": "...", "status": "invalid", "errors": {...}}
+
+    At most `USER_BULK_CREATE["MAX_ROWS"]` rows per request, by default as
+    many as the batch hashing pool hashes in `HASH_SECONDS`; larger imports
+    go through `manage.py import_users`.
+    """
+
+    authentication_classes = [
+        CachedTokenAuthentication,
+        SignedTokenAuthentication,
+    ]
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        rows = request.data
+        max_rows = settings.USER_BULK_CREATE["MAX_ROWS"] or (
+            hashing.batch_capacity(settings.USER_BULK_CREATE["HASH_SECONDS"])
+        )
+        if not isinstance(rows, list):
+            raise serializers.ValidationError("Expected a list of users.")
+        if len(rows) > max_rows:
+            raise serializers.ValidationError(
+                f"At most {max_rows} users may be created per request, "
+                "use `manage.py import_users` for larger imports."
+            )
+
+        # fields are built once and reused for every row
+        serializer = BulkUserSerializer()
+        results = [None] * len(rows)
+        valid = []
+        for index, row in enumerate(rows):
+            try:
+                valid.append((index, serializer.run_validation(row)))
+            except serializers.ValidationError as exc:
+                email = row.get("email") if isinstance(row, dict) else None
+                results[index] = {
+                    "index": index,
+                    "email": email,
+                    "status": "invalid",
+                    "errors": exc.detail,
+                }
+
+        users = get_user_model().objects.bulk_create_users(
+            [data for _, data in valid],
+            batch_size=settings.USER_BULK_CREATE["BATCH_SIZE"],
+        )
+        for (index, data), user in zip(valid, users):
+            results[index] = {
+                "index": index,
+                "email": user.email if user else data["email"],
+                "status": "created" if user else "exists",
+            }
+
+        created = sum(1 for result in results if result["status"] == "created")
+        return Response(
+            {
+                "created": created,
+                "failed": len(results) - created,
+                "results": results,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class ExportUsersView(APIView):
+    """
+    get - stream every user as NDJSON (default) or CSV (staff only)
+
+    `?type=csv` selects CSV. The body is gzip-compressed on the fly when the
+    client accepts gzip (`Accept-Encoding`). WSGI only, 501 under ASGI (see
+    `core/export.py`); `manage.py export_users` works everywhere.
+    """
+
+    authentication_classes = [
+        CachedTokenAuthentication,
+        SignedTokenAuthentication,
+    ]
+    permission_classes = [permissions.IsAdminUser]
+
+    content_types = {
+        "ndjson": "application/x-ndjson",
+        "csv": "text/csv",
+    }
+
+    def get(self, request):
+        if isinstance(request._request, ASGIRequest):
+            raise WSGIOnly()
+        file_format = request.query_params.get("type", "ndjson")
+        if file_format not in FORMATS:
+            raise serializers.ValidationError(
+                {"type": f"Expected one of {', '.join(FORMATS)}."}
+            )
+
+        compress = accepts_gzip(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+
+        response = StreamingHttpResponse(
+            export_users(file_format=file_format, compress=compress),
+            content_type=self.content_types[file_format],
+        )
+        if compress:
+            response["Content-Encoding"] = "gzip"
+        response["Vary"] = "Accept-Encoding"
+        response["Content-Disposition"] = (
+            f'attachment; filename="users.{file_format}"'
+        )
+        return response
+
+
+class SearchUserView(ListAPIView):
+    """
+    get - search users by email or name (staff only)
+
+    `?q=<term>` - full or partial email, or words of the name
+    `?limit=<n>` - number of results, at most 100 (default 20)
+    """
+
+    serializer_class = UserSearchSerializer
+    authentication_classes = [
+        CachedTokenAuthentication,
+        SignedTokenAuthentication,
+    ]
+    permission_classes = [permissions.IsAdminUser]
+
+    default_limit = 20
+    max_limit = 100
+
+    def get_queryset(self):
+        term = self.request.query_params.get("q", "").strip()
+        if not term:
+            raise serializers.ValidationError({"q": "This field is required."})
+
+        try:
+            limit = int(self.request.query_params.get("limit",
+                                                      self.default_limit))
+        except ValueError:
+            limit = self.default_limit
+        limit = min(max(limit, 1), self.max_limit)
+
+        queryset = get_user_model().objects.order_by("id")
+        return search_users(queryset, term)[:limit]
@@ -3,5 +3,17 @@ export MYSQL_DATABASE=userdb
 export MYSQL_USER=root
 export MYSQL_PASSWORD=qwerty@123
 export MYSQL_HOST=db
+# wsgi / asgi: gunicorn workers (app/gunicorn.conf.py), dev: runserver
+export SERVER_MODE=${SERVER_MODE:-wsgi}
+# gunicorn runs with DEBUG off, which needs the served host names
+export DJANGO_ALLOWED_HOSTS=${DJANGO_ALLOWED_HOSTS:-localhost,127.0.0.1}
 source venv/bin/activate
-python app/manage.py runserver
+cd app
+python manage.py wait_for_db --warm-up
+python manage.py migrate
+if [ "$SERVER_MODE" = "dev" ]; then
+    exec python manage.py runserver
+fi
+# the admin's CSS / JS, served by the workers from STATIC_ROOT
+python manage.py collectstatic --noinput
+exec gunicorn -c gunicorn.conf.py